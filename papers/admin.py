@@ -1,17 +1,24 @@
 import os
-import zipfile
 from django import forms
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.utils.html import format_html
 from django.contrib import admin, messages
 from django.urls import path, reverse
 from django.shortcuts import render, redirect
 from django.utils.safestring import mark_safe
 from django.db import transaction
+from django.db.models import Count
 from django.template.response import TemplateResponse
 import logging
 
 from .models import PastPaper, PastPaperAttachment, Profile
+from .zipstream import stream_zip
+from .ingest import IngestItem, ingest_papers
+from .rollups import department_totals
+from .thumbnails import thumbnail_url
+from .chunked import ChunkError, request_files
+from .caching import cache_stats
+from .pagecache import page_cache_stats
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +62,8 @@ class BulkUploadForm(forms.Form):
 class PastPaperAttachmentInline(admin.TabularInline):
     model = PastPaperAttachment
     extra = 2  # Show 2 empty file upload fields
-    fields = ('file',)
+    fields = ('file', 'file_size', 'page_count')
+    readonly_fields = ('file_size', 'page_count')
     verbose_name = "Additional File"
     verbose_name_plural = "Additional Files (Upload multiple files here)"
 
@@ -68,14 +76,17 @@ class PastPaperAdmin(admin.ModelAdmin):
     # Keep all your existing configurations
     list_display = (
         'title', 'course_code', 'department', 'year', 'semester',
-        'uploaded_at', 'download_count', 'user', 'file_link', 'file_size', 'total_files'
+        'uploaded_at', 'download_count', 'user', 'file_link', 'file_size', 'page_count', 'total_files'
     )
-    list_filter = ('department', 'year', 'semester', 'uploaded_at')
+    list_filter = ('department', 'year', 'semester', 'uploaded_at', 'mime_type')
     search_fields = ('title', 'course_code', 'department', 'user__username')
     ordering = ('-uploaded_at',)
-    readonly_fields = ('download_count', 'uploaded_at', 'file_preview', 'file_size')
+    readonly_fields = (
+        'download_count', 'uploaded_at', 'file_preview', 'file_size', 'page_count', 'checksum', 'mime_type'
+    )
     actions = ['download_selected_as_zip', 'reset_download_count']
     list_per_page = 25
+    list_select_related = ('user',)
 
     fieldsets = (
         ('Paper Information', {
@@ -85,17 +96,23 @@ class PastPaperAdmin(admin.ModelAdmin):
             'fields': ('user',)
         }),
         ('Statistics', {
-            'fields': ('download_count', 'uploaded_at', 'file_size')
+            'fields': ('download_count', 'uploaded_at', 'file_size', 'page_count', 'checksum', 'mime_type')
         }),
     )
 
+    def get_queryset(self, request):
+        # Attachment counts for the whole page in the listing query
+        return super().get_queryset(request).annotate(attachment_count=Count('attachments'))
+
     # Keep all your existing methods and ADD this new one
     def total_files(self, obj):
         """Show total number of files (main + attachments)"""
         count = 1 if obj.file else 0
-        count += obj.attachments.count()
+        attachments = getattr(obj, 'attachment_count', None)
+        count += attachments if attachments is not None else obj.attachments.count()
         return f"{count} file{'s' if count != 1 else ''}"
     total_files.short_description = "Total Files"
+    total_files.admin_order_field = 'attachment_count'
 
     def get_urls(self):
         """Add bulk upload URL to admin"""
@@ -106,9 +123,12 @@ class PastPaperAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def changelist_view(self, request, extra_context=None):
-        """Add bulk upload button to changelist view"""
+        """Add bulk upload button, download and cache statistics to changelist view"""
         extra_context = extra_context or {}
         extra_context['bulk_upload_url'] = reverse('admin:papers_pastpaper_bulk_upload')
+        extra_context['department_downloads'] = department_totals()
+        stats = {**cache_stats(), **page_cache_stats()}
+        extra_context['cache_stats'] = [{'name': name, 'stale': None, **row} for name, row in stats.items()]
         return super().changelist_view(request, extra_context)
 
     def bulk_upload_view(self, request):
@@ -143,10 +163,14 @@ class PastPaperAdmin(admin.ModelAdmin):
         department = form.cleaned_data['department']
         year = int(form.cleaned_data['year'])
         semester = form.cleaned_data['semester']
-        files = request.FILES.getlist('files')
-        
         success_count = 0
         error_messages = []
+
+        try:
+            files = request_files(request, 'files')
+        except ChunkError as e:
+            error_messages.append(str(e))
+            return success_count, error_messages
         
         if not files:
             error_messages.append('No files were uploaded.')
@@ -159,45 +183,15 @@ class PastPaperAdmin(admin.ModelAdmin):
             error_messages.append('Mismatch between files and metadata.')
             return success_count, error_messages
 
-        try:
-            with transaction.atomic():
-                for i, file in enumerate(files):
-                    if not file.name.lower().endswith('.pdf'):
-                        error_messages.append(f'File "{file.name}" is not a PDF.')
-                        continue
-                    
-                    course_code = course_codes[i].strip() if i < len(course_codes) else ''
-                    title = titles[i].strip() if i < len(titles) else file.name.replace('.pdf', '')
-                    
-                    if not course_code:
-                        error_messages.append(f'Course code missing for file "{file.name}".')
-                        continue
-                    
-                    if PastPaper.objects.filter(
-                        title=title, 
-                        course_code=course_code, 
-                        year=year,
-                        semester=semester
-                    ).exists():
-                        error_messages.append(f'Duplicate paper: "{title}".')
-                        continue
-                    
-                    PastPaper.objects.create(
-                        title=title,
-                        course_code=course_code,
-                        department=department,
-                        year=year,
-                        semester=semester,
-                        file=file,
-                        user=request.user
-                    )
-                    
-                    success_count += 1
-                    logger.info(f"Bulk uploaded: {title} by {request.user.username}")
-        
-        except Exception as e:
-            error_messages.append(f'Error during upload: {str(e)}')
-            logger.error(f"Bulk upload error: {str(e)}")
+        # Fall back to the file name when no title was given
+        items = [
+            IngestItem(file, titles[i].strip() or os.path.splitext(file.name)[0], course_codes[i])
+            for i, file in enumerate(files)
+        ]
+        report = ingest_papers(items, department, year, semester, request.user)
+
+        success_count = len(report.created)
+        error_messages.extend(result.message for result in report.failed)
         
         return success_count, error_messages
 
@@ -213,28 +207,31 @@ class PastPaperAdmin(admin.ModelAdmin):
     def file_size(self, obj):
         """Display file size in human readable format"""
         if obj.file:
-            try:
-                size = obj.file.size
-                for unit in ['B', 'KB', 'MB', 'GB']:
-                    if size < 1024.0:
-                        return f"{size:.1f} {unit}"
-                    size /= 1024.0
-                return f"{size:.1f} TB"
-            except:
+            # Recorded at upload time; no stat() per row
+            size = obj.file_size
+            if size is None:
                 return "Unknown"
+            for unit in ['B', 'KB', 'MB', 'GB']:
+                if size < 1024.0:
+                    return f"{size:.1f} {unit}"
+                size /= 1024.0
+            return f"{size:.1f} TB"
         return "-"
     file_size.short_description = "File Size"
+    file_size.admin_order_field = 'file_size'
 
     def file_preview(self, obj):
-        if obj.file and obj.file.url.lower().endswith('.pdf'):
+        # A cached first-page thumbnail instead of embedding the whole PDF
+        thumbnail = thumbnail_url(obj) if obj.file and obj.file.url.lower().endswith('.pdf') else None
+        if thumbnail:
             return format_html(
                 '''
                 <div style="border: 1px solid #ddd; padding: 10px; margin: 10px 0;">
-                    <iframe src="{}" width="100%" height="400px" frameborder="0"></iframe>
+                    <a href="{}" target="_blank"><img src="{}" alt="First page" style="max-width: 180px;"></a>
                     <p><a href="{}" target="_blank" class="button">Open in New Tab</a></p>
                 </div>
                 ''',
-                obj.file.url, obj.file.url
+                obj.file.url, thumbnail, obj.file.url
             )
         elif obj.file:
             return format_html('<a href="{}" target="_blank" class="button">Open File</a>', obj.file.url)
@@ -242,32 +239,40 @@ class PastPaperAdmin(admin.ModelAdmin):
     file_preview.short_description = "Preview"
 
     def download_selected_as_zip(self, request, queryset):
-        """Bulk action to download selected files as ZIP - ENHANCED to include attachments"""
+        """Bulk action to download selected files as ZIP, streamed as it is built"""
         if not queryset.exists():
             self.message_user(request, "No files selected.", level=messages.ERROR)
             return
 
         zip_filename = "past_papers.zip"
-        response = HttpResponse(content_type="application/zip")
+        papers = queryset.prefetch_related('attachments')
+        response = StreamingHttpResponse(
+            stream_zip(self.zip_entries(papers)), content_type="application/zip"
+        )
         response['Content-Disposition'] = f'attachment; filename={zip_filename}'
 
-        with zipfile.ZipFile(response, 'w') as zip_file:
-            for paper in queryset:
-                # Add main file
-                if paper.file and os.path.exists(paper.file.path):
-                    filename = f"{paper.course_code}_{paper.year}_{paper.semester}_{paper.title}.pdf"
-                    filename = filename.replace('/', '_').replace('\\', '_')
-                    zip_file.write(paper.file.path, filename)
-                
-                # Add attachment files
-                for attachment in paper.attachments.all():
-                    if attachment.file and os.path.exists(attachment.file.path):
-                        filename = f"{paper.course_code}_{paper.year}_{paper.semester}_{paper.title}_attachment_{attachment.id}.pdf"
-                        filename = filename.replace('/', '_').replace('\\', '_')
-                        zip_file.write(attachment.file.path, filename)
-
         self.message_user(request, f"Downloaded files from {queryset.count()} papers as ZIP.")
         return response
+
+    def zip_entries(self, papers):
+        """Yield (archive name, path, size) for each paper file and its attachments.
+
+        Sizes come from the stored metadata, so nothing is stat()ed up
+        front; stream_zip skips files that turn out to be missing.
+        """
+        for paper in papers:
+            prefix = f"{paper.course_code}_{paper.year}_{paper.semester}_{paper.title}"
+            # Add main file
+            if paper.file:
+                filename = f"{prefix}.pdf".replace('/', '_').replace('\\', '_')
+                yield filename, paper.file.path, paper.file_size
+
+            # Add attachment files (prefetched in one query)
+            for attachment in paper.attachments.all():
+                if attachment.file:
+                    filename = f"{prefix}_attachment_{attachment.id}.pdf"
+                    filename = filename.replace('/', '_').replace('\\', '_')
+                    yield filename, attachment.file.path, attachment.file_size
     download_selected_as_zip.short_description = "Download selected files as ZIP"
 
     def reset_download_count(self, request, queryset):
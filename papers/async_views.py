@@ -0,0 +1,125 @@
+# async_views.py - Async versions of the busiest views for ASGI deployments
+#
+# Served in place of the sync views in views.py when PAPERS_ASYNC_VIEWS
+# is on (see urls.py). They share the sync views' logic and templates but
+# query through the async ORM and stream files from the event loop, so
+# under ASGI (uvicorn, daphne) a request doesn't hold a worker thread.
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import caching
+from . import thumbnails
+from .conditional import conditional_page
+from .delivery import serve_file, counts_as_download
+from .facets import afacet_counts
+from .models import PastPaper
+from .pagecache import cached_page
+from .pagination import apaginate
+from .perf import query_budget
+from .search import search_papers
+from .views import paper_listing, track_download, home_validator, view_papers_validator
+
+
+async def load_user(request):
+    """Resolve request.user without blocking the event loop.
+
+    Templates read `user` synchronously, and the lazy request.user would
+    then query from async code; the session is loaded along the way.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+# ==========================
+# 🏠 Home / Dashboard
+# ==========================
+@login_required
+@conditional_page(home_validator)
+@query_budget(8)
+async def home(request):
+    await load_user(request)
+    # Already fetched for the ETag unless conditional GETs are off
+    recent, popular = getattr(request, 'dashboard_lists', None) or (
+        await caching.recent_papers.aget(), await caching.popular_papers.aget(),
+    )
+    return render(request, 'home.html', {
+        'recent_papers': recent,
+        'popular_papers': popular,
+    })
+
+
+# ==========================
+# 📄 View Papers
+# ==========================
+@cached_page()
+@conditional_page(view_papers_validator)
+@query_budget(12)
+async def view_papers(request):
+    user = await load_user(request)
+    papers, ordering, context = paper_listing(request)
+    query = context['query']
+
+    if query:
+        counts = await afacet_counts(search_papers(PastPaper.objects.all(), query), search_key=query)
+    else:
+        counts = await afacet_counts()
+
+    page_obj = await apaginate(request, papers, 10, ordering)
+    if user.is_authenticated:
+        # May hash files without a recorded checksum; keep that off the loop
+        await sync_to_async(thumbnails.attach_urls, thread_sensitive=False)(page_obj)
+
+    context.update({
+        'papers': page_obj,
+        'departments': counts['department'],
+        'years': counts['year'],
+    })
+    return render(request, 'view.html', context)
+
+
+# ==========================
+# 📥 Download + Track
+# ==========================
+@login_required
+async def download_paper(request, paper_id):
+    user = await load_user(request)
+    try:
+        paper = await PastPaper.objects.aget(pk=paper_id)
+    except PastPaper.DoesNotExist:
+        raise Http404("No PastPaper matches the given query.")
+    response = serve_file(request, paper.file, filename=paper.get_filename(), asynchronous=True)
+
+    # Cache revalidations and resumed transfers aren't new downloads
+    if not counts_as_download(request, response):
+        return response
+
+    # Usually just buffered, but a due flush writes to the database
+    await sync_to_async(track_download)(user.id, paper.pk)
+    return response
+
+
+# ==========================
+# themes
+# ==========================
+@csrf_exempt
+@require_http_methods(["POST"])
+async def set_theme(request):
+    """Handle theme switching requests from frontend"""
+    try:
+        data = json.loads(request.body)
+        theme = data.get('theme')
+
+        if theme in ['light', 'dark']:
+            # Save theme in session
+            await request.session.aset('theme', theme)
+            return JsonResponse({'status': 'success', 'theme': theme})
+        else:
+            return JsonResponse({'status': 'error', 'message': 'Invalid theme'})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
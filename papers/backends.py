@@ -1,20 +1,93 @@
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from .caching import get_cache, KEY_PREFIX
 
 UserModel = get_user_model()
 
+
+def _miss_key(identifier):
+    digest = hashlib.sha256(identifier.lower().encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:login-miss:{digest}'
+
+
+def forget_misses(*identifiers):
+    """Drop cached misses, e.g. once an account with that name or email exists"""
+    get_cache().delete_many([_miss_key(identifier) for identifier in identifiers if identifier])
+
+
 class EmailOrUsernameModelBackend(ModelBackend):
+    """Log in with either the username or the email address.
+
+    Both are matched in one query, the email case-insensitively through
+    the LOWER(email) index. An email shared by several accounts isn't
+    used to log in. Misses still hash the password, so the response time
+    doesn't tell whether an account exists, and are remembered for
+    PAPERS_LOGIN_MISS_CACHE_SECONDS so repeated attempts skip the query.
+    Session users are loaded together with their profile.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
-            username = kwargs.get('username')
-        try:
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
-            try:
-                user = UserModel.objects.get(username=username)
-            except UserModel.DoesNotExist:
-                return None
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
 
+        user = self.get_user_by_identifier(username)
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            return None
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
+
+    def get_user(self, user_id):
+        # The user for each authenticated request, with the profile joined
+        # in: the navbar avatar and account page need no query of their own
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        # request.auser() in async views; same join, through the async ORM
+        try:
+            user = await UserModel._default_manager.select_related('profile').aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    def get_user_by_identifier(self, identifier):
+        timeout = getattr(settings, 'PAPERS_LOGIN_MISS_CACHE_SECONDS', 60)
+        cache = get_cache()
+        key = _miss_key(identifier)
+        if timeout and cache.get(key):
+            return None
+
+        email = identifier.lower()
+        # The username match (if any) first, then up to two email matches:
+        # enough to tell a unique email from a shared one
+        candidates = list(
+            UserModel._default_manager
+            .alias(email_lower=Lower('email'))
+            .filter(Q(username=identifier) | Q(email_lower=email))
+            .order_by(Case(When(username=identifier, then=Value(0)), default=Value(1), output_field=IntegerField()))[:3]
+        )
+        by_email = [user for user in candidates if user.email and user.email.lower() == email]
+        by_username = [user for user in candidates if user.username == identifier]
+        if len(by_email) == 1:
+            return by_email[0]
+        if by_username:
+            return by_username[0]
+
+        if timeout:
+            cache.set(key, True, timeout)
+        return None
@@ -0,0 +1,667 @@
+# benchmarks.py - Synthetic catalogues and timed runs of the hot paths
+import asyncio
+import importlib
+import io
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+USER_PREFIX = 'bench_'
+ADMIN_USERNAME = 'bench_admin'
+UPLOAD_CODE_PREFIX = 'BENCHUP'
+PASSWORD = 'benchmark'
+
+# Rough shape of a university catalogue: big departments have more papers
+DEPARTMENT_WEIGHTS = {
+    'Computer Science': 28, 'Engineering': 20, 'Mathematics': 15, 'Business': 13,
+    'Physics': 10, 'Chemistry': 8, 'Biology': 6,
+}
+DEPARTMENT_CODES = {
+    'Computer Science': 'CS', 'Engineering': 'ENG', 'Mathematics': 'MATH', 'Business': 'BUS',
+    'Physics': 'PHY', 'Chemistry': 'CHEM', 'Biology': 'BIO',
+}
+SEMESTER_WEIGHTS = {'Fall': 45, 'Spring': 42, 'Summer': 13}
+YEARS_BACK = 10
+EVENT_DAYS = 90
+TOPICS = [
+    'Algorithms', 'Data Structures', 'Calculus', 'Linear Algebra', 'Statistics', 'Thermodynamics',
+    'Mechanics', 'Organic Chemistry', 'Genetics', 'Microeconomics', 'Accounting', 'Databases',
+    'Operating Systems', 'Networks', 'Circuits', 'Signals', 'Quantum Physics', 'Ecology',
+    'Marketing', 'Finance', 'Compilers', 'Machine Learning', 'Discrete Mathematics', 'Optics',
+]
+KINDS = ['Final Exam', 'Midterm', 'Quiz', 'Assignment', 'Resit Exam']
+# Distinct files stored; papers share them, as reprinted papers do
+FILE_VARIANTS = 50
+
+
+def synthetic_pdf(text):
+    """A small one-page PDF showing `text`"""
+    content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >> stream\n".encode('latin-1') + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj ".encode('latin-1') + body + b" endobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode('latin-1')
+    out += f"trailer << /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    return bytes(out)
+
+
+def _weighted(rng, weights, k):
+    return rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+
+def generate_catalogue(users=200, papers=5000, events=50000, seed=0, batch_size=2000, log=None):
+    """Insert a reproducible synthetic catalogue of bench_* users and papers.
+
+    Departments and semesters follow DEPARTMENT_WEIGHTS and
+    SEMESTER_WEIGHTS, years lean towards recent ones, and downloads
+    follow a Zipf-like popularity curve over the last EVENT_DAYS days.
+    Papers are bulk-created and announced with papers_bulk_created, so
+    search, facets and blob counts are maintained as for a bulk upload.
+    Returns {'users': n, 'papers': n, 'events': n}.
+    """
+    from .events import download_events
+    from .extraction import file_signature
+    from .history import write_downloads
+    from .ingest import papers_bulk_created
+    from .models import PastPaper, PaperText
+    from .profiles import ensure_profiles
+    from .rollups import roll_up
+
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    # Users, with one admin to own uploads and run admin scenarios
+    password = make_password(PASSWORD)
+    taken = set(User.objects.filter(username__startswith=USER_PREFIX).values_list('username', flat=True))
+    new_users = [
+        User(username=f'{USER_PREFIX}user_{i:05d}', email=f'{USER_PREFIX}user_{i:05d}@example.com', password=password)
+        for i in range(users) if f'{USER_PREFIX}user_{i:05d}' not in taken
+    ]
+    if ADMIN_USERNAME not in taken:
+        new_users.append(User(username=ADMIN_USERNAME, password=password, is_staff=True, is_superuser=True))
+    with transaction.atomic():
+        User.objects.bulk_create(new_users, batch_size=batch_size)
+        ensure_profiles(
+            User.objects.filter(username__in=[user.username for user in new_users]).values_list('pk', flat=True),
+            batch_size=batch_size,
+        )
+    bench_users = list(User.objects.filter(username__startswith=f'{USER_PREFIX}user_').values_list('id', flat=True))
+    admin_id = User.objects.get(username=ADMIN_USERNAME).pk
+    log(f"{len(new_users)} users created")
+
+    # A few distinct files, deduplicated by the paper storage
+    storage = PastPaper._meta.get_field('file').storage
+    variants = []
+    for i in range(FILE_VARIANTS):
+        text = f"{TOPICS[i % len(TOPICS)]} benchmark paper {i}"
+        name = storage.save(f'papers/bench_{i}.pdf', ContentFile(synthetic_pdf(text)))
+        variants.append((name, text))
+
+    # Papers
+    existing = set(PastPaper.objects.values_list('title', 'course_code', 'year', 'semester'))
+    departments = _weighted(rng, DEPARTMENT_WEIGHTS, papers)
+    semesters = _weighted(rng, SEMESTER_WEIGHTS, papers)
+    years = rng.choices(
+        range(now.year - YEARS_BACK + 1, now.year + 1), weights=range(1, YEARS_BACK + 1), k=papers
+    )
+    rows = []
+    for i in range(papers):
+        department = departments[i]
+        key = None
+        while key is None or key in existing:
+            title = f"{rng.choice(TOPICS)} {rng.choice(KINDS)}"
+            course_code = f"{DEPARTMENT_CODES[department]}{rng.randint(100, 499)}"
+            key = (title, course_code, years[i], semesters[i])
+        existing.add(key)
+        name, _ = variants[rng.randrange(len(variants))]
+        rows.append(PastPaper(
+            title=title, course_code=course_code, department=department, year=years[i],
+            semester=semesters[i], file=name,
+            user_id=admin_id if rng.random() < 0.8 else rng.choice(bench_users),
+        ))
+
+    texts = dict(variants)
+    paper_ids = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        # Text comes from the generator, so skip the extraction pool
+        with override_settings(PAPERS_TEXT_EXTRACTION='off'), transaction.atomic():
+            PastPaper.objects.bulk_create(batch)
+            for paper in batch:
+                # auto_now_add stamps every row with now; spread them out
+                paper.uploaded_at = now - timedelta(days=365 * (now.year - paper.year), minutes=rng.randrange(525600))
+            PastPaper.objects.bulk_update(batch, ['uploaded_at'])
+            records = []
+            for paper in batch:
+                record = PaperText(paper=paper, signature=file_signature([storage.path(paper.file.name)]))
+                record.content = texts[paper.file.name]
+                records.append(record)
+            PaperText.objects.bulk_create(records)
+            papers_bulk_created.send(sender=PastPaper, papers=batch)
+        paper_ids.extend(paper.pk for paper in batch)
+        log(f"{len(paper_ids)}/{papers} papers created")
+
+    # Downloads: popularity by rank ~ 1/rank, spread over EVENT_DAYS
+    download_events.flush()
+    if paper_ids and bench_users:
+        ranked = paper_ids[:]
+        rng.shuffle(ranked)
+        weights = [1 / (rank + 1) for rank in range(len(ranked))]
+        counts = Counter()
+        for start in range(0, events, batch_size):
+            n = min(batch_size, events - start)
+            chosen = rng.choices(ranked, weights=weights, k=n)
+            batch = [
+                (rng.choice(bench_users), paper_id, now - timedelta(seconds=rng.randrange(EVENT_DAYS * 86400)))
+                for paper_id in chosen
+            ]
+            counts.update(chosen)
+            with transaction.atomic():
+                write_downloads(batch)
+            log(f"{min(start + n, events)}/{events} download events written")
+        with transaction.atomic():
+            popular = list(PastPaper.objects.filter(pk__in=list(counts)).only('pk', 'download_count'))
+            for paper in popular:
+                paper.download_count += counts[paper.pk]
+            PastPaper.objects.bulk_update(popular, ['download_count'], batch_size=batch_size)
+        # Nothing else is writing events while seeding
+        roll_up(lag=0)
+
+    return {'users': len(new_users), 'papers': len(paper_ids), 'events': events if paper_ids and bench_users else 0}
+
+
+def clear_catalogue():
+    """Delete the bench_* users and everything they own"""
+    deleted, _ = User.objects.filter(username__startswith=USER_PREFIX).delete()
+    return deleted
+
+
+# ---- Scenarios ----
+
+class BenchmarkContext:
+    """Logged-in clients and sample values the scenarios draw from"""
+
+    def __init__(self):
+        from .models import Download, PastPaper
+        from .pagination import CursorPaginator, cursor_pagination_enabled
+
+        self.admin = User.objects.filter(username=ADMIN_USERNAME).first()
+        heaviest = (
+            Download.objects.filter(user__username__startswith=f'{USER_PREFIX}user_')
+            .values('user').order_by().annotate(n=Count('id')).order_by('-n').first()
+        )
+        if self.admin is None or heaviest is None:
+            raise LookupError("No benchmark catalogue; run `manage.py generate_catalogue` first")
+        self.user = User.objects.get(pk=heaviest['user'])
+
+        self.user_client = Client()
+        self.user_client.force_login(self.user)
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+
+        self.departments = list(DEPARTMENT_WEIGHTS)
+        self.years = sorted(set(PastPaper.objects.values_list('year', flat=True)), reverse=True)
+        self.terms = [topic.split()[0] for topic in TOPICS]
+        self.popular = list(PastPaper.objects.order_by('-download_count').values_list('pk', flat=True)[:50])
+        self.zip_ids = [str(pk) for pk in self.popular[:20]]
+
+        total = PastPaper.objects.count()
+        deep = max(total // 2, 0)
+        if cursor_pagination_enabled():
+            row = PastPaper.objects.order_by('-uploaded_at', '-pk')[deep:deep + 1].first()
+            paginator = CursorPaginator(PastPaper.objects.all(), 10, ['-uploaded_at'])
+            self.deep_page = {'sort': '-uploaded_at', 'cursor': paginator.encode_cursor(row) if row else ''}
+        else:
+            self.deep_page = {'sort': '-uploaded_at', 'page': deep // 10 + 1}
+        self.uploads = 0
+
+    def pick(self, values, i):
+        return values[i % len(values)]
+
+
+def _bulk_upload(ctx, i):
+    files = [
+        ContentFile(synthetic_pdf(f"uploaded benchmark {i}-{n}"), name=f'upload_{i}_{n}.pdf')
+        for n in range(5)
+    ]
+    ctx.uploads += 1
+    return ctx.admin_client.post(reverse('upload_paper'), {
+        'upload_type': 'bulk',
+        'bulk_department': ctx.pick(ctx.departments, i),
+        'bulk_year': str(ctx.years[0]),
+        'bulk_semester': 'Fall',
+        'files': files,
+        'course_codes[]': [f'{UPLOAD_CODE_PREFIX}{i}' for _ in files],
+        'titles[]': [f'Benchmark upload {i}-{n}' for n in range(len(files))],
+    })
+
+
+def _login(identifier, password):
+    # A fresh client per attempt, like a new visitor
+    return Client().post(reverse('login'), {'username': identifier, 'password': password})
+
+
+def _admin_zip(ctx, i):
+    return ctx.admin_client.post(reverse('admin:papers_pastpaper_changelist'), {
+        'action': 'download_selected_as_zip',
+        '_selected_action': ctx.zip_ids,
+    })
+
+
+SCENARIOS = {
+    'home': lambda ctx, i: ctx.user_client.get(reverse('home')),
+    'view_papers': lambda ctx, i: ctx.user_client.get(reverse('view_papers')),
+    'view_papers_search': lambda ctx, i: ctx.user_client.get(
+        reverse('view_papers'), {'q': ctx.pick(ctx.terms, i)}),
+    'view_papers_filter_department': lambda ctx, i: ctx.user_client.get(
+        reverse('view_papers'), {'department': ctx.pick(ctx.departments, i)}),
+    'view_papers_filter_year': lambda ctx, i: ctx.user_client.get(
+        reverse('view_papers'), {'year': ctx.pick(ctx.years, i)}),
+    'view_papers_search_filtered': lambda ctx, i: ctx.user_client.get(reverse('view_papers'), {
+        'q': ctx.pick(ctx.terms, i), 'department': ctx.pick(ctx.departments, i), 'sort': 'title'}),
+    'view_papers_sort_title': lambda ctx, i: ctx.user_client.get(reverse('view_papers'), {'sort': 'title'}),
+    'view_papers_sort_year': lambda ctx, i: ctx.user_client.get(reverse('view_papers'), {'sort': '-year'}),
+    'view_papers_deep_page': lambda ctx, i: ctx.user_client.get(reverse('view_papers'), ctx.deep_page),
+    'download_paper': lambda ctx, i: ctx.user_client.get(
+        reverse('download_paper', args=[ctx.pick(ctx.popular, i)])),
+    'my_downloads': lambda ctx, i: ctx.user_client.get(reverse('my_downloads')),
+    'login': lambda ctx, i: _login(ctx.user.username, PASSWORD),
+    'login_email': lambda ctx, i: _login(ctx.user.email.upper(), PASSWORD),
+    'login_unknown_user': lambda ctx, i: _login(f'nobody{i % 5}@example.com', PASSWORD),
+    'bulk_upload': _bulk_upload,
+    'admin_zip_export': _admin_zip,
+}
+
+
+def _consume(response):
+    """Read the whole body, so streamed responses are timed to the end"""
+    if getattr(response, 'streaming', False):
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return size
+    return len(response.content)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def run_scenario(name, ctx, iterations=20, warmup=2):
+    """Time `iterations` requests of a scenario after `warmup` untimed ones"""
+    from .perf import request_metrics
+
+    scenario = SCENARIOS[name]
+    for i in range(warmup):
+        _consume(scenario(ctx, -1 - i))
+
+    timings, queries, errors, size = [], [], 0, 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = scenario(ctx, i)
+        size += _consume(response)
+        timings.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+        entries = request_metrics.entries()
+        if entries and getattr(settings, 'PAPERS_PERF_INSTRUMENTATION', True):
+            queries.append(entries[-1]['queries'])
+    elapsed = time.perf_counter() - started
+
+    ms = [t * 1000 for t in timings]
+    return {
+        'requests': iterations,
+        'errors': errors,
+        'throughput_rps': round(iterations / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(ms) / len(ms), 2),
+        'p50_ms': round(_percentile(ms, 0.5), 2),
+        'p95_ms': round(_percentile(ms, 0.95), 2),
+        'max_ms': round(max(ms), 2),
+        'avg_queries': round(sum(queries) / len(queries), 1) if queries else None,
+        'avg_bytes': size // iterations,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(names=None, iterations=20, warmup=2, log=None):
+    """Run the named scenarios (default: all) and return the results dict.
+
+    Requests go through the full middleware stack with the test client,
+    against the configured database and cache. Bulk upload papers are
+    deleted afterwards so repeated runs see the same catalogue.
+    """
+    from .events import download_events
+    from .counters import download_counter
+    from .models import PastPaper
+
+    log = log or (lambda message: None)
+    names = names or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise KeyError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+        ctx = BenchmarkContext()
+        try:
+            for name in names:
+                results[name] = run_scenario(name, ctx, iterations, warmup)
+                log(f"{name}: p95 {results[name]['p95_ms']} ms, {results[name]['throughput_rps']} req/s")
+        finally:
+            download_events.flush()
+            download_counter.flush()
+            PastPaper.objects.filter(course_code__startswith=UPLOAD_CODE_PREFIX).delete()
+
+    return {'meta': _meta(iterations=iterations), 'scenarios': results}
+
+
+def _meta(**extra):
+    from .models import DownloadEvent, PastPaper
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        **extra,
+        'catalogue': {
+            'users': User.objects.filter(username__startswith=USER_PREFIX).count(),
+            'papers': PastPaper.objects.count(),
+            'events': DownloadEvent.objects.count(),
+        },
+    }
+
+
+# ---- Servers: ASGI with the async views against threaded WSGI ----
+
+SERVER_SCENARIOS = {
+    'home': lambda ctx, i: reverse('home'),
+    'view_papers': lambda ctx, i: reverse('view_papers'),
+    'view_papers_search': lambda ctx, i: f"{reverse('view_papers')}?q={ctx.pick(ctx.terms, i)}",
+    'download_paper': lambda ctx, i: reverse('download_paper', args=[ctx.pick(ctx.popular, i)]),
+}
+SERVERS = ('wsgi', 'asgi')
+
+
+def _reload_urlconfs():
+    import papers.urls
+
+    importlib.reload(papers.urls)
+    if settings.ROOT_URLCONF in sys.modules:
+        importlib.reload(sys.modules[settings.ROOT_URLCONF])
+    clear_url_caches()
+
+
+@contextmanager
+def serving_async_views(enabled=True):
+    """Route the URLs to the async views (or the sync ones) for the duration"""
+    try:
+        with override_settings(PAPERS_ASYNC_VIEWS=enabled):
+            _reload_urlconfs()
+            yield
+    finally:
+        _reload_urlconfs()
+
+
+def _split(path):
+    path, _, query = path.partition('?')
+    return path, query
+
+
+def wsgi_get(app, path, cookie='', slow_client=0):
+    """GET `path` from a WSGI app as a threaded server would; (status, bytes).
+
+    `slow_client` seconds pass between body chunks, as for a client on a
+    slow link, with the server thread waiting on it.
+    """
+    path_info, query = _split(path)
+    environ = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path_info, 'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    body = app(environ, lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+    size = 0
+    try:
+        for chunk in body:
+            size += len(chunk)
+            if slow_client:
+                time.sleep(slow_client)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0], size
+
+
+async def asgi_get(app, path, cookie='', slow_client=0):
+    """GET `path` from an ASGI app the way uvicorn drives it; (status, bytes).
+
+    With `slow_client`, sending each body chunk waits that long, without
+    holding anything but the connection's task.
+    """
+    path_info, query = _split(path)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path_info, 'raw_path': path_info.encode(), 'root_path': '',
+        'query_string': query.encode(), 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+    }
+    finished = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    response = {'status': None, 'size': 0}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Nothing more from the client until the response is done
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['size'] += len(message.get('body', b''))
+            if slow_client:
+                await asyncio.sleep(slow_client)
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return response['status'], response['size']
+
+
+def _server_stats(timings, statuses, size, elapsed):
+    ms = [t * 1000 for t in timings]
+    return {
+        'requests': len(ms),
+        'errors': sum(1 for status in statuses if status is None or status >= 400),
+        'throughput_rps': round(len(ms) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(ms) / len(ms), 2),
+        'p50_ms': round(_percentile(ms, 0.5), 2),
+        'p95_ms': round(_percentile(ms, 0.95), 2),
+        'max_ms': round(max(ms), 2),
+        'avg_bytes': size // len(ms),
+    }
+
+
+def _run_wsgi(paths, cookie, concurrency, slow_client):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    app = WSGIHandler()
+
+    def timed(path):
+        start = time.perf_counter()
+        status, size = wsgi_get(app, path, cookie, slow_client)
+        return time.perf_counter() - start, status, size
+
+    started = time.perf_counter()
+    # One thread per connection, like gunicorn's gthread worker
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, paths))
+    elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def _run_asgi(paths, cookie, concurrency, slow_client):
+    from django.core.handlers.asgi import ASGIHandler
+
+    app = ASGIHandler()
+
+    async def main():
+        # `concurrency` connections open at once, each a task on one loop
+        limit = asyncio.Semaphore(concurrency)
+
+        async def timed(path):
+            async with limit:
+                start = time.perf_counter()
+                status, size = await asgi_get(app, path, cookie, slow_client)
+                return time.perf_counter() - start, status, size
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed(path) for path in paths))
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def run_server(server, paths, cookie, concurrency=20, slow_client=0):
+    """Serve `paths` through `server` ('wsgi' or 'asgi') with `concurrency`
+    requests in flight; returns throughput and latency figures.
+
+    WSGI serves the sync views from a thread per connection; ASGI serves
+    the async views from a single event loop, as under uvicorn.
+    """
+    runner = {'wsgi': _run_wsgi, 'asgi': _run_asgi}[server]
+    with serving_async_views(server == 'asgi'):
+        # Untimed: templates, URL resolvers and caches warm up
+        runner(paths[:concurrency], cookie, concurrency, slow_client)
+        results, elapsed = runner(paths, cookie, concurrency, slow_client)
+    return _server_stats(
+        [timing for timing, _, _ in results],
+        [status for _, status, _ in results],
+        sum(size for _, _, size in results),
+        elapsed,
+    )
+
+
+def compare_servers(names=None, concurrency=20, requests=200, slow_client_ms=0, log=None):
+    """Concurrent-connection throughput of WSGI and ASGI for the named
+    server scenarios (default: all).
+
+    The apps are called in-process the way the servers call them, so the
+    figures measure Django and the views rather than a network stack;
+    `slow_client_ms` delays every body chunk to show what slow
+    downloads cost each model.
+    """
+    from .events import download_events
+    from .counters import download_counter
+
+    log = log or (lambda message: None)
+    names = names or list(SERVER_SCENARIOS)
+    unknown = set(names) - set(SERVER_SCENARIOS)
+    if unknown:
+        raise KeyError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+        ctx = BenchmarkContext()
+        cookie = f"{settings.SESSION_COOKIE_NAME}={ctx.user_client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        try:
+            for name in names:
+                paths = [SERVER_SCENARIOS[name](ctx, i) for i in range(requests)]
+                results[name] = {}
+                for server in SERVERS:
+                    results[name][server] = run_server(server, paths, cookie, concurrency, slow_client_ms / 1000)
+                    log(f"{name} [{server}]: {results[name][server]['throughput_rps']} req/s, "
+                        f"p95 {results[name][server]['p95_ms']} ms")
+        finally:
+            download_events.flush()
+            download_counter.flush()
+
+    return {
+        'meta': _meta(concurrency=concurrency, requests=requests, slow_client_ms=slow_client_ms),
+        'servers': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """Regressions of `current` against `baseline` beyond `threshold` (0.2 = 20%).
+
+    Flags a slower p95, lower throughput, or more queries per request
+    for every scenario present in both runs.
+    """
+    regressions = []
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms")
+        if before['throughput_rps'] and now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {now['throughput_rps']} req/s")
+        if before.get('avg_queries') is not None and now.get('avg_queries') is not None \
+                and now['avg_queries'] > before['avg_queries']:
+            regressions.append(f"{name}: queries {before['avg_queries']} -> {now['avg_queries']}")
+    return regressions
+
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,196 @@
+# caching.py - Cached dashboard lists with explicit invalidation
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'papers'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAPERS_CACHE_ALIAS', 'default')]
+
+
+CATALOGUE_VERSION_KEY = f'{KEY_PREFIX}:catalogue:version'
+CATALOGUE_CHANGED_KEY = f'{KEY_PREFIX}:catalogue:changed'
+
+
+def catalogue_version():
+    """Counter bumped whenever papers are added, edited or removed.
+
+    Cache keys that embed it go stale together without being deleted.
+    """
+    return get_cache().get(CATALOGUE_VERSION_KEY, 0)
+
+
+async def acatalogue_version():
+    return await get_cache().aget(CATALOGUE_VERSION_KEY, 0)
+
+
+def catalogue_changed_at():
+    """Unix time of the last catalogue change, or None if not known"""
+    return get_cache().get(CATALOGUE_CHANGED_KEY)
+
+
+def bump_catalogue_version():
+    cache = get_cache()
+    cache.add(CATALOGUE_VERSION_KEY, 0, timeout=None)
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, timeout=None)
+    cache.set(CATALOGUE_CHANGED_KEY, time.time(), timeout=None)
+
+
+def _data_version_key(model):
+    return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+def data_version(model):
+    """Version of cached data derived from `model`'s rows.
+
+    PastPaper uses catalogue_version(); other models (downloads) have a
+    counter of their own, paired with the catalogue version because
+    their rows go when a paper is deleted.
+    """
+    if model._meta.label_lower == 'papers.pastpaper':
+        return catalogue_version()
+    key = _data_version_key(model)
+    values = get_cache().get_many([CATALOGUE_VERSION_KEY, key])
+    return f'{values.get(CATALOGUE_VERSION_KEY, 0)}.{values.get(key, 0)}'
+
+
+async def adata_version(model):
+    if model._meta.label_lower == 'papers.pastpaper':
+        return await acatalogue_version()
+    key = _data_version_key(model)
+    values = await get_cache().aget_many([CATALOGUE_VERSION_KEY, key])
+    return f'{values.get(CATALOGUE_VERSION_KEY, 0)}.{values.get(key, 0)}'
+
+
+def bump_data_version(*models):
+    """Invalidate data cached under data_version() for these models"""
+    cache = get_cache()
+    for model in models:
+        key = _data_version_key(model)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _stat_key(name, outcome):
+    return f'{KEY_PREFIX}:stats:{name}:{outcome}'
+
+
+def _bump(name, outcome):
+    """Count a hit or miss in the cache itself so every worker shares it"""
+    cache = get_cache()
+    key = _stat_key(name, outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); start counting again
+        cache.set(key, 1, timeout=None)
+
+
+async def _abump(name, outcome):
+    cache = get_cache()
+    key = _stat_key(name, outcome)
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+
+
+class CachedList:
+    """A small query result kept in the cache until invalidated or expired"""
+
+    def __init__(self, name, loader, timeout_setting, default_timeout):
+        self.name = name
+        self.loader = loader
+        self.timeout_setting = timeout_setting
+        self.default_timeout = default_timeout
+
+    @property
+    def key(self):
+        return f'{KEY_PREFIX}:{self.name}'
+
+    @property
+    def timeout(self):
+        return getattr(settings, self.timeout_setting, self.default_timeout)
+
+    def get(self):
+        cache = get_cache()
+        value = cache.get(self.key)
+        if value is not None:
+            _bump(self.name, 'hits')
+            return value
+        _bump(self.name, 'misses')
+        value = list(self.loader())
+        cache.set(self.key, value, timeout=self.timeout)
+        return value
+
+    async def aget(self):
+        """get() for async views; only a miss runs the loader in a thread"""
+        value = await get_cache().aget(self.key)
+        if value is not None:
+            await _abump(self.name, 'hits')
+            return value
+        return await sync_to_async(self.get)()
+
+    def invalidate(self):
+        get_cache().delete(self.key)
+
+    def stats(self):
+        cache = get_cache()
+        hits = cache.get(_stat_key(self.name, 'hits'), 0)
+        misses = cache.get(_stat_key(self.name, 'misses'), 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        get_cache().delete_many([_stat_key(self.name, 'hits'), _stat_key(self.name, 'misses')])
+
+
+def _load_recent():
+    from .models import PastPaper
+    return PastPaper.objects.only('id', 'title', 'uploaded_at').order_by('-uploaded_at')[:5]
+
+
+def _load_popular():
+    """Most downloaded papers, all-time or over PAPERS_POPULAR_WINDOW_DAYS"""
+    from .models import PastPaper
+    from .rollups import popular_since
+
+    papers = PastPaper.objects.only('id', 'title', 'download_count')
+    window = getattr(settings, 'PAPERS_POPULAR_WINDOW_DAYS', None)
+    if window is None:
+        return papers.order_by('-download_count')[:5]
+    ids = popular_since(timezone.now() - timedelta(days=window))
+    by_id = papers.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+recent_papers = CachedList('dashboard:recent', _load_recent, 'PAPERS_RECENT_CACHE_TIMEOUT', 3600)
+popular_papers = CachedList('dashboard:popular', _load_popular, 'PAPERS_POPULAR_CACHE_TIMEOUT', 300)
+
+DASHBOARD_LISTS = (recent_papers, popular_papers)
+
+
+def cache_stats():
+    """Hit/miss counters for every cached list, keyed by name"""
+    return {cached.name: cached.stats() for cached in DASHBOARD_LISTS}
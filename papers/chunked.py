@@ -0,0 +1,228 @@
+# chunked.py - Resumable uploads sent in checksummed chunks
+import hashlib
+import logging
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+# Partial uploads live next to the blobs so finalizing is a rename
+PARTS_DIR = 'blobs/.uploads'
+COPY_BLOCK = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class ChunkError(Exception):
+    """A rejected chunked-upload request; `status` is the HTTP status to send"""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+def chunk_size():
+    return getattr(settings, 'PAPERS_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def max_upload_size():
+    return getattr(settings, 'PAPERS_MAX_UPLOAD_SIZE', 200 * 1024 * 1024)
+
+
+def paper_file_storage():
+    from .models import PastPaper
+    return PastPaper._meta.get_field('file').storage
+
+
+def part_path(upload):
+    return paper_file_storage().path(f'{PARTS_DIR}/{upload.pk}.part')
+
+
+class StoredUpload(File):
+    """A finished chunked upload, usable wherever an UploadedFile is.
+
+    `stored_name` is where the bytes already are, so handlers can point
+    a FileField at it instead of copying the file again.
+    """
+
+    def __init__(self, storage, stored_name, name, size):
+        super().__init__(None, name)
+        self.storage = storage
+        self.stored_name = stored_name
+        self.size = size
+
+    def open(self, mode='rb'):
+        if self.file is None or self.file.closed:
+            self.file = self.storage.open(self.stored_name, mode)
+        else:
+            self.file.seek(0)
+        return self
+
+    def chunks(self, chunk_size=None):
+        self.open()
+        return super().chunks(chunk_size)
+
+
+def create_upload(user, filename, size, sha256=''):
+    from .models import ChunkedUpload
+
+    filename = os.path.basename(filename or '')
+    if not filename.lower().endswith('.pdf'):
+        raise ChunkError('Only PDF files are allowed.')
+    if size <= 0 or size > max_upload_size():
+        raise ChunkError(f'Files must be between 1 byte and {max_upload_size()} bytes.', status=413)
+    upload = ChunkedUpload.objects.create(user=user, filename=filename, size=size, sha256=sha256.lower())
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, user, offset, stream, length, checksum):
+    """Write `length` bytes from `stream` at `offset`, checked against `checksum`.
+
+    Chunks must arrive in order. A retried chunk the server already has
+    is acknowledged without being written again; any other offset is a
+    conflict, answered with the offset to resume from. Returns the
+    number of bytes received so far.
+    """
+    from .models import ChunkedUpload
+
+    if not checksum:
+        raise ChunkError('X-Chunk-SHA256 header is required.')
+    if length <= 0 or length > chunk_size():
+        raise ChunkError(f'Chunks must be between 1 and {chunk_size()} bytes.', status=413)
+
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().filter(pk=upload_id, user=user).first()
+        if upload is None:
+            raise ChunkError('Upload not found.', status=404)
+        if upload.status != ChunkedUpload.UPLOADING:
+            raise ChunkError('Upload is already finalized.', status=409, received=upload.received)
+        if offset + length <= upload.received:
+            return upload.received
+        if offset != upload.received:
+            raise ChunkError('Unexpected offset.', status=409, received=upload.received)
+        if offset + length > upload.size:
+            raise ChunkError('Chunk runs past the declared size.', status=416, received=upload.received)
+
+        sha = hashlib.sha256()
+        written = 0
+        with open(part_path(upload), 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                data = stream.read(min(COPY_BLOCK, length - written))
+                if not data:
+                    break
+                sha.update(data)
+                f.write(data)
+                written += len(data)
+            if written != length or sha.hexdigest() != checksum.lower():
+                # Throw the bad bytes away so the chunk can be resent
+                f.truncate(offset)
+                raise ChunkError('Chunk checksum mismatch.', status=422, received=upload.received)
+
+        upload.received += length
+        upload.save(update_fields=['received', 'updated_at'])
+        return upload.received
+
+
+def finalize(upload_id, user):
+    """Move a complete upload into paper storage and return it"""
+    from .models import ChunkedUpload
+
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().filter(pk=upload_id, user=user).first()
+        if upload is None:
+            raise ChunkError('Upload not found.', status=404)
+        if upload.status == ChunkedUpload.COMPLETE:
+            return upload
+        if upload.received != upload.size:
+            raise ChunkError('Upload is incomplete.', status=409, received=upload.received)
+
+        storage = paper_file_storage()
+        path = part_path(upload)
+        if isinstance(storage, ContentAddressedStorage):
+            name, digest = storage.save_local(path, upload.filename)
+        else:
+            with open(path, 'rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+                f.seek(0)
+                name = storage.save(f'papers/{upload.filename}', File(f))
+            os.remove(path)
+        if upload.sha256 and digest != upload.sha256:
+            storage.delete(name)
+            raise ChunkError('File checksum mismatch.', status=422)
+
+        upload.status = ChunkedUpload.COMPLETE
+        upload.stored_name = name
+        upload.save(update_fields=['status', 'stored_name', 'updated_at'])
+        return upload
+
+
+def stored_files(user, upload_ids):
+    """StoredUploads for finished uploads of `user`, in the order given.
+
+    Raises ChunkError if any id isn't one. Uploads are left in place (a
+    failed form can be resubmitted) and expire with the others.
+    """
+    from .models import ChunkedUpload
+
+    try:
+        upload_ids = [str(uuid.UUID(str(upload_id))) for upload_id in upload_ids]
+    except ValueError:
+        raise ChunkError('Invalid upload id.', status=404)
+    uploads = ChunkedUpload.objects.filter(pk__in=upload_ids, user=user, status=ChunkedUpload.COMPLETE)
+    by_id = {str(upload.pk): upload for upload in uploads}
+    missing = [upload_id for upload_id in upload_ids if str(upload_id) not in by_id]
+    if missing:
+        raise ChunkError(f'Unknown or unfinished upload: {missing[0]}', status=404)
+
+    storage = paper_file_storage()
+    return [
+        StoredUpload(storage, upload.stored_name, upload.filename, upload.size)
+        for upload in (by_id[str(upload_id)] for upload_id in upload_ids)
+    ]
+
+
+def request_files(request, field):
+    """Files posted in `field`, or the chunked uploads listed in `<field>_upload_id`"""
+    upload_ids = request.POST.getlist(f'{field}_upload_id')
+    if upload_ids:
+        return stored_files(request.user, upload_ids)
+    return request.FILES.getlist(field)
+
+
+def field_value(upload):
+    """What to assign to a FileField: the stored name when already stored"""
+    return getattr(upload, 'stored_name', None) or upload
+
+
+def expire_uploads(max_age=None):
+    """Drop uploads untouched for PAPERS_UPLOAD_EXPIRY_HOURS, with their parts"""
+    from .models import ChunkedUpload
+
+    if max_age is None:
+        max_age = timedelta(hours=getattr(settings, 'PAPERS_UPLOAD_EXPIRY_HOURS', 24))
+    stale = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale:
+        if upload.status == ChunkedUpload.UPLOADING:
+            try:
+                os.remove(part_path(upload))
+            except OSError:
+                pass
+        # Finished but unclaimed blobs are left to gc_blobs
+        upload.delete()
+        count += 1
+    return count
@@ -0,0 +1,121 @@
+# conditional.py - ETag / Last-Modified revalidation for catalogue pages
+import functools
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from .profiles import cached_profile
+
+
+def conditional_get_enabled():
+    return getattr(settings, 'PAPERS_CONDITIONAL_GET', True)
+
+
+def make_etag(*parts):
+    """A weak ETag for a page built from `parts` (anything with a stable repr)"""
+    return 'W/' + quote_etag(hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32])
+
+
+def loaded_values(obj):
+    """The field values an instance was loaded with, without querying
+    deferred fields (the dashboard lists only load a few)
+    """
+    return tuple(sorted(
+        (field, getattr(value, 'name', value))
+        for field, value in obj.__dict__.items() if not field.startswith('_')
+    ))
+
+
+def user_fingerprint(user):
+    """What the navbar shows of the user, so an edited name or avatar and
+    a new login (which rotates the CSRF token) change the ETag
+    """
+    if user is None or not user.is_authenticated:
+        return ('anon',)
+    profile = cached_profile(user)
+    image = getattr(profile.profile_image, 'name', '') if profile is not None else ''
+    return (user.pk, user.username, user.first_name, user.last_name, user.last_login, image)
+
+
+def timestamp(value):
+    """Unix seconds for a datetime or a time.time() value; None passes through"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+def latest(*values):
+    """The most recent of datetimes / Unix times, ignoring None"""
+    return max((timestamp(value) for value in values if value is not None), default=None)
+
+
+def _applies(request):
+    if not conditional_get_enabled() or request.method not in ('GET', 'HEAD'):
+        return False
+    # A 304 would leave flash messages queued for a later page
+    messages = getattr(request, '_messages', None)
+    return messages is None or not len(messages)
+
+
+def _validators(request, validator, args, kwargs):
+    etag, last_modified = validator(request, *args, **kwargs)
+    language = getattr(request, 'LANGUAGE_CODE', None) or get_language() or ''
+    return make_etag(language, etag), timestamp(last_modified)
+
+
+def _finish(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # Browsers keep the page but ask again each time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(validator):
+    """Answer GETs of the view with 304 Not Modified while its content is
+    unchanged, without running the view or rendering its template.
+
+    `validator(request, *args, **kwargs)` returns (parts, last_modified):
+    `parts` is anything with a stable repr that changes with the page (a
+    cheap aggregate over the listing, the user), hashed into a weak ETag
+    together with the language; `last_modified` is a datetime, a Unix time
+    or None. Validators should run a single lightweight query at most.
+    Works on sync and async views; async validators run in a thread, with
+    request.user already resolved. Turned off by PAPERS_CONDITIONAL_GET.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not _applies(request):
+                    return await view(request, *args, **kwargs)
+                request.user = await request.auser()
+                etag, last_modified = await sync_to_async(_validators)(request, validator, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(response, etag, last_modified)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not _applies(request):
+                    return view(request, *args, **kwargs)
+                etag, last_modified = _validators(request, validator, args, kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+# counters.py - Buffered download counters flushed in batches
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Sent after pending increments are written; `counts` maps paper id to
+# the number of downloads just added.
+downloads_flushed = Signal()
+
+
+class BackgroundFlusher:
+    """Base for in-memory buffers written to the database in batches.
+
+    `flush_interval` is in seconds; 0 writes through on every call to
+    `buffered()` and None disables time-based flushing (call `flush()`
+    yourself). Buffers are also flushed once `max_pending` items are
+    waiting and at interpreter shutdown. Subclasses implement `flush()`
+    and name the settings that provide the defaults.
+    """
+
+    interval_setting = None
+    default_interval = 5.0
+    max_pending_setting = None
+    default_max_pending = 1000
+    thread_name = 'buffer-flush'
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, self.interval_setting, self.default_interval)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, self.max_pending_setting, self.default_max_pending)
+
+    def buffered(self, total):
+        """Called after adding to the buffer, with the number now waiting"""
+        interval = self.flush_interval
+        if interval == 0 or total >= self.max_pending:
+            self.flush()
+        elif interval is not None:
+            self._ensure_thread()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = self.flush_interval
+            self._wakeup.wait(interval if interval else 1.0)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Items were put back; try again on the next tick
+                pass
+            finally:
+                # The flusher thread owns its connection; don't leak it
+                connections.close_all()
+
+
+class DownloadCounter(BackgroundFlusher):
+    """Accumulate download increments in memory and write them in batches.
+
+    Increments never read the current value back from the database: each
+    flush issues one `UPDATE ... SET download_count = download_count + n`
+    per distinct `n`, so concurrent workers can't overwrite each other.
+    """
+
+    interval_setting = 'PAPERS_DOWNLOAD_FLUSH_INTERVAL'
+    max_pending_setting = 'PAPERS_DOWNLOAD_MAX_PENDING'
+    thread_name = 'download-counter-flush'
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        super().__init__(flush_interval, max_pending)
+        self._pending = Counter()
+
+    def increment(self, paper_id, n=1):
+        """Record `n` downloads of `paper_id`"""
+        with self._lock:
+            self._pending[paper_id] += n
+            total = sum(self._pending.values())
+        self.buffered(total)
+
+    def pending(self, paper_id=None):
+        """Number of increments not yet written to the database"""
+        with self._lock:
+            if paper_id is None:
+                return sum(self._pending.values())
+            return self._pending[paper_id]
+
+    def flush(self):
+        """Write every pending increment, returning the number written"""
+        from .models import PastPaper
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return 0
+
+            # One UPDATE per distinct increment size keeps the batch small
+            by_amount = defaultdict(list)
+            for paper_id, n in pending.items():
+                by_amount[n].append(paper_id)
+
+            try:
+                with transaction.atomic():
+                    for n, paper_ids in by_amount.items():
+                        PastPaper.objects.filter(pk__in=paper_ids).update(
+                            download_count=F('download_count') + n
+                        )
+            except Exception as e:
+                logger.error(f"Download counter flush failed: {str(e)}")
+                with self._lock:
+                    self._pending.update(pending)
+                raise
+
+            written = sum(pending.values())
+            logger.debug(f"Flushed {written} downloads for {len(pending)} papers")
+            downloads_flushed.send(sender=self.__class__, counts=dict(pending))
+            return written
+
+
+download_counter = DownloadCounter()
@@ -0,0 +1,204 @@
+# delivery.py - Serve stored paper files without tying up a worker
+import asyncio
+import os
+import re
+import logging
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Chunk size used when Django streams the file itself
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """Read-only view of bytes [start, start + length) of an open file.
+
+    It deliberately has no `fileno()`, so WSGI servers fall back to
+    calling `read()` instead of sending the whole file with sendfile.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        self.file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class AsyncFileStream:
+    """Async iterator over an open file (or RangeFile) for ASGI responses.
+
+    Each block is read in a worker thread and handed to the server
+    between awaits, so a slow client holds neither a thread nor the
+    event loop while it downloads.
+    """
+
+    def __init__(self, file, block_size=BLOCK_SIZE):
+        self.file = file
+        self.block_size = block_size
+
+    async def __aiter__(self):
+        try:
+            while True:
+                data = await asyncio.to_thread(self.file.read, self.block_size)
+                if not data:
+                    break
+                yield data
+        finally:
+            self.file.close()
+
+
+def file_etag(stat):
+    """Cheap strong validator from size and mtime, like nginx"""
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, or None.
+
+    Raises ValueError for a syntactically valid range that can't be
+    satisfied. Multi-range requests are ignored and served in full.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def get_delivery_mode():
+    return getattr(settings, 'PAPERS_FILE_DELIVERY', 'django')
+
+
+def serve_file(request, field_file, filename=None, asynchronous=False):
+    """Return a response delivering `field_file` to the client.
+
+    PAPERS_FILE_DELIVERY selects how the bytes are sent:
+      - 'django': FileResponse (sendfile via wsgi.file_wrapper) with
+        Range support, or an AsyncFileStream for async views when
+        `asynchronous` is set
+      - 'nginx': empty response with X-Accel-Redirect under
+        PAPERS_ACCEL_REDIRECT_PREFIX
+      - 'sendfile': empty response with X-Sendfile (Apache, lighttpd)
+    Files on storages without a local path are redirected to their URL.
+    """
+    filename = filename or os.path.basename(field_file.name)
+
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        return redirect(field_file.url)
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404("File not found")
+
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    mode = get_delivery_mode()
+    if mode == 'nginx':
+        prefix = getattr(settings, 'PAPERS_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(field_file.name)
+    elif mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = _file_response(request, path, stat, etag, content_type, asynchronous)
+
+    if not response.has_header('Content-Disposition'):
+        response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _file_response(request, path, stat, etag, content_type, asynchronous=False):
+    size = stat.st_size
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+
+    # If-Range only accepts our ETag; anything else gets the full file
+    if range_header and (not if_range or etag in parse_etags(if_range)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        file, status, length = open(path, 'rb'), 200, size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        file, status = RangeFile(open(path, 'rb'), start, length), 206
+
+    if asynchronous:
+        response = StreamingHttpResponse(AsyncFileStream(file), content_type=content_type, status=status)
+    else:
+        response = FileResponse(file, content_type=content_type, status=status)
+        response.block_size = BLOCK_SIZE
+    response['Content-Length'] = str(length)
+    if byte_range is not None:
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def counts_as_download(request, response):
+    """True for responses that start a transfer, not HEADs, 304s or
+    resumed ranges
+    """
+    if request.method == 'HEAD':
+        return False
+    if response.has_header('X-Accel-Redirect') or response.has_header('X-Sendfile'):
+        # The proxy answers the Range itself; the response here is a 200
+        match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+        if match and match.group(1) != '0':
+            return False
+        return response.status_code == 200
+    if response.status_code == 206:
+        return response.get('Content-Range', '').startswith('bytes 0-')
+    return response.status_code == 200 or response.status_code == 302
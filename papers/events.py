@@ -0,0 +1,69 @@
+# events.py - Append-only download events, buffered and written in batches
+import logging
+from collections import deque
+
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import BackgroundFlusher
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadEventLog(BackgroundFlusher):
+    """Ring buffer of (user_id, paper_id, time) flushed with bulk_create.
+
+    Recording an event is a deque append, so download_paper does no
+    database writes of its own. Each flush inserts the DownloadEvent
+    rows and upserts the latest Download per (user, paper) in one
+    transaction. If the buffer reaches `capacity` before a flush
+    succeeds, the oldest events are dropped and counted in `dropped`.
+    """
+
+    interval_setting = 'PAPERS_EVENT_FLUSH_INTERVAL'
+    max_pending_setting = 'PAPERS_EVENT_MAX_PENDING'
+    thread_name = 'download-event-flush'
+
+    def __init__(self, flush_interval=None, max_pending=None, capacity=100000):
+        super().__init__(flush_interval, max_pending)
+        self._events = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def record(self, user_id, paper_id, when=None):
+        event = (user_id, paper_id, when or timezone.now())
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            total = len(self._events)
+        self.buffered(total)
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Write every buffered event, returning the number written"""
+        from .history import write_downloads
+
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+            if not events:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    written = write_downloads(events)
+            except Exception as e:
+                logger.error(f"Download event flush failed: {str(e)}")
+                with self._lock:
+                    self._events.extendleft(reversed(events))
+                raise
+
+            logger.debug(f"Flushed {written} download events")
+            return written
+
+
+download_events = DownloadEventLog()
@@ -0,0 +1,218 @@
+# extraction.py - Pull searchable text out of uploaded PDFs in a process pool
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+STREAM_RE = re.compile(rb'\d+\s+\d+\s+obj\s*<<((?:(?!endobj).)*?)>>\s*stream\r?\n(.*?)\r?\nendstream', re.S)
+TEXT_BLOCK_RE = re.compile(rb'BT(.*?)ET', re.S)
+STRING_RE = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|.)', re.S)
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _unescape(raw):
+    def replace(match):
+        code = match.group(1)
+        if code[:1].isdigit():
+            return bytes([int(code, 8) & 0xFF])
+        return ESCAPES.get(code, code)
+    return ESCAPE_RE.sub(replace, raw)
+
+
+def _extract_basic(data):
+    """Best-effort text from literal strings in the page content streams.
+
+    Used when pypdf isn't installed; handles uncompressed and
+    FlateDecode streams with simple fonts, which covers most generated
+    exam papers. Scanned papers have no text either way.
+    """
+    lines = []
+    for header, body in STREAM_RE.findall(data):
+        if b'/FlateDecode' in header:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                continue
+        elif b'/Filter' in header:
+            continue
+        for block in TEXT_BLOCK_RE.findall(body):
+            strings = [_unescape(raw) for raw in STRING_RE.findall(block)]
+            if strings:
+                lines.append(b''.join(strings).decode('latin-1'))
+    return '\n'.join(lines)
+
+
+def extract_text(path, max_chars=None):
+    """Text of the PDF at `path` ('' if it has none or can't be read).
+
+    Runs in pool worker processes, so it must not touch the database.
+    """
+    try:
+        if PdfReader is not None:
+            reader = PdfReader(path)
+            text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+        else:
+            with open(path, 'rb') as f:
+                text = _extract_basic(f.read())
+    except Exception as e:
+        logger.warning(f"Text extraction failed for {path}: {str(e)}")
+        return ''
+    text = ' '.join(text.split())
+    return text[:max_chars] if max_chars else text
+
+
+def extract_files(paths, max_chars=None):
+    """Join the text of several files (a paper and its attachments)"""
+    parts = [extract_text(path, max_chars) for path in paths if path.lower().endswith('.pdf')]
+    text = '\n'.join(part for part in parts if part)
+    return text[:max_chars] if max_chars else text
+
+
+def paper_files(paper):
+    """Local paths of a paper's own file and its attachments"""
+    files = [paper.file] + [attachment.file for attachment in paper.attachments.all()]
+    paths = []
+    for field_file in files:
+        if not field_file:
+            continue
+        try:
+            paths.append(field_file.path)
+        except NotImplementedError:
+            # Remote storage without local paths; nothing to read here
+            continue
+    return paths
+
+
+def file_signature(paths):
+    """Hash of names and sizes; a changed or added file changes it"""
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = -1
+        digest.update(f'{path}:{size}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def max_chars():
+    return getattr(settings, 'PAPERS_TEXT_MAX_CHARS', 200000)
+
+
+def store_text(paper_id, text, signature):
+    """Save extracted text and refresh the paper in the search index.
+
+    Skipped if the paper's files no longer match `signature`: the text is
+    from an older extraction finishing after a newer one was scheduled.
+    """
+    from .models import PastPaper, PaperText
+    from .search import get_backend
+
+    paper = PastPaper.objects.filter(pk=paper_id).first()
+    if paper is None:
+        return
+    if file_signature(paper_files(paper)) != signature:
+        logger.info(f"Discarding outdated text for paper {paper_id}")
+        return
+    with transaction.atomic():
+        record = PaperText(paper=paper, signature=signature)
+        record.content = text
+        record.save()
+        get_backend().index(paper)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool shared by every request in this worker.
+
+    Workers are spawned rather than forked: web workers already run the
+    flusher threads, and forking a threaded process can deadlock the child.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PAPERS_EXTRACT_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _finish(paper_id, signature, future):
+    """Runs on the pool's result thread once a paper has been extracted"""
+    try:
+        store_text(paper_id, future.result(), signature)
+    except Exception as e:
+        logger.error(f"Storing extracted text for paper {paper_id} failed: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def schedule_extraction(paper):
+    """Extract a paper's text according to PAPERS_TEXT_EXTRACTION.
+
+    'async' (the default) hands the files to the process pool and
+    stores the result when it arrives, 'sync' extracts in-process and
+    'off' does nothing.
+    """
+    mode = getattr(settings, 'PAPERS_TEXT_EXTRACTION', 'async')
+    if mode == 'off':
+        return
+    paths = paper_files(paper)
+    signature = file_signature(paths)
+    if mode == 'sync':
+        store_text(paper.pk, extract_files(paths, max_chars()), signature)
+        return
+    future = get_pool().submit(extract_files, paths, max_chars())
+    future.add_done_callback(lambda f: _finish(paper.pk, signature, f))
+
+
+# Paper ids waiting for a commit, per thread
+_pending = threading.local()
+
+
+def extract_on_commit(paper):
+    """Schedule extraction once the current transaction commits.
+
+    A paper saved together with its attachments (as the admin does) is
+    only extracted once per transaction: the first of its callbacks takes
+    the id out of the pending set and the others find it gone. Ids left
+    behind by a rolled-back transaction only wait for the next commit.
+    """
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    _pending.ids.add(paper.pk)
+
+    def run():
+        if paper.pk in _pending.ids:
+            _pending.ids.discard(paper.pk)
+            schedule_extraction(paper)
+    transaction.on_commit(run)
+
+
+def paper_texts(paper_ids):
+    """{paper id: text} for the papers that have extracted text"""
+    from .models import PaperText
+
+    return {
+        record.paper_id: record.content
+        for record in PaperText.objects.filter(paper_id__in=list(paper_ids))
+    }
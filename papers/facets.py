@@ -0,0 +1,170 @@
+# facets.py - Department/year/semester counts for the view_papers filters
+import hashlib
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .caching import get_cache, KEY_PREFIX, catalogue_version, acatalogue_version, bump_catalogue_version
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('department', 'year', 'semester')
+
+
+class Facet:
+    """One dropdown option: a value and how many papers carry it"""
+
+    def __init__(self, value, count):
+        self.value = value
+        self.count = count
+
+    @property
+    def label(self):
+        return f"{self.value} ({self.count:,})"
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return f"<Facet {self.label}>"
+
+
+def snapshot(paper, loaded_only=False):
+    """Facet values of a paper, as strings.
+
+    With `loaded_only`, deferred fields are left out instead of being
+    fetched, which keeps post_init free of queries for .only() loads.
+    """
+    if loaded_only:
+        return {field: str(paper.__dict__[field]) for field in FACET_FIELDS if field in paper.__dict__}
+    return {field: str(getattr(paper, field)) for field in FACET_FIELDS}
+
+
+def apply_deltas(deltas):
+    """Add `deltas` ({(facet, value): n}) to the stored counts"""
+    from .models import FacetCount
+
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for (facet, value), n in deltas.items():
+            updated = FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + n)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        FacetCount.objects.create(facet=facet, value=value, count=n)
+                except IntegrityError:
+                    # Another worker created the row first
+                    FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + n)
+    bump_catalogue_version()
+
+
+def record_change(old, new):
+    """Update counts for a paper moving from snapshot `old` to `new`.
+
+    Either side may be None for an insert or a delete. On an update only
+    fields present in both snapshots are compared.
+    """
+    deltas = Counter()
+    for field in FACET_FIELDS:
+        if old is not None and new is not None and (field not in old or field not in new):
+            continue
+        if old is not None:
+            deltas[(field, old[field])] -= 1
+        if new is not None:
+            deltas[(field, new[field])] += 1
+    apply_deltas(deltas)
+
+
+def record_created(papers):
+    """Count several newly created papers at once"""
+    deltas = Counter()
+    for paper in papers:
+        for field, value in snapshot(paper).items():
+            deltas[(field, value)] += 1
+    apply_deltas(deltas)
+
+
+def rebuild():
+    """Recompute every count from the PastPaper table"""
+    from .models import FacetCount, PastPaper
+
+    rows = []
+    for field in FACET_FIELDS:
+        for value, count in PastPaper.objects.order_by().values_list(field).annotate(n=Count('id')):
+            rows.append(FacetCount(facet=field, value=str(value), count=count))
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows)
+    bump_catalogue_version()
+    return len(rows)
+
+
+def _sorted(facets):
+    """Departments and semesters alphabetically, years newest first"""
+    result = {}
+    for field in FACET_FIELDS:
+        items = [Facet(value, count) for value, count in facets.get(field, {}).items() if count > 0]
+        if field == 'year':
+            items.sort(key=lambda f: int(f.value) if f.value.lstrip('-').isdigit() else 0, reverse=True)
+        else:
+            items.sort(key=lambda f: f.value)
+        result[field] = items
+    return result
+
+
+def _cache_key(version, queryset, search_key):
+    digest = hashlib.sha1(search_key.encode('utf-8')).hexdigest() if queryset is not None else 'all'
+    return f'{KEY_PREFIX}:facets:{version}:{digest}'
+
+
+def _grouped(queryset, field):
+    return queryset.order_by().values_list(field).annotate(n=Count('id'))
+
+
+def facet_counts(queryset=None, search_key=''):
+    """Return {field: [Facet, ...]} for the dropdowns.
+
+    Without a queryset the counts come from the denormalized FacetCount
+    table; with one they are restricted to it (one GROUP BY per facet).
+    Either way the result is cached under `search_key` until the
+    catalogue changes or PAPERS_FACET_CACHE_TIMEOUT passes.
+    """
+    from .models import FacetCount
+
+    cache = get_cache()
+    key = _cache_key(catalogue_version(), queryset, search_key)
+    facets = cache.get(key)
+    if facets is None:
+        facets = {}
+        if queryset is None:
+            for facet, value, count in FacetCount.objects.values_list('facet', 'value', 'count'):
+                facets.setdefault(facet, {})[value] = count
+        else:
+            for field in FACET_FIELDS:
+                facets[field] = {str(value): count for value, count in _grouped(queryset, field)}
+        cache.set(key, facets, timeout=getattr(settings, 'PAPERS_FACET_CACHE_TIMEOUT', 60))
+    return _sorted(facets)
+
+
+async def afacet_counts(queryset=None, search_key=''):
+    """facet_counts() for async views, through the async ORM"""
+    from .models import FacetCount
+
+    cache = get_cache()
+    key = _cache_key(await acatalogue_version(), queryset, search_key)
+    facets = await cache.aget(key)
+    if facets is None:
+        facets = {}
+        if queryset is None:
+            async for facet, value, count in FacetCount.objects.values_list('facet', 'value', 'count'):
+                facets.setdefault(facet, {})[value] = count
+        else:
+            for field in FACET_FIELDS:
+                facets[field] = {str(value): count async for value, count in _grouped(queryset, field)}
+        await cache.aset(key, facets, timeout=getattr(settings, 'PAPERS_FACET_CACHE_TIMEOUT', 60))
+    return _sorted(facets)
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.db.models.functions import Lower
 from .models import Profile
 
 
@@ -15,6 +16,13 @@ class SignUpForm(UserCreationForm):
         model = User
         fields = ('username', 'email', 'password1', 'password2')
 
+    def clean_email(self):
+        # Emails log users in too, so each may belong to one account only
+        email = self.cleaned_data['email']
+        if User.objects.alias(email_lower=Lower('email')).filter(email_lower=email.lower()).exists():
+            raise forms.ValidationError("An account with this email already exists.")
+        return email
+
     def save(self, commit=True):
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
@@ -0,0 +1,82 @@
+# history.py - Per-user download history
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .caching import bump_data_version
+from .models import Download, DownloadEvent, PastPaper
+
+logger = logging.getLogger(__name__)
+
+
+def full_history_enabled():
+    return getattr(settings, 'PAPERS_DOWNLOAD_HISTORY', 'latest') == 'full'
+
+
+def write_downloads(events):
+    """Persist (user_id, paper_id, time) tuples, returning the number written.
+
+    Every event is appended to DownloadEvent, and the Download row per
+    (user, paper) is upserted so it carries the latest download time.
+    Events whose paper or user was deleted since are dropped, so they
+    can't fail the foreign-key check for the whole batch.
+    """
+    events = _existing(events)
+    if not events:
+        return 0
+    DownloadEvent.objects.bulk_create([
+        DownloadEvent(user_id=user_id, paper_id=paper_id, downloaded_at=when)
+        for user_id, paper_id, when in events
+    ])
+
+    latest = {}
+    for user_id, paper_id, when in events:
+        key = (user_id, paper_id)
+        if key not in latest or when > latest[key]:
+            latest[key] = when
+    Download.objects.bulk_create(
+        [Download(user_id=user_id, paper_id=paper_id, downloaded_at=when)
+         for (user_id, paper_id), when in latest.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'paper'],
+        update_fields=['downloaded_at'],
+    )
+    # Cached history counts are versioned by these models
+    bump_data_version(Download, DownloadEvent)
+    return len(events)
+
+
+def _existing(events):
+    """The events whose user and paper still exist"""
+    paper_ids = set(PastPaper.objects.filter(
+        pk__in={paper_id for _, paper_id, _ in events},
+    ).values_list('pk', flat=True))
+    user_ids = set(get_user_model()._default_manager.filter(
+        pk__in={user_id for user_id, _, _ in events},
+    ).values_list('pk', flat=True))
+    kept = [event for event in events if event[0] in user_ids and event[1] in paper_ids]
+    if len(kept) < len(events):
+        logger.warning(f"Dropped {len(events) - len(kept)} download events for deleted papers or users")
+    return kept
+
+
+def record_download(user, paper, when=None):
+    """Write a single download straight away (bypassing the event buffer)"""
+    write_downloads([(user.pk, paper.pk, when or timezone.now())])
+
+
+def user_history(user, full=False):
+    """Downloads of `user`, newest first, with their papers joined in.
+
+    Starts from the user's own rows (index on user, -downloaded_at), so
+    the cost doesn't depend on how popular the papers are. `full` reads
+    every repeat download from DownloadEvent instead of the latest one.
+    """
+    model = DownloadEvent if full else Download
+    return (
+        model.objects.filter(user=user)
+        .select_related('paper', 'paper__user')
+        .order_by('-downloaded_at', '-id')
+    )
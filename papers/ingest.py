@@ -0,0 +1,167 @@
+# ingest.py - Shared bulk ingestion for the upload view and the admin
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import PastPaper
+
+logger = logging.getLogger(__name__)
+
+# Sent after bulk_create, which bypasses post_save; `papers` is the list
+# of newly created PastPaper rows.
+papers_bulk_created = Signal()
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+ERROR = 'error'
+
+
+class IngestItem:
+    """One uploaded file plus the metadata that differs per file"""
+
+    def __init__(self, file, title, course_code):
+        self.file = file
+        self.title = (title or '').strip()
+        self.course_code = (course_code or '').strip()
+
+
+class IngestResult:
+    def __init__(self, item, status, message='', paper=None):
+        self.item = item
+        self.status = status
+        self.message = message
+        self.paper = paper
+
+    @property
+    def filename(self):
+        return self.item.file.name
+
+
+class IngestReport:
+    """Per-file outcome of an ingestion run, in upload order"""
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def created(self):
+        return [result.paper for result in self.results if result.status == CREATED]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.status != CREATED]
+
+    def __len__(self):
+        return len(self.results)
+
+
+def ingest_papers(items, department, year, semester, user, max_workers=None):
+    """Create a PastPaper for each IngestItem sharing department/year/semester.
+
+    Duplicates (against unique_together and within the batch) are found in
+    one query, files are written to storage concurrently, and the rows are
+    inserted with a single bulk_create. Returns an IngestReport.
+    """
+    year = int(year)
+    results = [None] * len(items)
+    candidates = []
+
+    for index, item in enumerate(items):
+        if not item.file.name.lower().endswith('.pdf'):
+            results[index] = IngestResult(item, INVALID, f'File "{item.file.name}" is not a PDF.')
+        elif not item.course_code or not item.title:
+            results[index] = IngestResult(
+                item, INVALID, f'Skipped file "{item.file.name}" - missing course code or title.'
+            )
+        else:
+            candidates.append(index)
+
+    # One query for every (title, course_code) already stored this term
+    existing = set(
+        PastPaper.objects.filter(
+            year=year,
+            semester=semester,
+            title__in={items[i].title for i in candidates},
+            course_code__in={items[i].course_code for i in candidates},
+        ).order_by().values_list('title', 'course_code')
+    ) if candidates else set()
+
+    pending = []
+    for index in candidates:
+        item = items[index]
+        key = (item.title, item.course_code)
+        if key in existing:
+            results[index] = IngestResult(item, DUPLICATE, f'Duplicate paper: "{item.title}".')
+            continue
+        existing.add(key)
+        paper = PastPaper(
+            title=item.title,
+            course_code=item.course_code,
+            department=department,
+            year=year,
+            semester=semester,
+            user=user,
+        )
+        pending.append((index, paper))
+
+    errors = _store_files(items, pending, max_workers)
+
+    papers = []
+    for index, paper in pending:
+        error = errors.get(index)
+        if error is not None:
+            results[index] = IngestResult(items[index], ERROR, f'Error storing "{items[index].file.name}": {error}')
+        else:
+            papers.append((index, paper))
+
+    try:
+        with transaction.atomic():
+            created = PastPaper.objects.bulk_create([paper for _, paper in papers])
+    except Exception as e:
+        logger.error(f"Bulk ingest error: {str(e)}")
+        for index, paper in papers:
+            paper.file.storage.delete(paper.file.name)
+            results[index] = IngestResult(items[index], ERROR, f'Error during upload: {str(e)}')
+        return IngestReport(results)
+
+    for index, paper in papers:
+        results[index] = IngestResult(items[index], CREATED, paper=paper)
+        logger.info(f"Bulk uploaded: {paper.title} by {user.username}")
+
+    if created:
+        papers_bulk_created.send(sender=PastPaper, papers=created)
+    return IngestReport(results)
+
+
+def _store_files(items, pending, max_workers):
+    """Write uploads to storage on a thread pool; returns {index: error}"""
+    max_workers = max_workers or getattr(settings, 'PAPERS_INGEST_WORKERS', 4)
+
+    def store(index, paper):
+        upload = items[index].file
+        field = paper.file.field
+        stored_name = getattr(upload, 'stored_name', None)
+        if stored_name:
+            # Finished chunked uploads are already in storage
+            paper.file.name = stored_name
+        else:
+            name = field.generate_filename(paper, upload.name)
+            paper.file.name = field.storage.save(name, upload, max_length=field.max_length)
+        paper.file._committed = True
+
+    errors = {}
+    if not pending:
+        return errors
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+        futures = {executor.submit(store, index, paper): index for index, paper in pending}
+        for future, index in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Storing upload failed: {str(e)}")
+                errors[index] = e
+    return errors
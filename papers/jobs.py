@@ -0,0 +1,158 @@
+# jobs.py - Database-backed queue for processing uploads in the background
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .ingest import IngestItem, ingest_papers, ERROR
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = 'staging'
+
+
+def background_uploads_enabled():
+    return getattr(settings, 'PAPERS_BACKGROUND_UPLOADS', False)
+
+
+def enqueue_upload(user, items, department, year, semester):
+    """Stage the uploaded files and queue an UploadJob for the worker.
+
+    Only the raw bytes are written here; validation against the database,
+    final storage and row creation all happen in the worker.
+    """
+    token = uuid.uuid4().hex
+    staged = []
+    for item in items:
+        name = os.path.basename(item.file.name)
+        path = default_storage.save(f'{STAGING_DIR}/{token}/{name}', item.file)
+        staged.append({
+            'path': path,
+            'name': name,
+            'title': item.title,
+            'course_code': item.course_code,
+        })
+
+    return UploadJob.objects.create(
+        user=user,
+        payload={
+            'department': department,
+            'year': int(year),
+            'semester': semester,
+            'items': staged,
+        },
+    )
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running and return it.
+
+    The claim is a conditional UPDATE, so several workers can poll the
+    same table without locking it; whoever updates the row owns the job.
+    """
+    for job_id in UploadJob.objects.filter(status=UploadJob.PENDING).values_list('pk', flat=True)[:5]:
+        claimed = UploadJob.objects.filter(pk=job_id, status=UploadJob.PENDING).update(
+            status=UploadJob.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return UploadJob.objects.get(pk=job_id)
+    return None
+
+
+def discard_staged(job):
+    """Delete a finished job's staged files and their folder"""
+    items = job.payload.get('items', [])
+    for staged in items:
+        try:
+            default_storage.delete(staged['path'])
+        except Exception as e:
+            logger.warning(f"Could not delete staged file {staged['path']}: {str(e)}")
+    folders = {os.path.dirname(staged['path']) for staged in items}
+    for folder in folders:
+        try:
+            os.rmdir(default_storage.path(folder))
+        except (NotImplementedError, OSError):
+            # Remote storage has no folders; a non-empty one is left alone
+            pass
+
+
+def requeue_stale_jobs(timeout=None):
+    """Put back jobs whose worker died mid-run; returns how many.
+
+    Jobs out of attempts fail instead, and their staged files are deleted.
+    """
+    timeout = timeout or getattr(settings, 'PAPERS_JOB_TIMEOUT', 600)
+    max_attempts = getattr(settings, 'PAPERS_JOB_MAX_ATTEMPTS', 3)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = UploadJob.objects.filter(status=UploadJob.RUNNING, started_at__lt=cutoff)
+    for job in stale.filter(attempts__gte=max_attempts):
+        # Conditional, like claim_next_job, in case the worker finishes now
+        failed = UploadJob.objects.filter(pk=job.pk, status=UploadJob.RUNNING).update(
+            status=UploadJob.FAILED, error='Worker timed out', finished_at=timezone.now()
+        )
+        if failed:
+            discard_staged(job)
+    return stale.update(status=UploadJob.PENDING, started_at=None)
+
+
+def run_job(job):
+    """Ingest a claimed job's staged files and record the outcome"""
+    payload = job.payload
+    job.attempts += 1
+    job.save(update_fields=['attempts'])
+
+    opened = []
+    try:
+        items = []
+        for staged in payload['items']:
+            handle = default_storage.open(staged['path'], 'rb')
+            opened.append(handle)
+            items.append(IngestItem(File(handle, name=staged['name']), staged['title'], staged['course_code']))
+
+        report = ingest_papers(items, payload['department'], payload['year'], payload['semester'], job.user)
+    except Exception as e:
+        logger.error(f"Upload job {job.pk} failed: {str(e)}")
+        job.status = UploadJob.FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        report = None
+    finally:
+        for handle in opened:
+            handle.close()
+
+    # Failed or done, the job won't run again
+    discard_staged(job)
+    if report is None:
+        return job
+
+    job.status = UploadJob.DONE
+    job.result = {
+        'created': len(report.created),
+        'messages': [
+            {'level': 'error' if result.status == ERROR else 'warning', 'message': result.message}
+            for result in report.failed
+        ],
+    }
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'finished_at'])
+    logger.info(f"Upload job {job.pk} created {len(report.created)} papers")
+    return job
+
+
+def job_status(job):
+    """JSON-friendly summary polled by upload.html"""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'created': job.result.get('created', 0),
+        'messages': job.result.get('messages', []),
+        'error': job.error,
+        'total': len(job.payload.get('items', [])),
+    }
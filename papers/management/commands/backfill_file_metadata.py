@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from papers import metadata
+from papers.models import PastPaper, PastPaperAttachment
+
+
+class Command(BaseCommand):
+    help = "Record size, page count, checksum and MIME type for existing paper files in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'PAPERS_EXTRACT_WORKERS', 2))
+        parser.add_argument('--all', action='store_true',
+                            help="Rescan files that already have metadata")
+        parser.add_argument('--progress-every', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # Each distinct stored file is read once, however many rows share it
+        rows = {}
+        for model in (PastPaper, PastPaperAttachment):
+            files = model.objects.exclude(file='')
+            if not options['all']:
+                files = files.filter(Q(file_size__isnull=True) | Q(checksum=''))
+            for name in files.order_by().values_list('file', flat=True).distinct():
+                rows.setdefault(name, []).append(model)
+
+        total = len(rows)
+        if not total:
+            self.stdout.write(self.style.SUCCESS("All files have metadata."))
+            return
+        self.stdout.write(f"Scanning {total} files with {options['workers']} workers...")
+
+        storage = PastPaper._meta.get_field('file').storage
+        done = failed = updated = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(metadata.scan_path, storage.path(name)): name for name in rows}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    values = future.result()
+                except Exception as e:
+                    values = None
+                    self.stderr.write(f"{name}: {str(e)}")
+                if values is None:
+                    failed += 1
+                else:
+                    for model in rows[name]:
+                        updated += model.objects.filter(file=name).update(**values)
+                done += 1
+                if done % options['progress_every'] == 0 or done == total:
+                    self.stdout.write(f"  {done}/{total} files scanned")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded metadata for {updated} rows from {done - failed} files ({failed} unreadable)."
+        ))
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from papers import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent-connection throughput of ASGI (async views) and WSGI (sync views)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help=f"Scenarios to run (default all): {', '.join(benchmarks.SERVER_SCENARIOS)}")
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Requests per scenario and server")
+        parser.add_argument('--slow-client-ms', type=float, default=0,
+                            help="Delay before each response body chunk is taken, like a slow download")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmarks.compare_servers(
+                options['scenarios'], concurrency=options['concurrency'], requests=options['requests'],
+                slow_client_ms=options['slow_client_ms'], log=self.stdout.write,
+            )
+        except LookupError as e:
+            raise CommandError(e.args[0])
+
+        if options['output']:
+            benchmarks.write_results(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from papers.profiles import ensure_profiles
+
+
+class Command(BaseCommand):
+    help = "Create profiles in bulk for users that have none (e.g. after an import or loaddata)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = ensure_profiles(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} profiles."))
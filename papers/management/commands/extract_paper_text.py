@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from papers import extraction
+from papers.models import PastPaper, PaperText
+
+
+class Command(BaseCommand):
+    help = "Extract searchable text from existing paper files in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'PAPERS_EXTRACT_WORKERS', 2))
+        parser.add_argument('--all', action='store_true',
+                            help="Re-extract papers whose files haven't changed")
+        parser.add_argument('--progress-every', type=int, default=100)
+
+    def handle(self, *args, **options):
+        papers = PastPaper.objects.prefetch_related('attachments').order_by('pk')
+        stored = dict(PaperText.objects.values_list('paper_id', 'signature'))
+        jobs = []
+        for paper in papers.iterator(chunk_size=500):
+            paths = extraction.paper_files(paper)
+            signature = extraction.file_signature(paths)
+            if options['all'] or stored.get(paper.pk) != signature:
+                jobs.append((paper.pk, paths, signature))
+
+        total = len(jobs)
+        if not total:
+            self.stdout.write(self.style.SUCCESS("All papers are up to date."))
+            return
+        self.stdout.write(f"Extracting text from {total} papers with {options['workers']} workers...")
+
+        done = failed = 0
+        limit = extraction.max_chars()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(extraction.extract_files, paths, limit): (paper_id, signature)
+                for paper_id, paths, signature in jobs
+            }
+            for future in as_completed(futures):
+                paper_id, signature = futures[future]
+                try:
+                    extraction.store_text(paper_id, future.result(), signature)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Paper {paper_id}: {str(e)}")
+                done += 1
+                if done % options['progress_every'] == 0 or done == total:
+                    self.stdout.write(f"  {done}/{total} papers processed")
+
+        self.stdout.write(self.style.SUCCESS(f"Extracted text for {done - failed} papers ({failed} failed)."))
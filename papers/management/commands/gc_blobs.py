@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from papers import chunked, storage
+
+
+class Command(BaseCommand):
+    help = "Delete stored files that no paper or attachment refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None,
+                            help="Seconds a blob must be unused (default PAPERS_BLOB_GC_GRACE_SECONDS)")
+        parser.add_argument('--recount', action='store_true',
+                            help="Recompute reference counts from the database first")
+        parser.add_argument('--adopt', action='store_true',
+                            help="Move files stored before deduplication into blobs first")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['adopt']:
+            rows, removed = storage.adopt_legacy_files(dry_run=dry_run)
+            self.stdout.write(f"Adopted files for {rows} rows, removed {removed} duplicate copies.")
+        if options['recount'] and not dry_run:
+            blobs = storage.recount()
+            self.stdout.write(f"Recounted references to {blobs} blobs.")
+
+        if not dry_run:
+            expired = chunked.expire_uploads()
+            self.stdout.write(f"Expired {expired} abandoned chunked uploads.")
+
+        removed, freed = storage.collect_garbage(options['grace'], dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed} unreferenced files ({freed / (1024 * 1024):.1f} MB)."
+        ))
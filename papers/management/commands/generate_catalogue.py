@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from papers import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Create a synthetic catalogue of bench_* users, papers and downloads for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--papers', type=int, default=5000)
+        parser.add_argument('--events', type=int, default=50000,
+                            help="Download events spread over the last 90 days")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Same seed, same catalogue")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete the existing bench_* users and their papers first")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = benchmarks.clear_catalogue()
+            self.stdout.write(f"Deleted {deleted} rows from the previous catalogue.")
+        counts = benchmarks.generate_catalogue(
+            users=options['users'], papers=options['papers'], events=options['events'],
+            seed=options['seed'], batch_size=options['batch_size'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['users']} users, {counts['papers']} papers and {counts['events']} download events."
+        ))
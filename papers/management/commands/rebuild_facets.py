@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from papers import facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the department/year/semester facet counts"
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} facet counts."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from papers.models import PastPaper
+from papers.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for past papers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = get_backend(options['database'])
+        self.stdout.write(f"Rebuilding search index with {type(backend).__name__}...")
+
+        backend.install()
+
+        batch = []
+        total = 0
+        with transaction.atomic(using=options['database']):
+            backend.clear()
+            papers = PastPaper.objects.using(options['database']).order_by('pk')
+            for paper in papers.iterator(chunk_size=batch_size):
+                batch.append(paper)
+                if len(batch) >= batch_size:
+                    backend.index_many(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                backend.index_many(batch)
+                total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} papers."))
@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from papers import thumbnails
+from papers.models import PastPaper
+
+
+class Command(BaseCommand):
+    help = "Render first-page thumbnails for papers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help="Only render papers that have no cached thumbnail")
+        parser.add_argument('--clear', action='store_true',
+                            help="Empty the thumbnail cache first")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            thumbnails.clear()
+            self.stdout.write("Cleared the thumbnail cache.")
+
+        rendered = skipped = failed = 0
+        for paper in PastPaper.objects.exclude(file='').order_by('pk').iterator():
+            key = thumbnails.content_key(paper.file)
+            if key is None:
+                failed += 1
+                self.stderr.write(f"Paper {paper.pk}: file missing")
+                continue
+            path = thumbnails.thumbnail_path(key)
+            if os.path.exists(path):
+                if options['missing']:
+                    skipped += 1
+                    continue
+                os.remove(path)
+            try:
+                thumbnails.get_thumbnail(paper, key)
+                rendered += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Paper {paper.pk}: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} thumbnails ({skipped} up to date, {failed} failed)."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from papers import rollups
+from papers.events import download_events
+
+
+class Command(BaseCommand):
+    help = "Aggregate new download events into hourly and daily rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help="Events aggregated per transaction")
+        parser.add_argument('--prune', action='store_true',
+                            help="Delete rolled-up events older than PAPERS_DOWNLOAD_EVENT_RETENTION_DAYS")
+
+    def handle(self, *args, **options):
+        download_events.flush()
+        processed = rollups.roll_up(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} download events."))
+        if options['prune']:
+            deleted = rollups.prune_events()
+            self.stdout.write(f"Pruned {deleted} old events.")
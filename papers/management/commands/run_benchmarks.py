@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from papers import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time the main pages against the benchmark catalogue and record the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help=f"Scenarios to run (default all): {', '.join(benchmarks.SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help="Fail if slower than this earlier results file")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed slowdown before --compare fails (0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmarks.run_benchmarks(
+                options['scenarios'], iterations=options['iterations'], warmup=options['warmup'],
+                log=self.stdout.write,
+            )
+        except LookupError as e:
+            raise CommandError(e.args[0])
+
+        if options['output']:
+            benchmarks.write_results(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if options['compare']:
+            regressions = benchmarks.compare(
+                benchmarks.read_results(options['compare']), results, options['threshold']
+            )
+            if regressions:
+                raise CommandError("Regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
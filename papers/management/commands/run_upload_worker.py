@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from papers.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued background uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Upload worker started.")
+        while True:
+            close_old_connections()
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs."))
+
+            job = claim_next_job()
+            if job is None:
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            job = run_job(job)
+            if job.status == job.DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Job {job.pk}: created {job.result.get('created', 0)} papers."
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.pk} failed: {job.error}"))
+
+        self.stdout.write("Upload worker finished.")
@@ -0,0 +1,133 @@
+# metadata.py - Size, page count, checksum and type of stored files
+import hashlib
+import logging
+import mimetypes
+import re
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Model columns filled from a FileScanner, in PaperFileField order
+FIELDS = ('file_size', 'page_count', 'checksum', 'mime_type')
+
+PAGE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+# Long enough to hold any PAGE_RE or COUNT_RE match split across chunks
+OVERLAP = 64
+MAGIC = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'PK\x03\x04', 'application/zip'),
+]
+READ_BLOCK = 1024 * 1024
+# Column values for a missing or unreadable file
+EMPTY = {'file_size': None, 'page_count': None, 'checksum': '', 'mime_type': ''}
+
+
+class FileScanner:
+    """Collects a file's metadata from its chunks, in a single pass.
+
+    Fed by the storage while an upload is being written, so nothing is
+    read back from disk. Page counts come from the page tree's /Count
+    (or the number of /Type /Page objects); PDFs that keep their page
+    tree in compressed object streams get None.
+    """
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self._head = b''
+        self._tail = b''
+        self.size = 0
+        self.pages = 0
+        self.max_count = 0
+
+    def update(self, chunk):
+        self._sha.update(chunk)
+        self.size += len(chunk)
+        if len(self._head) < 16:
+            self._head += chunk[:16 - len(self._head)]
+        data = self._tail + chunk
+        start = len(self._tail)
+        # Matches ending inside the overlap were counted with the last chunk
+        self.pages += sum(1 for match in PAGE_RE.finditer(data) if match.end() > start)
+        for match in COUNT_RE.finditer(data):
+            if match.end() > start:
+                self.max_count = max(self.max_count, int(match.group(1)))
+        self._tail = data[-OVERLAP:]
+
+    def mime_type(self, name=''):
+        for magic, mime_type in MAGIC:
+            if self._head.startswith(magic):
+                return mime_type
+        return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    def metadata(self, name=''):
+        """{column: value} for the model's metadata fields"""
+        mime_type = self.mime_type(name)
+        page_count = None
+        if mime_type == 'application/pdf':
+            page_count = self.max_count or self.pages or None
+        return {
+            'file_size': self.size,
+            'page_count': page_count,
+            'checksum': self._sha.hexdigest(),
+            'mime_type': mime_type,
+        }
+
+
+def scan_file(f, name=''):
+    """Metadata of an open binary file, read in blocks"""
+    scanner = FileScanner()
+    for chunk in iter(lambda: f.read(READ_BLOCK), b''):
+        scanner.update(chunk)
+    return scanner.metadata(name)
+
+
+def scan_path(path):
+    """Metadata of the file at `path`, or None if it can't be read.
+
+    A top-level function so the backfill command can run it in worker
+    processes.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return scan_file(f, path)
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {str(e)}")
+        return None
+
+
+# Metadata gathered while saving, by stored name, for the field to write
+# to the row. Only content-addressed names are remembered, so an entry
+# can't go stale: the name always means the same bytes.
+_scanned = OrderedDict()
+_scanned_lock = threading.Lock()
+SCANNED_LIMIT = 1024
+
+
+def remember(name, metadata):
+    with _scanned_lock:
+        _scanned[name] = metadata
+        _scanned.move_to_end(name)
+        while len(_scanned) > SCANNED_LIMIT:
+            _scanned.popitem(last=False)
+
+
+def recall(name):
+    with _scanned_lock:
+        return _scanned.get(name)
+
+
+def field_metadata(field_file):
+    """Metadata for a FieldFile: from the save that stored it, or by reading it"""
+    metadata = recall(field_file.name)
+    if metadata is not None:
+        return metadata
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as f:
+            return scan_file(f, field_file.name)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read {field_file.name} for metadata: {str(e)}")
+        return dict(EMPTY)
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from papers.search import get_backend
+
+    backend = get_backend(schema_editor.connection.alias)
+    backend.install()
+    PastPaper = apps.get_model('papers', 'PastPaper')
+    backend.index_many(PastPaper.objects.using(schema_editor.connection.alias).iterator())
+
+
+def drop_search_index(apps, schema_editor):
+    from papers.search import get_backend
+
+    get_backend(schema_editor.connection.alias).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0008_download'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0010_uploadjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='download',
+            index=models.Index(fields=['user', '-downloaded_at'], name='download_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['-uploaded_at'], name='paper_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['department', '-uploaded_at'], name='paper_dept_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['year', '-uploaded_at'], name='paper_year_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['department', 'year'], name='paper_dept_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['title'], name='paper_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(fields=['-download_count'], name='paper_downloads_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pastpaper',
+            index=models.Index(condition=models.Q(('file', ''), _negated=True), fields=['-uploaded_at'], name='paper_with_file_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:08
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_facet_counts(apps, schema_editor):
+    PastPaper = apps.get_model('papers', 'PastPaper')
+    FacetCount = apps.get_model('papers', 'FacetCount')
+    rows = []
+    for field in ('department', 'year', 'semester'):
+        for value, count in PastPaper.objects.order_by().values_list(field).annotate(n=Count('id')):
+            rows.append(FacetCount(facet=field, value=str(value), count=count))
+    FacetCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0011_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('department', 'Department'), ('year', 'Year'), ('semester', 'Semester')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['facet', 'value'],
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0012_facetcount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='download',
+            name='downloaded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='DownloadEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('downloaded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('paper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='download_events', to='papers.pastpaper')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='download_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-downloaded_at'],
+                'indexes': [models.Index(fields=['user', '-downloaded_at'], name='event_user_recent_idx'), models.Index(fields=['paper', 'downloaded_at'], name='event_paper_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:23
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Index columns as of this migration: metadata, then extracted text
+INDEXED_FIELDS = ('title', 'course_code', 'department', 'year')
+
+
+def rebuild_search_index(apps, schema_editor):
+    """Recreate the index with a content column and refill it"""
+    from papers.search import get_backend
+
+    alias = schema_editor.connection.alias
+    backend = get_backend(alias)
+    backend.uninstall()
+    backend.install()
+
+    # Rows come from the historical models, not the app's current ones
+    PastPaper = apps.get_model('papers', 'PastPaper')
+    PaperText = apps.get_model('papers', 'PaperText')
+    texts = {
+        paper_id: zlib.decompress(data).decode('utf-8') if data else ''
+        for paper_id, data in PaperText.objects.using(alias).values_list('paper_id', 'data')
+    }
+    backend.write_rows([
+        (paper.pk, *(str(getattr(paper, field)) for field in INDEXED_FIELDS), texts.get(paper.pk, ''))
+        for paper in PastPaper.objects.using(alias).iterator()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0014_download_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaperText',
+            fields=[
+                ('paper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='papers.pastpaper')),
+                ('data', models.BinaryField()),
+                ('signature', models.CharField(max_length=40)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
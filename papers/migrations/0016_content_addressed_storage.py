@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+import papers.models
+import papers.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0015_paper_text'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pastpaper',
+            name='file',
+            field=models.FileField(storage=papers.storage.paper_storage, upload_to=papers.models.user_profile_image_path),
+        ),
+        migrations.AlterField(
+            model_name='pastpaperattachment',
+            name='file',
+            field=models.FileField(storage=papers.storage.paper_storage, upload_to=papers.models.user_profile_image_path),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'released_at'], name='blob_orphan_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_file_sizes(apps, schema_editor):
+    """Record the size of every existing paper file (None if it's missing)"""
+    PastPaper = apps.get_model('papers', 'PastPaper')
+    papers = (
+        PastPaper.objects.using(schema_editor.connection.alias)
+        .exclude(file='').filter(file_size__isnull=True).only('pk', 'file')
+    )
+    batch = []
+    for paper in papers.iterator(chunk_size=BATCH_SIZE):
+        try:
+            paper.file_size = paper.file.size
+        except (OSError, ValueError):
+            continue
+        batch.append(paper)
+        if len(batch) >= BATCH_SIZE:
+            PastPaper.objects.using(schema_editor.connection.alias).bulk_update(batch, ['file_size'])
+            batch = []
+    PastPaper.objects.using(schema_editor.connection.alias).bulk_update(batch, ['file_size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0017_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pastpaper',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_file_sizes, migrations.RunPython.noop),
+    ]
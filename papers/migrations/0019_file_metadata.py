@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:53
+
+import papers.models
+import papers.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers', '0018_file_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pastpaper',
+            name='checksum',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pastpaper',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='pastpaper',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pastpaperattachment',
+            name='checksum',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pastpaperattachment',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pastpaperattachment',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='pastpaperattachment',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='pastpaper',
+            name='file',
+            field=papers.models.PaperFileField(storage=papers.storage.paper_storage, upload_to=papers.models.user_profile_image_path),
+        ),
+        migrations.AlterField(
+            model_name='pastpaperattachment',
+            name='file',
+            field=papers.models.PaperFileField(storage=papers.storage.paper_storage, upload_to=papers.models.user_profile_image_path),
+        ),
+    ]
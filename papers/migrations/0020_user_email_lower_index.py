@@ -0,0 +1,37 @@
+from django.db import migrations
+
+INDEX_NAME = 'papers_user_email_lower_idx'
+
+
+def create_index(apps, schema_editor):
+    """Index LOWER(email) on the user table for case-insensitive logins"""
+    User = apps.get_model('auth', 'User')
+    quote = schema_editor.quote_name
+    expression = 'LOWER(email)'
+    if schema_editor.connection.vendor == 'mysql':
+        # MySQL wants functional key parts in their own parentheses
+        expression = f'({expression})'
+    schema_editor.execute(
+        f'CREATE INDEX {quote(INDEX_NAME)} ON {quote(User._meta.db_table)} ({expression})'
+    )
+
+
+def drop_index(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {quote(INDEX_NAME)} ON {quote(User._meta.db_table)}')
+    else:
+        schema_editor.execute(f'DROP INDEX {quote(INDEX_NAME)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('papers', '0019_file_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
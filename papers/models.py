@@ -3,6 +3,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 import os
+import uuid
+import zlib
+
+from .storage import paper_storage, is_blob
+from . import metadata
 
 
 def user_profile_image_path(instance, filename):
@@ -10,6 +15,27 @@ def user_profile_image_path(instance, filename):
     return f'papers/{instance.department}/{instance.year}/{instance.semester}/{filename}'
 
 
+class PaperFileField(models.FileField):
+    """FileField that fills the model's metadata columns when the file changes.
+
+    Runs after the upload has been committed to storage, whose scan of
+    the bytes is reused, so the columns go out in the same INSERT or
+    UPDATE (bulk_create included). The columns, metadata.FIELDS, must
+    be declared after this field.
+    """
+
+    def pre_save(self, model_instance, add):
+        field_file = super().pre_save(model_instance, add)
+        name = field_file.name or ''
+        # _stored_file is the name the row was loaded with (see signals)
+        if name == getattr(model_instance, '_stored_file', None) and model_instance.file_size is not None:
+            return field_file
+        values = metadata.field_metadata(field_file) if name else metadata.EMPTY
+        for column, value in values.items():
+            setattr(model_instance, column, value)
+        return field_file
+
+
 class PastPaper(models.Model):
     SEMESTER_CHOICES = [
         ('Fall', 'Fall'),
@@ -32,14 +58,30 @@ class PastPaper(models.Model):
     department = models.CharField(max_length=100, choices=DEPARTMENT_CHOICES)
     year = models.IntegerField()
     semester = models.CharField(max_length=10, choices=SEMESTER_CHOICES)
-    file = models.FileField(upload_to=user_profile_image_path)
+    file = PaperFileField(upload_to=user_profile_image_path, storage=paper_storage)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     download_count = models.PositiveIntegerField(default=0)
+    # About `file`, recorded on upload so listings never touch the disk
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    checksum = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    mime_type = models.CharField(max_length=100, blank=True, editable=False)
 
     class Meta:
         ordering = ['-uploaded_at']
         unique_together = ['title', 'course_code', 'year', 'semester']
+        # Matched to the filters and sorts used by view_papers and home
+        indexes = [
+            models.Index(fields=['-uploaded_at'], name='paper_uploaded_idx'),
+            models.Index(fields=['department', '-uploaded_at'], name='paper_dept_uploaded_idx'),
+            models.Index(fields=['year', '-uploaded_at'], name='paper_year_uploaded_idx'),
+            models.Index(fields=['department', 'year'], name='paper_dept_year_idx'),
+            models.Index(fields=['title'], name='paper_title_idx'),
+            models.Index(fields=['-download_count'], name='paper_downloads_idx'),
+            # Partial index for the "files" tab (papers that have a file)
+            models.Index(fields=['-uploaded_at'], name='paper_with_file_idx', condition=~models.Q(file='')),
+        ]
         verbose_name = 'Past Paper'
         verbose_name_plural = 'Past Papers'
 
@@ -49,22 +91,31 @@ class PastPaper(models.Model):
     def get_filename(self):
         """Get clean filename"""
         if self.file:
+            # Deduplicated files are named by hash; name them after the paper
+            if is_blob(self.file.name):
+                return f"{self.course_code} {self.title}{os.path.splitext(self.file.name)[1]}"
             return os.path.basename(self.file.name)
         return ""
 
-    def increment_download_count(self):
-        """Increment download count"""
-        self.download_count += 1
-        self.save(update_fields=['download_count'])
+    def increment_download_count(self, n=1):
+        """Increment download count atomically in the database"""
+        PastPaper.objects.filter(pk=self.pk).update(download_count=models.F('download_count') + n)
+        self.download_count += n
 
 
 class PastPaperAttachment(models.Model):
     past_paper = models.ForeignKey(PastPaper, related_name='attachments', on_delete=models.CASCADE)
-    file = models.FileField(upload_to=user_profile_image_path)
+    file = PaperFileField(upload_to=user_profile_image_path, storage=paper_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    checksum = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    mime_type = models.CharField(max_length=100, blank=True, editable=False)
     
     def get_filename(self):
         if self.file:
+            if is_blob(self.file.name):
+                return f"{self.past_paper.title} attachment {self.pk}{os.path.splitext(self.file.name)[1]}"
             return os.path.basename(self.file.name)
         return ""
     
@@ -93,11 +144,197 @@ class Profile(models.Model):
 class Download(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='downloads')
     paper = models.ForeignKey(PastPaper, on_delete=models.CASCADE, related_name='user_downloads')
-    downloaded_at = models.DateTimeField(auto_now_add=True)
+    downloaded_at = models.DateTimeField(default=timezone.now)  # latest download by this user
 
     class Meta:
         ordering = ['-downloaded_at']
         unique_together = ['user', 'paper']  # Prevent duplicate downloads from being recorded
+        indexes = [
+            models.Index(fields=['user', '-downloaded_at'], name='download_user_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} downloaded {self.paper.title}"
+
+
+class UploadJob(models.Model):
+    """A staged upload waiting for (or processed by) the background worker"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Upload job {self.pk} ({self.status})"
+
+
+
+class FacetCount(models.Model):
+    """Denormalized number of papers per department, year and semester"""
+    FACET_CHOICES = [
+        ('department', 'Department'),
+        ('year', 'Year'),
+        ('semester', 'Semester'),
+    ]
+
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['facet', 'value']
+        unique_together = ['facet', 'value']
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.count})"
+
+
+
+class DownloadEvent(models.Model):
+    """Append-only record of every download, written in batches.
+
+    Download keeps only the latest download per user and paper; old
+    events may be pruned once rolled up unless full history is on.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='download_events')
+    paper = models.ForeignKey(PastPaper, on_delete=models.CASCADE, related_name='download_events')
+    downloaded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-downloaded_at']
+        indexes = [
+            models.Index(fields=['user', '-downloaded_at'], name='event_user_recent_idx'),
+            models.Index(fields=['paper', 'downloaded_at'], name='event_paper_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} downloaded {self.paper_id} at {self.downloaded_at}"
+
+
+
+class PaperDownloadRollup(models.Model):
+    """Downloads of one paper per hour or day, built from DownloadEvent"""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    paper = models.ForeignKey(PastPaper, on_delete=models.CASCADE, related_name='download_rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        unique_together = ['paper', 'period', 'bucket']
+        indexes = [models.Index(fields=['period', 'bucket'], name='paper_rollup_bucket_idx')]
+
+    def __str__(self):
+        return f"{self.paper_id} {self.period} {self.bucket:%Y-%m-%d %H:00}: {self.count}"
+
+
+class DepartmentDownloadRollup(models.Model):
+    """Downloads per department per hour or day, built from DownloadEvent"""
+    department = models.CharField(max_length=100)
+    period = models.CharField(max_length=4, choices=PaperDownloadRollup.PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        unique_together = ['department', 'period', 'bucket']
+
+    def __str__(self):
+        return f"{self.department} {self.period} {self.bucket:%Y-%m-%d %H:00}: {self.count}"
+
+
+class RollupCheckpoint(models.Model):
+    """Highest DownloadEvent id already folded into the rollups"""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+
+
+class PaperText(models.Model):
+    """Text extracted from a paper's PDF and its attachments, zlib-compressed"""
+    paper = models.OneToOneField(PastPaper, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    data = models.BinaryField(editable=False)
+    # Names and sizes of the files the text came from, to skip unchanged papers
+    signature = models.CharField(max_length=40)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def content(self):
+        return zlib.decompress(self.data).decode('utf-8') if self.data else ''
+
+    @content.setter
+    def content(self, value):
+        self.data = zlib.compress(value.encode('utf-8'), 6)
+
+    def __str__(self):
+        return f"Text of {self.paper_id} ({len(self.data)} bytes)"
+
+
+
+class Blob(models.Model):
+    """A stored file shared by every paper and attachment with its content"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the last reference went away; gc_blobs waits a grace period
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['refcount', 'released_at'], name='blob_orphan_idx')]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+
+class ChunkedUpload(models.Model):
+    """A file being uploaded in chunks, resumable from `received`"""
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [(UPLOADING, 'Uploading'), (COMPLETE, 'Complete')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Optional SHA-256 of the whole file, checked on finalize
+    sha256 = models.CharField(max_length=64, blank=True)
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    stored_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.username} downloaded {self.paper.title}"
\ No newline at end of file
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
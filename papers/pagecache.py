@@ -0,0 +1,205 @@
+# pagecache.py - Rendered pages cached per path, query, language and theme
+import functools
+import hashlib
+import logging
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.translation import get_language
+
+from .caching import (
+    get_cache, KEY_PREFIX, catalogue_version, acatalogue_version, _bump, _abump, _stat_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long one request may take to re-render a stale page while the
+# others are still served the stale copy
+REFRESH_LOCK_TIMEOUT = 30
+OUTCOMES = ('hits', 'stale', 'misses')
+
+# Pages using cached_page, for the statistics
+CACHED_PAGES = []
+
+
+def page_cache_enabled():
+    return getattr(settings, 'PAPERS_PAGE_CACHE', True)
+
+
+def page_key(name, request, theme=''):
+    """Cache key for a page: the path (with its language prefix), the
+    query string in a stable order, the active language and the theme
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    language = getattr(request, 'LANGUAGE_CODE', None) or get_language() or ''
+    digest = hashlib.sha1('\n'.join([request.path, query, language, theme or '']).encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:page:{name}:{digest}'
+
+
+def _state(entry, version, timeout, stale):
+    """'fresh', 'stale' (servable while another request re-renders it) or None"""
+    if entry is None:
+        return None
+    age = time.time() - entry['created']
+    if entry['version'] == version and age < timeout:
+        return 'fresh'
+    if age < timeout + stale:
+        return 'stale'
+    return None
+
+
+def _entry(request, response, version):
+    """What to store for `response`, or None if it mustn't be shared"""
+    if not getattr(response, 'is_rendered', True):
+        response.render()
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return None
+    # A CSRF token, a flash message or a session change make the page
+    # one visitor's
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return None
+    messages = getattr(request, '_messages', None)
+    if messages is not None and len(messages):
+        return None
+    session = getattr(request, 'session', None)
+    if session is not None and session.modified:
+        return None
+    return {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': [(header, value) for header, value in response.headers.items() if header.lower() != 'set-cookie'],
+        'version': version,
+        'created': time.time(),
+    }
+
+
+def _cached_response(request, entry, outcome):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    # Pages stored with validators (conditional_page) can still be
+    # answered with 304 Not Modified
+    if response.has_header('ETag') or response.has_header('Last-Modified'):
+        response = get_conditional_response(
+            request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+            response=response,
+        )
+    response['X-Page-Cache'] = outcome
+    return response
+
+
+def cached_page(timeout=None, stale=None, name=None):
+    """Serve anonymous GETs of the view from a cache of rendered pages.
+
+    Pages are keyed on path, query string, language and theme, and carry
+    the catalogue version, so any PastPaper change invalidates them all.
+    A page older than `timeout` (PAPERS_PAGE_CACHE_TIMEOUT) or from an
+    older version is re-rendered by the next request, while requests
+    arriving meanwhile get the stale copy for up to `stale` more seconds
+    (PAPERS_PAGE_CACHE_STALE). Logged-in users, other methods and
+    responses that set cookies or hold a CSRF token always go to the view.
+    Works on sync and async views.
+    """
+    def decorator(view):
+        page = name or view.__name__
+        if page not in CACHED_PAGES:
+            CACHED_PAGES.append(page)
+        stats_name = f'pages:{page}'
+
+        def lifetimes():
+            return (
+                timeout if timeout is not None else getattr(settings, 'PAPERS_PAGE_CACHE_TIMEOUT', 300),
+                stale if stale is not None else getattr(settings, 'PAPERS_PAGE_CACHE_STALE', 60),
+            )
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not page_cache_enabled() or request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                if (await request.auser()).is_authenticated:
+                    return await view(request, *args, **kwargs)
+
+                fresh_for, stale_for = lifetimes()
+                cache = get_cache()
+                key = page_key(page, request, await request.session.aget('theme', ''))
+                version = await acatalogue_version()
+                entry = await cache.aget(key)
+                state = _state(entry, version, fresh_for, stale_for)
+                if state == 'fresh':
+                    await _abump(stats_name, 'hits')
+                    return _cached_response(request, entry, 'hit')
+                if state == 'stale' and not await cache.aadd(f'{key}:refresh', 1, REFRESH_LOCK_TIMEOUT):
+                    await _abump(stats_name, 'stale')
+                    return _cached_response(request, entry, 'stale')
+
+                await _abump(stats_name, 'misses')
+                try:
+                    response = await view(request, *args, **kwargs)
+                    stored = _entry(request, response, version)
+                    if stored is not None:
+                        await cache.aset(key, stored, timeout=fresh_for + stale_for)
+                finally:
+                    if state == 'stale':
+                        await cache.adelete(f'{key}:refresh')
+                response['X-Page-Cache'] = 'miss'
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not page_cache_enabled() or request.method not in ('GET', 'HEAD'):
+                    return view(request, *args, **kwargs)
+                if request.user.is_authenticated:
+                    return view(request, *args, **kwargs)
+
+                fresh_for, stale_for = lifetimes()
+                cache = get_cache()
+                key = page_key(page, request, request.session.get('theme', ''))
+                version = catalogue_version()
+                entry = cache.get(key)
+                state = _state(entry, version, fresh_for, stale_for)
+                if state == 'fresh':
+                    _bump(stats_name, 'hits')
+                    return _cached_response(request, entry, 'hit')
+                if state == 'stale' and not cache.add(f'{key}:refresh', 1, REFRESH_LOCK_TIMEOUT):
+                    _bump(stats_name, 'stale')
+                    return _cached_response(request, entry, 'stale')
+
+                _bump(stats_name, 'misses')
+                try:
+                    response = view(request, *args, **kwargs)
+                    stored = _entry(request, response, version)
+                    if stored is not None:
+                        cache.set(key, stored, timeout=fresh_for + stale_for)
+                finally:
+                    if state == 'stale':
+                        cache.delete(f'{key}:refresh')
+                response['X-Page-Cache'] = 'miss'
+                return response
+        return wrapper
+    return decorator
+
+
+def page_cache_stats():
+    """Hits, stale hits and misses for every cached page, keyed by name"""
+    cache = get_cache()
+    stats = {}
+    for page in CACHED_PAGES:
+        counts = {outcome: cache.get(_stat_key(f'pages:{page}', outcome), 0) for outcome in OUTCOMES}
+        total = sum(counts.values())
+        counts['hit_rate'] = (counts['hits'] + counts['stale']) / total if total else 0.0
+        stats[page] = counts
+    return stats
+
+
+def reset_page_cache_stats():
+    get_cache().delete_many([
+        _stat_key(f'pages:{page}', outcome) for page in CACHED_PAGES for outcome in OUTCOMES
+    ])
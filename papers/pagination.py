@@ -0,0 +1,249 @@
+# pagination.py - Keyset (cursor) pagination for the paper listings
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from .caching import get_cache, KEY_PREFIX, data_version, adata_version
+
+logger = logging.getLogger(__name__)
+
+CURSOR_SALT = 'papers.pagination.cursor'
+
+# Query parameters that pick a page rather than the rows being paged
+PAGE_PARAMS = ('cursor', 'page')
+
+
+def cursor_pagination_enabled():
+    return getattr(settings, 'PAPERS_CURSOR_PAGINATION', False)
+
+
+class CursorPage:
+    """One page of a CursorPaginator, shaped like a Paginator page.
+
+    Instead of page numbers it offers opaque `next_cursor` and
+    `previous_cursor` tokens for the templates' links.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} items>"
+
+
+class CursorPaginator:
+    """Paginate a queryset on `ordering` with WHERE clauses instead of OFFSET.
+
+    `ordering` lists the sort keys (e.g. ['-uploaded_at']); the primary
+    key is appended as a tie-breaker so every position is unique. Each
+    page costs one indexed range query no matter how deep it is. With a
+    `count_key` naming the rows (see count_key()), the total `count` is
+    cached until the counted model's data_version changes.
+    """
+
+    def __init__(self, queryset, per_page, ordering, count_key=None):
+        ordering = list(ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(key.lstrip('-') in (pk_name, 'pk') for key in ordering):
+            direction = '-' if ordering and ordering[0].startswith('-') else ''
+            ordering.append(f'{direction}{pk_name}')
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.count_key = count_key
+
+    @property
+    def fields(self):
+        return [key.lstrip('-') for key in self.ordering]
+
+    def _cache_key(self, version):
+        return f'{KEY_PREFIX}:count:{self.queryset.model._meta.label_lower}:{version}:{self.count_key}'
+
+    @property
+    def count(self):
+        """Total number of rows, cached until the counted model changes"""
+        if hasattr(self, '_count'):
+            return self._count
+        if self.count_key is None:
+            self._count = self.queryset.order_by().count()
+            return self._count
+        cache = get_cache()
+        key = self._cache_key(data_version(self.queryset.model))
+        count = cache.get(key)
+        if count is None:
+            count = self.queryset.order_by().count()
+            cache.set(key, count, timeout=getattr(settings, 'PAPERS_COUNT_CACHE_TIMEOUT', 300))
+        self._count = count
+        return count
+
+    async def acount(self):
+        """`count` for async views; templates then read it without a query"""
+        if hasattr(self, '_count'):
+            return self._count
+        if self.count_key is None:
+            self._count = await self.queryset.order_by().acount()
+            return self._count
+        cache = get_cache()
+        key = self._cache_key(await adata_version(self.queryset.model))
+        count = await cache.aget(key)
+        if count is None:
+            count = await self.queryset.order_by().acount()
+            await cache.aset(key, count, timeout=getattr(settings, 'PAPERS_COUNT_CACHE_TIMEOUT', 300))
+        self._count = count
+        return count
+
+    def encode_cursor(self, obj, backwards=False):
+        values = []
+        for name in self.fields:
+            field = self.queryset.model._meta.get_field(name)
+            values.append(field.value_to_string(obj))
+        return signing.dumps(
+            {'o': self.ordering, 'v': values, 'b': backwards}, salt=CURSOR_SALT, compress=True
+        )
+
+    def decode_cursor(self, token):
+        """Return (values, backwards), or None for a bad or foreign token"""
+        try:
+            data = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if data.get('o') != self.ordering or len(data.get('v', [])) != len(self.ordering):
+            return None
+        values = []
+        for name, raw in zip(self.fields, data['v']):
+            values.append(self.queryset.model._meta.get_field(name).to_python(raw))
+        return values, data.get('b', False)
+
+    def _after(self, values, backwards):
+        """Q for rows strictly after `values` (before, when going backwards)"""
+        keys = list(zip(self.ordering, values))
+        alternatives = Q()
+        for i, (key, value) in enumerate(keys):
+            descending = key.startswith('-') != backwards
+            lookup = 'lt' if descending else 'gt'
+            condition = Q(**{f'{key.lstrip("-")}__{lookup}': value})
+            for prior_key, prior_value in keys[:i]:
+                condition &= Q(**{prior_key.lstrip('-'): prior_value})
+            alternatives |= condition
+
+        # The leading key bounds the range so the index can be used
+        first_key, first_value = keys[0]
+        descending = first_key.startswith('-') != backwards
+        bound = Q(**{f'{first_key.lstrip("-")}__{"lte" if descending else "gte"}': first_value})
+        return bound & alternatives
+
+    def _page_query(self, cursor):
+        """(queryset of up to per_page + 1 rows, cursor values, backwards)"""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            values, backwards = None, False
+        else:
+            values, backwards = decoded
+
+        queryset = self.queryset
+        if backwards:
+            reversed_ordering = [key[1:] if key.startswith('-') else f'-{key}' for key in self.ordering]
+            queryset = queryset.order_by(*reversed_ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+        return queryset[:self.per_page + 1], values, backwards
+
+    def _page(self, rows, values, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows, self)
+
+        if backwards:
+            next_cursor = self.encode_cursor(rows[-1])
+            previous_cursor = self.encode_cursor(rows[0], backwards=True) if has_more else None
+        else:
+            next_cursor = self.encode_cursor(rows[-1]) if has_more else None
+            previous_cursor = self.encode_cursor(rows[0], backwards=True) if values is not None else None
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        queryset, values, backwards = self._page_query(cursor)
+        return self._page(list(queryset), values, backwards)
+
+    async def aget_page(self, cursor=None):
+        queryset, values, backwards = self._page_query(cursor)
+        return self._page([row async for row in queryset], values, backwards)
+
+
+def count_key(request, per_user=False):
+    """Names the rows a listing request pages through: the view and its
+    filter parameters (not the page), and the user for per-user lists.
+
+    The rows' SQL can't serve as the key: filters such as "last 30 days"
+    embed the current time, so it would never repeat.
+    """
+    match = getattr(request, 'resolver_match', None)
+    params = sorted(
+        (name, values) for name, values in request.GET.lists() if name not in PAGE_PARAMS
+    )
+    parts = [match.view_name if match else request.path, repr(params)]
+    if per_user:
+        parts.append(str(request.user.pk))
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def paginate(request, queryset, per_page, ordering=None, per_user=False):
+    """Page through `queryset` with a cursor when enabled and possible.
+
+    `ordering` gives the cursor sort keys; pass None for orderings that
+    can't be expressed as model fields (e.g. search relevance) to keep
+    the page-number Paginator. `per_user` marks lists that depend on the
+    user, so cached counts aren't shared between users.
+    """
+    if ordering and cursor_pagination_enabled():
+        paginator = CursorPaginator(queryset, per_page, ordering, count_key(request, per_user))
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = Paginator(queryset, per_page)
+    return paginator.get_page(request.GET.get('page'))
+
+
+async def apaginate(request, queryset, per_page, ordering=None, per_user=False):
+    """paginate() for async views: the count and the page's rows are
+    fetched with the async ORM, so the template runs no queries.
+    """
+    if ordering and cursor_pagination_enabled():
+        paginator = CursorPaginator(queryset, per_page, ordering, count_key(request, per_user))
+        await paginator.acount()
+        return await paginator.aget_page(request.GET.get('cursor'))
+    paginator = Paginator(queryset, per_page)
+    # Paginator.count is a cached_property; fill it in ahead of get_page()
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = [row async for row in page.object_list]
+    return page
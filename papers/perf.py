@@ -0,0 +1,288 @@
+# perf.py - Per-request timings, query counts and query budgets
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('papers_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more SQL queries than its declared budget"""
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run per request.
+
+    PAPERS_QUERY_BUDGETS (keyed by URL name) overrides it, and covers
+    views we can't decorate, such as admin pages.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def budget_for(view_name, view_func):
+    budgets = getattr(settings, 'PAPERS_QUERY_BUDGETS', {})
+    if view_name in budgets:
+        return budgets[view_name]
+    return getattr(view_func, 'query_budget', None)
+
+
+class RequestMetrics:
+    """Counters for the request being handled, reached through a context var"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_name = None
+        self.budget = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook timing every query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def current_metrics():
+    return _current.get()
+
+
+def count_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection, timing queries for
+    the current request (if any).
+
+    It finds the request through the context var rather than being
+    installed per request, so queries the async ORM runs in
+    sync_to_async threads, on their own connections, count too.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.execute(execute, sql, params, many, context)
+
+
+def install_query_counter(connection):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@receiver(connection_created)
+def _count_queries_on_new_connection(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+class TimedTemplate:
+    """Wraps a backend template to add its render time to the request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times recorded per request"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template) if isinstance(template, DjangoTemplate) else template
+
+
+class MetricsLog:
+    """Recent request records, kept in memory and optionally appended to a file.
+
+    Records are dicts; `summary()` groups them by URL name for the
+    metrics endpoint. PAPERS_PERF_LOG_FILE, when set, gets one JSON line
+    per request.
+    """
+
+    def __init__(self, capacity=None):
+        if capacity is None:
+            capacity = getattr(settings, 'PAPERS_PERF_HISTORY', 1000)
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._records.append(entry)
+        path = getattr(settings, 'PAPERS_PERF_LOG_FILE', None)
+        if path:
+            try:
+                with self._lock, open(path, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write performance log {path}: {str(e)}")
+
+    def entries(self):
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def summary(self):
+        """Per-view request counts, latency percentiles and average costs"""
+        groups = {}
+        for entry in self.entries():
+            groups.setdefault(entry['view'] or entry['path'], []).append(entry)
+
+        def percentile(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+        summary = {}
+        for view, entries in groups.items():
+            n = len(entries)
+            totals = [entry['total_ms'] for entry in entries]
+            summary[view] = {
+                'requests': n,
+                'p50_ms': round(percentile(totals, 0.5), 2),
+                'p95_ms': round(percentile(totals, 0.95), 2),
+                'max_ms': round(max(totals), 2),
+                'avg_queries': round(sum(entry['queries'] for entry in entries) / n, 1),
+                'max_queries': max(entry['queries'] for entry in entries),
+                'avg_sql_ms': round(sum(entry['sql_ms'] for entry in entries) / n, 2),
+                'avg_template_ms': round(sum(entry['template_ms'] for entry in entries) / n, 2),
+                'avg_bytes': int(sum(entry['bytes'] or 0 for entry in entries) / n),
+                'budget': entries[-1]['budget'],
+            }
+        return summary
+
+
+request_metrics = MetricsLog()
+
+
+def _response_size(response):
+    if getattr(response, 'streaming', False):
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+class PerformanceMiddleware:
+    """Time each request and count its SQL queries.
+
+    Records wall time, query count and time (through count_query on
+    every database connection), template render time (with
+    TimedDjangoTemplates as the template backend) and response size,
+    tagged with the URL name. Adds a Server-Timing header when
+    PAPERS_SERVER_TIMING is on, and checks the view's query budget:
+    over budget is logged, or raises QueryBudgetExceeded when
+    PAPERS_QUERY_BUDGET_STRICT is set (as in the tests). Put it first
+    in MIDDLEWARE so the other middleware's queries count too. Works
+    under both WSGI and ASGI, so async views keep running on the event
+    loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, 'PAPERS_PERF_INSTRUMENTATION', True):
+            return self.get_response(request)
+
+        # Connections opened before this module was imported
+        for connection in connections.all():
+            install_query_counter(connection)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'PAPERS_PERF_INSTRUMENTATION', True):
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        # Read from the resolver match rather than in process_view, which
+        # Django would run in a thread under ASGI
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            metrics.view_name = match.view_name
+            metrics.budget = budget_for(match.view_name, match.func)
+
+        entry = {
+            'view': metrics.view_name,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'bytes': _response_size(response),
+            'budget': metrics.budget,
+            'time': time.time(),
+        }
+        request_metrics.record(entry)
+
+        if getattr(settings, 'PAPERS_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={entry["total_ms"]}',
+                f'db;dur={entry["sql_ms"]};desc="{metrics.queries} queries"',
+                f'tpl;dur={entry["template_ms"]}',
+            ])
+
+        if metrics.budget is not None and metrics.queries > metrics.budget:
+            message = (
+                f"{metrics.view_name} ran {metrics.queries} queries, "
+                f"over its budget of {metrics.budget} ({request.path})"
+            )
+            if getattr(settings, 'PAPERS_QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
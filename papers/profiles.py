@@ -0,0 +1,60 @@
+# profiles.py - Profile rows created lazily and written only when changed
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+
+from .models import Profile
+
+# Fields users edit; a save of the User only writes these if they changed
+TRACKED_FIELDS = ('university', 'profile_image', 'bio')
+
+
+def _value(profile, field):
+    value = profile.__dict__.get(field)
+    return getattr(value, 'name', value)
+
+
+def snapshot(profile):
+    return {field: _value(profile, field) for field in TRACKED_FIELDS if field in profile.__dict__}
+
+
+def changed_fields(profile):
+    """Tracked fields that differ from what the profile was loaded with"""
+    before = getattr(profile, '_profile_snapshot', None) or {}
+    return [
+        field for field in TRACKED_FIELDS
+        if field in profile.__dict__ and before.get(field) != _value(profile, field)
+    ]
+
+
+def cached_profile(user):
+    """The user's profile if it was already loaded with the user, else None"""
+    User = get_user_model()
+    if not User.profile.is_cached(user):
+        return None
+    try:
+        return user.profile
+    except ObjectDoesNotExist:
+        return None
+
+
+def get_profile(user):
+    """The user's profile, created on first use"""
+    try:
+        return user.profile
+    except ObjectDoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
+
+
+def ensure_profiles(user_ids=None, batch_size=1000):
+    """Create the missing profiles in bulk, e.g. after User.objects.bulk_create.
+
+    Returns the number created.
+    """
+    missing = get_user_model()._default_manager.filter(profile__isnull=True)
+    if user_ids is not None:
+        missing = missing.filter(pk__in=list(user_ids))
+    profiles = [Profile(user_id=pk) for pk in missing.values_list('pk', flat=True)]
+    Profile.objects.bulk_create(profiles, batch_size=batch_size, ignore_conflicts=True)
+    return len(profiles)
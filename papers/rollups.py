@@ -0,0 +1,154 @@
+# rollups.py - Hourly/daily download counts aggregated from DownloadEvent
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'download_rollups'
+TRUNCATE = {'hour': TruncHour, 'day': TruncDay}
+
+
+def _add_counts(model, key_field, counts):
+    """Add {(key, period, bucket): n} to `model`, creating missing rows"""
+    if not counts:
+        return
+    existing = {}
+    for period in {period for _, period, _ in counts}:
+        keys = {key for key, p, _ in counts if p == period}
+        buckets = {bucket for _, p, bucket in counts if p == period}
+        rows = model.objects.filter(
+            period=period, bucket__in=buckets, **{f'{key_field}__in': keys}
+        )
+        for row in rows:
+            existing[(getattr(row, key_field), row.period, row.bucket)] = row
+
+    to_update, to_create = [], []
+    for (key, period, bucket), n in counts.items():
+        row = existing.get((key, period, bucket))
+        if row is not None:
+            row.count += n
+            to_update.append(row)
+        else:
+            to_create.append(model(**{key_field: key}, period=period, bucket=bucket, count=n))
+    model.objects.bulk_update(to_update, ['count'])
+    model.objects.bulk_create(to_create)
+
+
+def roll_up(batch_size=50000, lag=None):
+    """Fold DownloadEvent rows past the checkpoint into the rollup tables.
+
+    Events are read by id above the stored watermark, grouped by hour and
+    day in the database, and added to existing buckets in the same
+    transaction that advances the watermark, so running it again (or
+    from cron while downloads continue) never counts an event twice.
+
+    Ids aren't committed in order when several workers flush at once, so
+    the watermark only moves up to the newest event downloaded more than
+    `lag` seconds ago (PAPERS_ROLLUP_LAG_SECONDS): any lower id still
+    uncommitted would belong to a flush running longer than that.
+    Returns the number of events processed.
+    """
+    from .models import (
+        DepartmentDownloadRollup, DownloadEvent, PaperDownloadRollup, RollupCheckpoint,
+    )
+
+    if lag is None:
+        lag = getattr(settings, 'PAPERS_ROLLUP_LAG_SECONDS', 300)
+    cutoff = timezone.now() - timedelta(seconds=lag)
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            checkpoint, _ = RollupCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT)
+            ceiling = DownloadEvent.objects.filter(
+                id__gt=checkpoint.last_event_id, downloaded_at__lt=cutoff
+            ).aggregate(ceiling=Max('id'))['ceiling']
+            if ceiling is None:
+                return processed
+            upper = (
+                DownloadEvent.objects.filter(id__gt=checkpoint.last_event_id, id__lte=ceiling)
+                .order_by('id').values_list('id', flat=True)[batch_size - 1:batch_size].first()
+            ) or ceiling
+
+            events = DownloadEvent.objects.filter(id__gt=checkpoint.last_event_id, id__lte=upper)
+            paper_counts, department_counts = Counter(), Counter()
+            for period, trunc in TRUNCATE.items():
+                grouped = (
+                    events.order_by()
+                    .annotate(bucket=trunc('downloaded_at'))
+                    .values_list('paper_id', 'paper__department', 'bucket')
+                    .annotate(n=Count('id'))
+                )
+                for paper_id, department, bucket, n in grouped:
+                    paper_counts[(paper_id, period, bucket)] += n
+                    department_counts[(department, period, bucket)] += n
+                    if period == 'hour':
+                        processed += n
+
+            _add_counts(PaperDownloadRollup, 'paper_id', paper_counts)
+            _add_counts(DepartmentDownloadRollup, 'department', department_counts)
+            checkpoint.last_event_id = upper
+            checkpoint.save(update_fields=['last_event_id', 'updated_at'])
+        logger.info(f"Rolled up download events up to id {upper}")
+
+
+def prune_events(retention_days=None):
+    """Delete rolled-up events older than the retention window.
+
+    Only runs with PAPERS_DOWNLOAD_HISTORY = 'latest'; 'full' keeps every
+    event for the per-user history page. Returns the number deleted.
+    """
+    from .caching import bump_data_version
+    from .history import full_history_enabled
+    from .models import DownloadEvent, RollupCheckpoint
+
+    if retention_days is None:
+        retention_days = getattr(settings, 'PAPERS_DOWNLOAD_EVENT_RETENTION_DAYS', 30)
+    if full_history_enabled() or retention_days is None:
+        return 0
+    checkpoint = RollupCheckpoint.objects.filter(name=CHECKPOINT).first()
+    if checkpoint is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = DownloadEvent.objects.filter(
+        id__lte=checkpoint.last_event_id, downloaded_at__lt=cutoff
+    ).delete()
+    if deleted:
+        bump_data_version(DownloadEvent)
+    return deleted
+
+
+def popular_since(since, limit=5):
+    """Paper ids with the most downloads since `since`, from daily rollups"""
+    from .models import PaperDownloadRollup
+
+    return list(
+        PaperDownloadRollup.objects.filter(period='day', bucket__gte=since)
+        .values('paper_id').annotate(total=Sum('count'))
+        .order_by('-total').values_list('paper_id', flat=True)[:limit]
+    )
+
+
+def department_totals():
+    """Per-department downloads for today and the last seven days"""
+    from .models import DepartmentDownloadRollup
+
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    totals = {}
+    rows = (
+        DepartmentDownloadRollup.objects.filter(period='day', bucket__gte=today - timedelta(days=6))
+        .values_list('department', 'bucket', 'count')
+    )
+    for department, bucket, count in rows:
+        entry = totals.setdefault(department, {'department': department, 'today': 0, 'week': 0})
+        entry['week'] += count
+        if bucket >= today:
+            entry['today'] += count
+    return sorted(totals.values(), key=lambda entry: -entry['week'])
@@ -0,0 +1,252 @@
+# search.py - Full-text search index for PastPaper metadata and contents
+import logging
+import re
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q, Value, FloatField
+
+logger = logging.getLogger(__name__)
+
+# Columns copied into the search index, in the order used for weighting
+INDEXED_FIELDS = ('title', 'course_code', 'department', 'year')
+
+# Extra index column holding the text extracted from the paper's files
+CONTENT_COLUMN = 'content'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    """Common interface for the search index backends.
+
+    `search()` returns the queryset restricted to matching papers and
+    annotated with `search_rank`, where a lower value is a better match.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def install(self):
+        """Create the index storage (idempotent)"""
+
+    def uninstall(self):
+        """Drop the index storage"""
+
+    def clear(self):
+        """Remove every entry from the index"""
+
+    def index(self, paper):
+        """Add or refresh a single paper"""
+        self.index_many([paper])
+
+    def index_many(self, papers):
+        """Add or refresh several papers"""
+
+    def write_rows(self, rows):
+        """Add or refresh prebuilt (id, *metadata, content) rows"""
+
+    def remove(self, paper_id):
+        """Drop a single paper from the index"""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Unindexed icontains search, used when no full-text engine is available"""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(course_code__icontains=query) |
+            Q(department__icontains=query) |
+            Q(year__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def index_rows(papers):
+    """(id, *metadata, content) tuples for the papers, with their text"""
+    from .extraction import paper_texts
+
+    papers = list(papers)
+    if papers and papers[0]._meta.apps is not global_apps:
+        # Historical models from a migration that may predate PaperText
+        texts = {}
+    else:
+        texts = paper_texts(paper.pk for paper in papers)
+    return [
+        (paper.pk, *(str(getattr(paper, field)) for field in INDEXED_FIELDS), texts.get(paper.pk, ''))
+        for paper in papers
+    ]
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """SQLite FTS5 virtual table keyed on the PastPaper id (rowid).
+
+    The trigram tokenizer keeps the substring semantics of the old
+    icontains search, so "101" still finds "MATH101", but every term
+    needs at least three characters to hit the index. Shorter queries
+    fall back to the basic search.
+    """
+
+    table = 'papers_pastpaper_fts'
+    # bm25 weights for title, course_code, department, year, content
+    weights = (10.0, 5.0, 2.0, 1.0, 0.5)
+    min_term_length = 3
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(INDEXED_FIELDS)}, {CONTENT_COLUMN}, tokenize='trigram')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def index_many(self, papers):
+        self.write_rows(index_rows(papers))
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(INDEXED_FIELDS)}, {CONTENT_COLUMN}) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, paper_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [paper_id])
+
+    def match_expression(self, query):
+        """Turn free text into an FTS5 query: every term must appear"""
+        terms = TERM_RE.findall(query)
+        if not terms or any(len(term) < self.min_term_length for term in terms):
+            return None
+        return ' '.join('"%s"' % term for term in terms)
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return BasicSearchBackend(self.using).search(queryset, query)
+
+        pk_column = f"{queryset.model._meta.db_table}.{queryset.model._meta.pk.column}"
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table}.rowid = {pk_column}", f"{self.table} MATCH %s"],
+            params=[expression],
+            select={'search_rank': f"bm25({self.table}, {weights})"},
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector side table with a GIN index, one row per PastPaper"""
+
+    table = 'papers_pastpaper_search'
+    config = 'simple'
+    # setweight labels for title, course_code, department, year, content
+    weights = ('A', 'A', 'B', 'C', 'D')
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"paper_id bigint PRIMARY KEY REFERENCES papers_pastpaper(id) ON DELETE CASCADE, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_document_gin "
+                f"ON {self.table} USING GIN (document)"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+
+    def index_many(self, papers):
+        self.write_rows(index_rows(papers))
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        document = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', %s), '{weight}')" for weight in self.weights
+        )
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (paper_id, document) VALUES (%s, {document}) "
+                f"ON CONFLICT (paper_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, paper_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE paper_id = %s", [paper_id])
+
+    def tsquery(self, query):
+        """Prefix-match every term so results update as the user types"""
+        terms = TERM_RE.findall(query.lower())
+        if not terms:
+            return None
+        return ' & '.join(f"{term}:*" for term in terms)
+
+    def search(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if tsquery is None:
+            return BasicSearchBackend(self.using).search(queryset, query)
+
+        pk_column = f"{queryset.model._meta.db_table}.{queryset.model._meta.pk.column}"
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f"{self.table}.paper_id = {pk_column}",
+                f"{self.table}.document @@ to_tsquery('{self.config}', %s)",
+            ],
+            params=[tsquery],
+            select={
+                'search_rank': f"-ts_rank({self.table}.document, to_tsquery('{self.config}', %s))",
+            },
+            select_params=[tsquery],
+        )
+
+
+BACKENDS = {
+    'basic': BasicSearchBackend,
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    """Return the configured backend, or pick one from the database vendor"""
+    name = getattr(settings, 'PAPERS_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = connections[using].vendor
+    return BACKENDS.get(name, BasicSearchBackend)(using)
+
+
+def search_papers(queryset, query):
+    """Restrict a PastPaper queryset to `query`, annotated with `search_rank`"""
+    return get_backend(queryset.db).search(queryset, query)
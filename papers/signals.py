@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
+from collections import Counter
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, PastPaper, PastPaperAttachment
+from .search import get_backend, INDEXED_FIELDS
+from .ingest import papers_bulk_created
+from .counters import downloads_flushed
+from .caching import recent_papers, popular_papers, bump_catalogue_version
+from . import facets
+from .extraction import extract_on_commit
+from . import storage
+from .backends import forget_misses
+from . import profiles
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,5 +19,148 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def forget_login_misses(sender, instance, **kwargs):
+    # A cached "no such account" must not outlive the account's creation
+    forget_misses(instance.username, instance.email)
+
+@receiver(post_save, sender=User)
+def save_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Only a profile already loaded with the user, and edited since, is
+    # written; saving a User (e.g. last_login on every login) never queries it
+    if created or raw:
+        return
+    profile = profiles.cached_profile(instance)
+    if profile is None:
+        return
+    changed = profiles.changed_fields(profile)
+    if changed:
+        profile.save(update_fields=changed)
+
+@receiver(post_init, sender=Profile)
+def remember_profile_fields(sender, instance, **kwargs):
+    instance._profile_snapshot = profiles.snapshot(instance)
+
+@receiver(post_save, sender=Profile)
+def refresh_profile_snapshot(sender, instance, **kwargs):
+    instance._profile_snapshot = profiles.snapshot(instance)
+
+
+# Keep the full-text search index in step with PastPaper rows
+@receiver(post_save, sender=PastPaper)
+def index_paper(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Counter updates and similar partial saves don't touch indexed text
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    get_backend(using).index(instance)
+
+@receiver(post_delete, sender=PastPaper)
+def unindex_paper(sender, instance, using=None, **kwargs):
+    get_backend(using).remove(instance.pk)
+
+@receiver(papers_bulk_created, sender=PastPaper)
+def index_bulk_created_papers(sender, papers, **kwargs):
+    get_backend().index_many(papers)
+
+
+# Dashboard lists and versioned caches: any catalogue change invalidates
+# them, new download counts only affect the popular list
+@receiver(post_save, sender=PastPaper)
+@receiver(post_delete, sender=PastPaper)
+def invalidate_dashboard_lists(sender, **kwargs):
+    recent_papers.invalidate()
+    popular_papers.invalidate()
+    bump_catalogue_version()
+
+@receiver(papers_bulk_created, sender=PastPaper)
+def invalidate_dashboard_after_bulk_create(sender, **kwargs):
+    recent_papers.invalidate()
+    popular_papers.invalidate()
+    bump_catalogue_version()
+
+@receiver(downloads_flushed)
+def refresh_popular_papers(sender, **kwargs):
+    popular_papers.invalidate()
+
+
+# Facet counts: remember the values a paper was loaded with so a save
+# only moves the counts that actually changed
+@receiver(post_init, sender=PastPaper)
+def remember_facet_values(sender, instance, **kwargs):
+    instance._facet_snapshot = facets.snapshot(instance, loaded_only=True) if instance.pk else None
+
+@receiver(post_save, sender=PastPaper)
+def update_facet_counts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(facets.FACET_FIELDS):
+        return
+    old = None if created else instance._facet_snapshot
+    new = facets.snapshot(instance, loaded_only=not created)
+    if old != new:
+        facets.record_change(old, new)
+    instance._facet_snapshot = new
+
+@receiver(post_delete, sender=PastPaper)
+def remove_facet_counts(sender, instance, **kwargs):
+    facets.record_change(facets.snapshot(instance), None)
+
+@receiver(papers_bulk_created, sender=PastPaper)
+def count_bulk_created_facets(sender, papers, **kwargs):
+    facets.record_created(papers)
+
+
+# Text extraction: re-read a paper's files when they may have changed
+@receiver(post_save, sender=PastPaper)
+def extract_paper_text(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and 'file' not in update_fields:
+        return
+    # Metadata edits keep the file the row was loaded with (_stored_file
+    # is updated by count_file_reference, registered after this receiver)
+    new = storage.file_name(instance)
+    if not created and (new is None or new == getattr(instance, '_stored_file', None)):
+        return
+    extract_on_commit(instance)
+
+@receiver(post_save, sender=PastPaperAttachment)
+@receiver(post_delete, sender=PastPaperAttachment)
+def extract_attachment_text(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    extract_on_commit(instance.past_paper)
+
+@receiver(papers_bulk_created, sender=PastPaper)
+def extract_bulk_created_text(sender, papers, **kwargs):
+    for paper in papers:
+        extract_on_commit(paper)
+
+
+# Blob reference counts: a paper or attachment holds one reference to
+# the stored file it points at
+@receiver(post_init, sender=PastPaper)
+@receiver(post_init, sender=PastPaperAttachment)
+def remember_file_name(sender, instance, **kwargs):
+    instance._stored_file = storage.file_name(instance) if instance.pk else ''
+
+@receiver(post_save, sender=PastPaper)
+@receiver(post_save, sender=PastPaperAttachment)
+def count_file_reference(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'file' not in update_fields):
+        return
+    old, new = instance._stored_file, storage.file_name(instance)
+    # Unknown when the file field was deferred and never loaded
+    if old is not None and new is not None and old != new:
+        storage.apply_refs({old: -1, new: 1} if old else {new: 1})
+    instance._stored_file = new
+
+@receiver(post_delete, sender=PastPaper)
+@receiver(post_delete, sender=PastPaperAttachment)
+def release_file_reference(sender, instance, **kwargs):
+    storage.apply_refs({instance.file.name or '': -1})
+
+@receiver(papers_bulk_created, sender=PastPaper)
+def count_bulk_created_references(sender, papers, **kwargs):
+    storage.apply_refs(Counter(storage.file_name(paper) for paper in papers))
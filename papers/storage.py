@@ -0,0 +1,289 @@
+# storage.py - Content-addressed storage: one copy of each unique upload
+import logging
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metadata import FileScanner, remember, scan_file
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+INCOMING_DIR = f'{BLOB_DIR}/.incoming'
+BLOB_NAME_RE = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.\w+)?$')
+
+
+def blob_name(digest, ext=''):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return bool(name) and BLOB_NAME_RE.match(name) is not None
+
+
+def sha256_from_name(name):
+    """The content hash encoded in a blob name, or None"""
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each file under the SHA-256 of its bytes.
+
+    The hash is computed while the upload is copied to a temporary file,
+    which is then renamed into place, or dropped if that blob is already
+    stored. `upload_to` only contributes the file extension. The same
+    pass collects the file metadata that PaperFileField stores on the row.
+
+    Blobs can be shared by several rows, so `delete()` leaves them alone:
+    Blob rows count the references and `manage.py gc_blobs` removes
+    blobs nothing points to any more.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content, decided in _save()
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        incoming = self.path(INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+
+        scanner = FileScanner()
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    scanner.update(chunk)
+                    f.write(chunk)
+            info = scanner.metadata(name)
+            name = self._place(tmp_path, info['checksum'], ext)
+            remember(name, info)
+            return name
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_local(self, path, name):
+        """Move a file already inside this storage's directory into a blob.
+
+        Used for finished chunked uploads: the bytes are scanned in place
+        and renamed, never copied. Returns (blob name, sha256).
+        """
+        with open(path, 'rb') as f:
+            info = scan_file(f, name)
+        digest = info['checksum']
+        blob = self._place(path, digest, os.path.splitext(name)[1].lower())
+        remember(blob, info)
+        return blob, digest
+
+    def _place(self, tmp_path, digest, ext):
+        """Rename `tmp_path` to the blob for `digest`, or drop it if stored"""
+        name = blob_name(digest, ext)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Restart the GC grace period for a blob being reused
+            os.utime(path)
+            logger.debug(f"Deduplicated upload into {name}")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, path)
+        return name
+
+    def delete(self, name):
+        if is_blob(name):
+            logger.debug(f"Leaving shared blob {name} for garbage collection")
+            return
+        super().delete(name)
+
+
+def paper_storage():
+    """Storage for paper files and attachments (callable, for migrations)"""
+    if getattr(settings, 'PAPERS_CONTENT_ADDRESSED_STORAGE', True):
+        return ContentAddressedStorage()
+    return default_storage
+
+
+def apply_refs(deltas):
+    """Add `deltas` ({blob name: n}) to the blob reference counts"""
+    from .models import Blob
+
+    deltas = {name: n for name, n in deltas.items() if n and is_blob(name)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for name, n in deltas.items():
+            updated = Blob.objects.filter(name=name).update(refcount=F('refcount') + n)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        Blob.objects.create(
+                            name=name, sha256=sha256_from_name(name), size=_size(name), refcount=n
+                        )
+                except IntegrityError:
+                    # Another worker created the row first
+                    Blob.objects.filter(name=name).update(refcount=F('refcount') + n)
+        names = list(deltas)
+        Blob.objects.filter(name__in=names, refcount__lte=0, released_at__isnull=True).update(
+            released_at=timezone.now()
+        )
+        Blob.objects.filter(name__in=names, refcount__gt=0).update(released_at=None)
+
+
+def _size(name):
+    try:
+        return paper_storage().size(name)
+    except OSError:
+        return 0
+
+
+def file_name(instance):
+    """Name held in the model's `file` field: '' for none, None if deferred"""
+    if 'file' not in instance.__dict__:
+        return None
+    value = instance.__dict__['file']
+    return getattr(value, 'name', value) or ''
+
+
+def referenced_names():
+    """{blob name: number of PastPaper and attachment rows using it}"""
+    from .models import PastPaper, PastPaperAttachment
+
+    counts = Counter()
+    for model in (PastPaper, PastPaperAttachment):
+        for name in model.objects.filter(file__startswith=f'{BLOB_DIR}/').values_list('file', flat=True):
+            counts[name] += 1
+    return counts
+
+
+def recount():
+    """Recompute every reference count from the paper and attachment rows"""
+    from .models import Blob
+
+    counts = referenced_names()
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {blob.name: blob for blob in Blob.objects.all()}
+        for name, blob in existing.items():
+            blob.refcount = counts.get(name, 0)
+            if blob.refcount > 0:
+                blob.released_at = None
+            elif blob.released_at is None:
+                blob.released_at = now
+        Blob.objects.bulk_update(existing.values(), ['refcount', 'released_at'])
+        Blob.objects.bulk_create([
+            Blob(name=name, sha256=sha256_from_name(name), size=_size(name), refcount=n)
+            for name, n in counts.items() if name not in existing
+        ])
+    return len(counts)
+
+
+def collect_garbage(grace_seconds=None, dry_run=False):
+    """Delete unreferenced blobs, returning (files removed, bytes freed).
+
+    Covers blobs whose count dropped to zero (delete_paper, edit_paper)
+    and files that were stored but never saved on a row (failed
+    uploads). Both must have been unused for the grace period, so an
+    upload that is still between storing its file and saving its row is
+    never collected.
+    """
+    from .models import Blob, PastPaper, PastPaperAttachment
+
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, 'PAPERS_BLOB_GC_GRACE_SECONDS', 3600)
+    storage = ContentAddressedStorage()
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    cutoff_ts = cutoff.timestamp()
+
+    def in_use(name):
+        return (
+            PastPaper.objects.filter(file=name).exists()
+            or PastPaperAttachment.objects.filter(file=name).exists()
+        )
+
+    def recently_written(path):
+        try:
+            return os.path.getmtime(path) > cutoff_ts
+        except OSError:
+            return False
+
+    removed = freed = 0
+    known = set()
+    for blob in Blob.objects.filter(refcount__lte=0, released_at__lt=cutoff).iterator():
+        path = storage.path(blob.name)
+        if recently_written(path) or in_use(blob.name):
+            continue
+        removed += 1
+        freed += blob.size
+        if not dry_run:
+            if os.path.exists(path):
+                os.remove(path)
+            blob.delete()
+    known.update(Blob.objects.values_list('name', flat=True))
+
+    root = storage.path(BLOB_DIR)
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known or recently_written(path):
+                continue
+            # Leftover temp files, and blobs no row ever referenced
+            if name.startswith(f'{INCOMING_DIR}/') or (is_blob(name) and not in_use(name)):
+                removed += 1
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+    return removed, freed
+
+
+def adopt_legacy_files(dry_run=False):
+    """Move files stored before content addressing into blobs.
+
+    Rows pointing at identical legacy copies end up sharing one blob;
+    the legacy files are removed once no row refers to them. Returns
+    (rows updated, legacy files removed).
+    """
+    from django.core.files import File
+    from .models import PastPaper, PastPaperAttachment
+
+    storage = ContentAddressedStorage()
+    rows = files_removed = 0
+    for model in (PastPaper, PastPaperAttachment):
+        legacy = (
+            model.objects.exclude(file='').exclude(file__startswith=f'{BLOB_DIR}/')
+            .values_list('file', flat=True).distinct()
+        )
+        for old_name in list(legacy):
+            old_path = storage.path(old_name)
+            if not os.path.exists(old_path):
+                logger.warning(f"Legacy file {old_name} is missing; left as is")
+                continue
+            if dry_run:
+                rows += model.objects.filter(file=old_name).count()
+                continue
+            with open(old_path, 'rb') as f:
+                new_name = storage.save(old_name, File(f))
+            with transaction.atomic():
+                updated = model.objects.filter(file=old_name).update(file=new_name)
+                apply_refs({new_name: updated})
+            rows += updated
+            still_used = (
+                PastPaper.objects.filter(file=old_name).exists()
+                or PastPaperAttachment.objects.filter(file=old_name).exists()
+            )
+            if not still_used:
+                os.remove(old_path)
+                files_removed += 1
+    return rows, files_removed
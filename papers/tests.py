@@ -1,11 +1,75 @@
-from django.test import TestCase, Client
-from django.urls import reverse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import quote
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from .models import PastPaper, Profile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Lower
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone, translation
+
+from . import benchmarks, caching, chunked, extraction, pagecache, rollups, storage, thumbnails
+from .backends import EmailOrUsernameModelBackend
+from .counters import DownloadCounter, download_counter
+from .delivery import parse_range
+from .events import DownloadEventLog, download_events
+from .facets import facet_counts
+from .history import record_download
+from .ingest import IngestItem, ingest_papers
+from .jobs import claim_next_job, discard_staged, requeue_stale_jobs, run_job
+from .metadata import FileScanner
+from .models import (
+    Blob,
+    ChunkedUpload,
+    DepartmentDownloadRollup,
+    Download,
+    DownloadEvent,
+    PaperDownloadRollup,
+    PaperText,
+    PastPaper,
+    PastPaperAttachment,
+    Profile,
+    UploadJob,
+)
+from .pagination import CursorPaginator
+from .perf import QueryBudgetExceeded, request_metrics
+from .search import get_backend, search_papers
+from .zipstream import stream_zip
+
+# Uploads, blobs and thumbnails go here rather than the checked-in media/
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='papers-test-media-')
+
 
+@override_settings(
+    PAPERS_DOWNLOAD_FLUSH_INTERVAL=None, PAPERS_EVENT_FLUSH_INTERVAL=None, PAPERS_QUERY_BUDGET_STRICT=True,
+    PAPERS_PAGE_CACHE=False, MEDIA_ROOT=TEST_MEDIA_ROOT,
+)
 class BaseTestCase(TestCase):
     """Base setup for users and papers"""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         # Normal user
         self.user = User.objects.create_user(username='testuser', password='testpass')
@@ -35,6 +99,11 @@ class BaseTestCase(TestCase):
 
         self.client = Client()
 
+    def tearDown(self):
+        # Write buffered downloads inside the test's transaction
+        download_events.flush()
+        download_counter.flush()
+
 # ================================
 # Model Tests
 # ================================
@@ -181,3 +250,1888 @@ class SearchFilterTests(BaseTestCase):
         response = self.client.get(reverse('view_papers'), {'year': '2024'})
         self.assertContains(response, 'Math Paper')
         self.assertNotContains(response, 'CS Paper')
+
+# ================================
+# Full-text Search Index Tests
+# ================================
+class SearchIndexTests(BaseTestCase):
+    def test_search_matches_substrings(self):
+        results = search_papers(PastPaper.objects.all(), '101')
+        self.assertEqual(set(results), {self.paper1, self.paper2})
+
+        results = search_papers(PastPaper.objects.all(), 'math')
+        self.assertEqual(list(results), [self.paper1])
+
+    def test_relevance_prefers_title_matches(self):
+        paper3 = PastPaper.objects.create(
+            title="Algebra", course_code="ALG200", department="Mathematics",
+            year=2023, semester="Fall", file=self.paper_file, user=self.admin_user
+        )
+        paper4 = PastPaper.objects.create(
+            title="Mathematics Revision", course_code="REV300", department="Business",
+            year=2023, semester="Fall", file=self.paper_file, user=self.admin_user
+        )
+        results = search_papers(PastPaper.objects.all(), 'mathematics').order_by('search_rank')
+        self.assertEqual(list(results)[0], paper4)
+        self.assertIn(paper3, results)
+
+    def test_index_follows_save_and_delete(self):
+        self.paper2.title = "Operating Systems"
+        self.paper2.save()
+        self.assertEqual(list(search_papers(PastPaper.objects.all(), 'operating')), [self.paper2])
+
+        self.paper2.delete()
+        self.assertFalse(search_papers(PastPaper.objects.all(), 'operating').exists())
+
+    def test_short_query_falls_back_to_icontains(self):
+        results = search_papers(PastPaper.objects.all(), 'S1')
+        self.assertEqual(list(results), [self.paper2])
+
+    def test_rebuild_command(self):
+        get_backend().clear()
+        self.assertFalse(search_papers(PastPaper.objects.all(), 'paper').exists())
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search_papers(PastPaper.objects.all(), 'paper').count(), 2)
+
+    def test_view_orders_by_relevance(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('view_papers'), {'q': 'math', 'sort': 'relevance'})
+        self.assertEqual(list(response.context['papers']), [self.paper1])
+
+# ================================
+# Download Counter Tests
+# ================================
+class DownloadCounterTests(BaseTestCase):
+    def test_stale_instances_do_not_lose_increments(self):
+        first = PastPaper.objects.get(pk=self.paper1.pk)
+        second = PastPaper.objects.get(pk=self.paper1.pk)
+        first.increment_download_count()
+        second.increment_download_count()
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.download_count, 2)
+
+    def test_concurrent_increments_are_not_lost(self):
+        counter = DownloadCounter(flush_interval=None, max_pending=10 ** 9)
+        threads_count, per_thread = 8, 500
+
+        def worker():
+            for i in range(per_thread):
+                counter.increment(self.paper1.pk if i % 2 else self.paper2.pk)
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(counter.pending(), threads_count * per_thread)
+        self.assertEqual(counter.flush(), threads_count * per_thread)
+        self.assertEqual(counter.pending(), 0)
+
+        self.paper1.refresh_from_db()
+        self.paper2.refresh_from_db()
+        self.assertEqual(self.paper1.download_count, threads_count * per_thread // 2)
+        self.assertEqual(self.paper2.download_count, threads_count * per_thread // 2)
+
+    def test_flush_when_max_pending_reached(self):
+        counter = DownloadCounter(flush_interval=None, max_pending=3)
+        counter.increment(self.paper1.pk)
+        counter.increment(self.paper1.pk)
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.download_count, 0)
+
+        counter.increment(self.paper1.pk)
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.download_count, 3)
+
+    def test_download_view_buffers_and_records_once(self):
+        self.client.login(username='testuser', password='testpass')
+        url = reverse('download_paper', args=[self.paper1.id])
+        with override_settings(PAPERS_DOWNLOAD_FLUSH_INTERVAL=None, PAPERS_EVENT_FLUSH_INTERVAL=None):
+            self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(download_counter.pending(self.paper1.pk), 2)
+        download_counter.flush()
+        download_events.flush()
+
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.download_count, 2)
+        self.assertEqual(Download.objects.filter(user=self.user, paper=self.paper1).count(), 1)
+
+# ================================
+# File Delivery Tests
+# ================================
+@override_settings(PAPERS_DOWNLOAD_FLUSH_INTERVAL=None, PAPERS_EVENT_FLUSH_INTERVAL=None)
+class FileDeliveryTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass')
+        self.url = reverse('download_paper', args=[self.paper1.id])
+
+    def test_full_download_streams_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b"file_content")
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_if_none_match_returns_304_without_counting(self):
+        etag = self.client.get(self.url)['ETag']
+        download_counter.flush()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(download_counter.pending(self.paper1.pk), 0)
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 5-11/12')
+        self.assertEqual(b''.join(response.streaming_content), b"content")
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), b"tent")
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-200')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */12')
+
+    def test_stale_if_range_sends_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PAPERS_FILE_DELIVERY='nginx', PAPERS_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + quote(self.paper1.file.name))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(PAPERS_FILE_DELIVERY='sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.paper1.file.path)
+
+    def test_head_and_resumed_ranges_are_not_counted(self):
+        download_counter.flush()
+        self.client.head(self.url)
+        self.client.get(self.url, HTTP_RANGE='bytes=5-')
+        self.assertEqual(download_counter.pending(self.paper1.pk), 0)
+        self.client.get(self.url, HTTP_RANGE='bytes=0-')
+        self.assertEqual(download_counter.pending(self.paper1.pk), 1)
+
+    @override_settings(PAPERS_FILE_DELIVERY='nginx')
+    def test_proxy_ranges_are_counted_from_the_request(self):
+        download_counter.flush()
+        # nginx answers the Range itself, so Django's response is a 200
+        self.client.get(self.url, HTTP_RANGE='bytes=5-')
+        self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.client.head(self.url)
+        self.assertEqual(download_counter.pending(self.paper1.pk), 0)
+        self.client.get(self.url, HTTP_RANGE='bytes=0-99')
+        self.client.get(self.url)
+        self.assertEqual(download_counter.pending(self.paper1.pk), 2)
+
+    def test_suffix_range_of_empty_file_is_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=-10', 0)
+        self.assertEqual(parse_range('bytes=-10', 4), (0, 3))
+
+# ================================
+# ZIP Export Tests
+# ================================
+class ZipExportTests(BaseTestCase):
+    def test_stream_zip_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf_path = os.path.join(tmp, 'paper.pdf')
+            txt_path = os.path.join(tmp, 'notes.txt')
+            with open(pdf_path, 'wb') as f:
+                f.write(os.urandom(200 * 1024))
+            with open(txt_path, 'wb') as f:
+                f.write(b"notes " * 1000)
+
+            chunks = list(stream_zip([('a.pdf', pdf_path), ('b.txt', txt_path)], chunk_size=16 * 1024))
+            self.assertGreater(len(chunks), 2)
+            self.assertTrue(all(len(chunk) <= 32 * 1024 for chunk in chunks))
+
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.getinfo('a.pdf').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.getinfo('b.txt').compress_type, zipfile.ZIP_DEFLATED)
+            with open(pdf_path, 'rb') as f:
+                self.assertEqual(archive.read('a.pdf'), f.read())
+
+    def test_admin_action_streams_with_prefetched_attachments(self):
+        # Reuse the stored paper file so no upload path is needed
+        PastPaperAttachment.objects.create(past_paper=self.paper1, file=self.paper1.file.name)
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.post(reverse('admin:papers_pastpaper_changelist'), {
+            'action': 'download_selected_as_zip',
+            '_selected_action': [self.paper1.pk, self.paper2.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        # One query for the papers, one for all of their attachments
+        with self.assertNumQueries(2):
+            content = b''.join(response.streaming_content)
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertEqual(len(archive.namelist()), 3)
+
+# ================================
+# Bulk Ingestion Tests
+# ================================
+class IngestTests(BaseTestCase):
+    def pdf(self, name):
+        return SimpleUploadedFile(name, b"%PDF-1.4 " + name.encode(), content_type="application/pdf")
+
+    def test_ingest_reports_each_file(self):
+        items = [
+            IngestItem(self.pdf("a.pdf"), "Algebra", "MATH201"),
+            IngestItem(self.pdf("b.pdf"), "Math Paper", "MATH101"),   # already stored
+            IngestItem(self.pdf("c.pdf"), "Algebra", "MATH201"),      # duplicate in batch
+            IngestItem(self.pdf("d.txt"), "Notes", "MATH301"),
+            IngestItem(self.pdf("e.pdf"), "", "MATH401"),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            report = ingest_papers(items, "Mathematics", 2024, "1", self.admin_user)
+        paper_queries = [q['sql'] for q in queries if '"papers_pastpaper"' in q['sql']]
+        # One duplicate check and one multi-row INSERT, whatever the batch size
+        self.assertEqual(len(paper_queries), 2)
+
+        self.assertEqual([r.status for r in report.results],
+                         ['created', 'duplicate', 'duplicate', 'invalid', 'invalid'])
+        paper = report.created[0]
+        self.assertIsNotNone(paper.pk)
+        self.assertTrue(paper.file.storage.exists(paper.file.name))
+        self.assertEqual(list(search_papers(PastPaper.objects.all(), 'algebra')), [paper])
+
+    def test_upload_view_uses_bulk_ingest(self):
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.post(reverse('upload_paper'), {
+            'upload_type': 'bulk',
+            'bulk_department': 'Physics',
+            'bulk_year': '2023',
+            'bulk_semester': 'Fall',
+            'files': [self.pdf("p1.pdf"), self.pdf("p2.pdf")],
+            'course_codes[]': ['PHY101', 'PHY102'],
+            'titles[]': ['Mechanics', 'Optics'],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PastPaper.objects.filter(department='Physics').count(), 2)
+
+# ================================
+# Background Upload Job Tests
+# ================================
+@override_settings(PAPERS_BACKGROUND_UPLOADS=True)
+class UploadJobTests(BaseTestCase):
+    def post_bulk_upload(self):
+        self.client.login(username='admin', password='adminpass')
+        return self.client.post(reverse('upload_paper'), {
+            'upload_type': 'bulk',
+            'bulk_department': 'Chemistry',
+            'bulk_year': '2022',
+            'bulk_semester': 'Spring',
+            'files': [SimpleUploadedFile("c1.pdf", b"%PDF c1"), SimpleUploadedFile("c2.pdf", b"%PDF c2")],
+            'course_codes[]': ['CHE101', 'CHE102'],
+            'titles[]': ['Organic', 'Inorganic'],
+        })
+
+    def test_upload_is_queued_and_processed_by_worker(self):
+        response = self.post_bulk_upload()
+        job = response.context['job']
+        self.assertEqual(job.status, UploadJob.PENDING)
+        self.assertFalse(PastPaper.objects.filter(department='Chemistry').exists())
+
+        call_command('run_upload_worker', '--burst', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.DONE)
+        self.assertEqual(PastPaper.objects.filter(department='Chemistry').count(), 2)
+        for staged in job.payload['items']:
+            self.assertFalse(default_storage.exists(staged['path']))
+
+        status = self.client.get(reverse('upload_job_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['created'], 2)
+
+    def test_job_is_claimed_once(self):
+        self.post_bulk_upload()
+        job = claim_next_job()
+        self.assertEqual(job.status, UploadJob.RUNNING)
+        self.assertIsNone(claim_next_job())
+        discard_staged(job)
+
+    def assertStagingRemoved(self, job):
+        for staged in job.payload['items']:
+            self.assertFalse(default_storage.exists(staged['path']))
+        self.assertFalse(default_storage.exists(os.path.dirname(job.payload['items'][0]['path'])))
+
+    def test_failed_job_deletes_staged_files(self):
+        job = self.post_bulk_upload().context['job']
+        with mock.patch('papers.jobs.ingest_papers', side_effect=RuntimeError('disk full')):
+            run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (UploadJob.FAILED, 'disk full'))
+        self.assertStagingRemoved(job)
+
+    @override_settings(PAPERS_JOB_MAX_ATTEMPTS=1)
+    def test_timed_out_job_deletes_staged_files(self):
+        job = self.post_bulk_upload().context['job']
+        claim_next_job()
+        UploadJob.objects.filter(pk=job.pk).update(
+            attempts=1, started_at=timezone.now() - timedelta(hours=1),
+        )
+        requeue_stale_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, UploadJob.FAILED)
+        self.assertStagingRemoved(job)
+
+# ================================
+# Dashboard Cache Tests
+# ================================
+class DashboardCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_second_load_is_served_from_cache(self):
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertFalse(any('"papers_pastpaper"' in q['sql'] for q in queries))
+        self.assertEqual(len(response.context['recent_papers']), 2)
+
+        stats = caching.cache_stats()['dashboard:recent']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_recent_list_invalidated_on_save_and_delete(self):
+        self.assertEqual(caching.recent_papers.get()[0], self.paper2)
+        self.paper1.title = "Renamed"
+        self.paper1.save()
+        self.assertEqual(caching.recent_papers.get()[1].title, "Renamed")
+
+        self.paper2.delete()
+        self.assertEqual(caching.recent_papers.get(), [self.paper1])
+
+    def test_popular_list_refreshed_after_counter_flush(self):
+        self.assertEqual(caching.popular_papers.get()[0].download_count, 0)
+        counter = DownloadCounter(flush_interval=None)
+        counter.increment(self.paper2.pk, 3)
+        self.assertEqual(caching.popular_papers.get()[0].download_count, 0)
+
+        counter.flush()
+        self.assertEqual(caching.popular_papers.get()[0], self.paper2)
+        self.assertEqual(caching.popular_papers.get()[0].download_count, 3)
+
+# ================================
+# Query Plan Regression Tests
+# ================================
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class QueryPlanTests(BaseTestCase):
+    FILTERS = [
+        {},
+        {'department': 'Mathematics'},
+        {'year': '2024'},
+        {'department': 'Mathematics', 'year': '2024'},
+        {'filter': 'recent'},
+        {'filter': 'files'},
+        {'q': 'paper'},
+    ]
+    SORTS = ['relevance', 'title', '-uploaded_at', '-year']
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?papers_pastpaper$')
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall() if self.FULL_SCAN.match(row[-1])]
+
+    def test_view_papers_variants_use_indexes(self):
+        self.client.login(username='testuser', password='testpass')
+        for filters in self.FILTERS:
+            for sort in self.SORTS:
+                params = dict(filters, sort=sort)
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(reverse('view_papers'), params)
+                for query in queries:
+                    sql = query['sql']
+                    if '"papers_pastpaper"' not in sql or not sql.startswith('SELECT'):
+                        continue
+                    with self.subTest(params=params, sql=sql):
+                        self.assertEqual(self.full_scans(sql), [])
+
+    def test_home_and_downloads_use_indexes(self):
+        queries = [
+            PastPaper.objects.order_by('-download_count')[:5],
+            PastPaper.objects.order_by('-uploaded_at')[:5],
+            Download.objects.filter(user=self.user).order_by('-downloaded_at'),
+        ]
+        for queryset in queries:
+            sql = str(queryset.query)
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(sql=sql):
+                self.assertFalse([d for d in details if d.startswith('SCAN') and 'INDEX' not in d])
+                self.assertFalse([d for d in details if 'TEMP B-TREE' in d])
+
+# ================================
+# Facet Count Tests
+# ================================
+class FacetTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+
+    def counts(self, field, **kwargs):
+        return {f.value: f.count for f in facet_counts(**kwargs)[field]}
+
+    def test_counts_follow_inserts_updates_and_deletes(self):
+        self.assertEqual(self.counts('department'), {'Mathematics': 1, 'Computer Science': 1})
+
+        self.paper2.department = 'Mathematics'
+        self.paper2.save()
+        self.assertEqual(self.counts('department'), {'Mathematics': 2})
+
+        self.paper1.delete()
+        self.assertEqual(self.counts('department'), {'Mathematics': 1})
+        self.assertEqual(self.counts('year'), {'2025': 1})
+
+    def test_counts_match_rebuild(self):
+        ingest_papers([IngestItem(SimpleUploadedFile("p.pdf", b"%PDF"), "Optics", "PHY201")],
+                      "Physics", 2024, "1", self.admin_user)
+        PastPaper.objects.only('id', 'title').get(pk=self.paper1.pk).save()
+        before = {f: self.counts(f) for f in ('department', 'year', 'semester')}
+
+        call_command('rebuild_facets', stdout=StringIO())
+        after = {f: self.counts(f) for f in ('department', 'year', 'semester')}
+        self.assertEqual(before, after)
+        self.assertEqual(after['year'], {'2025': 1, '2024': 2})
+
+    def test_counts_restricted_to_search(self):
+        results = search_papers(PastPaper.objects.all(), 'math')
+        self.assertEqual(self.counts('department', queryset=results, search_key='math'), {'Mathematics': 1})
+
+    def test_view_papers_reads_cached_facets(self):
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(reverse('view_papers'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('view_papers'))
+        self.assertFalse(any('DISTINCT' in q['sql'] or 'papers_facetcount' in q['sql'] for q in queries))
+        self.assertEqual([d.label for d in response.context['departments']],
+                         ['Computer Science (1)', 'Mathematics (1)'])
+
+# ================================
+# Cursor Pagination Tests
+# ================================
+class CursorPaginationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        for i in range(23):
+            PastPaper.objects.create(
+                title=f"Paper {i % 5}", course_code=f"GEN{i:03d}", department="Business",
+                year=2000 + i % 4, semester="Fall", file=self.paper_file.name, user=self.admin_user
+            )
+
+    def walk(self, ordering):
+        paginator = CursorPaginator(PastPaper.objects.all(), 10, ordering)
+        pages, page = [], paginator.get_page()
+        while True:
+            pages.append([p.pk for p in page])
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        return paginator, page, pages
+
+    def test_forward_walk_matches_offset_ordering(self):
+        for ordering in (['-uploaded_at'], ['title'], ['-year']):
+            with self.subTest(ordering=ordering):
+                paginator, _, pages = self.walk(ordering)
+                expected = list(paginator.queryset.values_list('pk', flat=True))
+                self.assertEqual([pk for page in pages for pk in page], expected)
+                self.assertEqual([len(page) for page in pages], [10, 10, 5])
+                self.assertEqual(paginator.count, 25)
+
+    def test_backward_walk(self):
+        paginator, last_page, pages = self.walk(['title'])
+        previous = paginator.get_page(last_page.previous_cursor)
+        self.assertEqual([p.pk for p in previous], pages[1])
+        first = paginator.get_page(previous.previous_cursor)
+        self.assertEqual([p.pk for p in first], pages[0])
+        self.assertFalse(first.has_previous())
+
+    def test_tampered_cursor_returns_first_page(self):
+        paginator = CursorPaginator(PastPaper.objects.all(), 10, ['-uploaded_at'])
+        page = paginator.get_page('not-a-cursor')
+        self.assertFalse(page.has_previous())
+        self.assertEqual(len(page), 10)
+
+    @override_settings(PAPERS_CURSOR_PAGINATION=True)
+    def test_view_papers_uses_cursor_links(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('view_papers'), {'sort': 'title'})
+        page = response.context['papers']
+        self.assertTrue(page.is_cursor)
+        self.assertContains(response, 'cursor=')
+
+        response = self.client.get(reverse('view_papers'), {'sort': 'title', 'cursor': page.next_cursor})
+        second = response.context['papers']
+        self.assertTrue(second.has_previous())
+        self.assertFalse(set(p.pk for p in page) & set(p.pk for p in second))
+
+    @override_settings(PAPERS_CURSOR_PAGINATION=True)
+    def test_counts_are_cached_per_filter(self):
+        self.client.login(username='testuser', password='testpass')
+        url = reverse('view_papers')
+        self.client.get(url, {'filter': 'recent'})
+
+        # The "recent" filter embeds the current time in its SQL, yet the
+        # count is reused, for later pages too
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'filter': 'recent', 'cursor': 'x'})
+            self.assertEqual(response.context['papers'].paginator.count, 25)
+        self.assertFalse([q for q in queries if '__count' in q['sql']])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'filter': 'files'}).context['papers'].paginator.count
+        self.assertTrue([q for q in queries if '__count' in q['sql']])
+
+    @override_settings(PAPERS_CURSOR_PAGINATION=True)
+    def test_download_counts_follow_new_downloads(self):
+        self.client.login(username='testuser', password='testpass')
+        record_download(self.user, self.paper1)
+        response = self.client.get(reverse('my_downloads'))
+        self.assertEqual(response.context['downloads'].paginator.count, 1)
+        record_download(self.user, self.paper2)
+        response = self.client.get(reverse('my_downloads'))
+        self.assertEqual(response.context['downloads'].paginator.count, 2)
+
+        # Counts of per-user lists aren't shared
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.get(reverse('my_downloads'))
+        self.assertEqual(response.context['downloads'].paginator.count, 0)
+
+# ================================
+# Download History Tests
+# ================================
+class DownloadHistoryTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_history_query_count_is_flat(self):
+        record_download(self.user, self.paper1)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(reverse('my_downloads'))
+
+        # Other users' downloads and more rows must not add queries
+        other = User.objects.create_user(username='other', password='x')
+        record_download(other, self.paper1)
+        record_download(self.user, self.paper2)
+        with CaptureQueriesContext(connection) as two:
+            response = self.client.get(reverse('my_downloads'))
+
+        self.assertEqual(len(one), len(two))
+        self.assertEqual([d.paper for d in response.context['downloads']], [self.paper2, self.paper1])
+
+    def test_repeat_download_keeps_one_row_with_latest_time(self):
+        record_download(self.user, self.paper1, when=timezone.now() - timedelta(days=1))
+        first = Download.objects.get(user=self.user, paper=self.paper1).downloaded_at
+        record_download(self.user, self.paper1)
+        rows = Download.objects.filter(user=self.user, paper=self.paper1)
+        self.assertEqual(rows.count(), 1)
+        self.assertGreater(rows.get().downloaded_at, first)
+        self.assertEqual(DownloadEvent.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(PAPERS_DOWNLOAD_HISTORY='full')
+    def test_full_history_keeps_every_download(self):
+        record_download(self.user, self.paper1)
+        record_download(self.user, self.paper1)
+        response = self.client.get(reverse('my_downloads'), {'all': '1'})
+        self.assertEqual(len(response.context['downloads']), 2)
+        response = self.client.get(reverse('my_downloads'))
+        self.assertEqual(len(response.context['downloads']), 1)
+
+# ================================
+# Download Event Tests
+# ================================
+class DownloadEventTests(BaseTestCase):
+    def test_flush_writes_events_and_latest_download(self):
+        log = DownloadEventLog(flush_interval=None, max_pending=10 ** 9)
+        earlier = timezone.now() - timedelta(hours=2)
+        log.record(self.user.pk, self.paper1.pk, when=earlier)
+        log.record(self.user.pk, self.paper1.pk)
+        log.record(self.user.pk, self.paper2.pk)
+        self.assertEqual(log.pending(), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(log.flush(), 3)
+        # Transaction plus one insert for events and one upsert for downloads
+        writes = [q for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(DownloadEvent.objects.count(), 3)
+        self.assertEqual(Download.objects.filter(user=self.user).count(), 2)
+        self.assertGreater(Download.objects.get(user=self.user, paper=self.paper1).downloaded_at, earlier)
+
+    def test_ring_buffer_drops_oldest_when_full(self):
+        log = DownloadEventLog(flush_interval=None, max_pending=10 ** 9, capacity=2)
+        for paper in (self.paper1, self.paper2, self.paper1):
+            log.record(self.user.pk, paper.pk)
+        self.assertEqual(log.pending(), 2)
+        self.assertEqual(log.dropped, 1)
+        self.assertEqual(log.flush(), 2)
+
+    def test_events_for_deleted_papers_are_dropped(self):
+        log = DownloadEventLog(flush_interval=None, max_pending=10 ** 9)
+        log.record(self.user.pk, self.paper1.pk)
+        log.record(self.user.pk, self.paper2.pk)
+        self.paper1.delete()
+
+        # The other paper's download is still written, and nothing is left behind
+        self.assertEqual(log.flush(), 1)
+        self.assertEqual(log.pending(), 0)
+        self.assertEqual(list(Download.objects.values_list('paper_id', flat=True)), [self.paper2.pk])
+        self.assertEqual(log.flush(), 0)
+
+    @override_settings(PAPERS_DOWNLOAD_FLUSH_INTERVAL=None, PAPERS_EVENT_FLUSH_INTERVAL=None)
+    def test_download_view_makes_no_history_writes(self):
+        self.client.login(username='testuser', password='testpass')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('download_paper', args=[self.paper1.id]))
+        self.assertFalse([q for q in queries if 'papers_download' in q['sql'] and 'INSERT' in q['sql']])
+        self.assertEqual(download_events.pending(), 1)
+        download_events.flush()
+        download_counter.flush()
+        self.assertTrue(Download.objects.filter(user=self.user, paper=self.paper1).exists())
+
+# ================================
+# Download Rollup Tests
+# ================================
+@override_settings(PAPERS_ROLLUP_LAG_SECONDS=0)
+class DownloadRollupTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        record_download(self.user, self.paper1, when=now)
+        record_download(self.user, self.paper1, when=now)
+        record_download(self.user, self.paper2, when=now - timedelta(days=2))
+
+    def test_rollups_aggregate_by_day_and_department(self):
+        self.assertEqual(rollups.roll_up(), 3)
+        today = PaperDownloadRollup.objects.get(paper=self.paper1, period='day', bucket=self.today)
+        self.assertEqual(today.count, 2)
+        departments = DepartmentDownloadRollup.objects.filter(period='day')
+        self.assertEqual(departments.get(department='Mathematics').count, 2)
+        self.assertEqual(departments.get(department='Computer Science').count, 1)
+        self.assertEqual(
+            sum(PaperDownloadRollup.objects.filter(period='hour').values_list('count', flat=True)), 3
+        )
+
+    def test_rollups_are_incremental(self):
+        rollups.roll_up()
+        self.assertEqual(rollups.roll_up(), 0)
+        record_download(self.user, self.paper1)
+        self.assertEqual(rollups.roll_up(batch_size=1), 1)
+        today = PaperDownloadRollup.objects.get(paper=self.paper1, period='day', bucket=self.today)
+        self.assertEqual(today.count, 3)
+
+    def test_recent_events_wait_for_the_lag(self):
+        rollups.roll_up()
+        record_download(self.user, self.paper1)
+        # A concurrent flush could still commit a lower id than this one
+        self.assertEqual(rollups.roll_up(lag=60), 0)
+        # An older event written later covers every id below it
+        record_download(self.user, self.paper2, when=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(rollups.roll_up(lag=60), 2)
+        self.assertEqual(rollups.roll_up(lag=0), 0)
+
+    def test_prune_keeps_recent_events(self):
+        rollups.roll_up()
+        self.assertEqual(rollups.prune_events(retention_days=1), 1)
+        self.assertEqual(DownloadEvent.objects.count(), 2)
+        with override_settings(PAPERS_DOWNLOAD_HISTORY='full'):
+            self.assertEqual(rollups.prune_events(retention_days=0), 0)
+
+    @override_settings(PAPERS_POPULAR_WINDOW_DAYS=1)
+    def test_popular_list_uses_window(self):
+        rollups.roll_up()
+        caching.popular_papers.invalidate()
+        self.assertEqual(caching.popular_papers.get(), [self.paper1])
+
+    def test_admin_shows_department_downloads(self):
+        call_command('rollup_downloads', stdout=StringIO())
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.get(reverse('admin:papers_pastpaper_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Last 7 days')
+        rows = {row['department']: row for row in response.context['department_downloads']}
+        self.assertEqual(rows['Mathematics']['today'], 2)
+        self.assertEqual(rows['Computer Science']['today'], 0)
+        self.assertEqual(rows['Computer Science']['week'], 1)
+
+# ================================
+# Text Extraction Tests
+# ================================
+def make_pdf(text, compress=False):
+    """A one-page PDF showing `text` in Helvetica"""
+    content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+    stream_dict = f"/Length {len(content)}"
+    if compress:
+        content = zlib.compress(content)
+        stream_dict = f"/Length {len(content)} /Filter /FlateDecode"
+    return (
+        b"%PDF-1.4\n"
+        b"1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+        b"2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n"
+        b"3 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >> endobj\n"
+        + f"4 0 obj << {stream_dict} >> stream\n".encode('latin-1') + content + b"\nendstream endobj\n"
+        b"5 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n"
+        b"trailer << /Root 1 0 R >>\n%%EOF\n"
+    )
+
+
+@override_settings(PAPERS_TEXT_EXTRACTION='sync')
+class TextExtractionTests(BaseTestCase):
+    def upload(self, text, title="Linear Algebra"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PastPaper.objects.create(
+                title=title, course_code="LA201", department="Mathematics", year=2023,
+                semester="Fall", user=self.admin_user,
+                file=SimpleUploadedFile("la.pdf", make_pdf(text), content_type="application/pdf"),
+            )
+
+    def test_extract_plain_and_compressed_streams(self):
+        for compress in (False, True):
+            with tempfile.NamedTemporaryFile(suffix='.pdf') as f:
+                f.write(make_pdf("Define an eigenvalue", compress=compress))
+                f.flush()
+                self.assertIn("Define an eigenvalue", extraction.extract_text(f.name))
+
+    def test_saved_paper_is_searchable_by_content(self):
+        paper = self.upload("Compute the eigenvalue decomposition")
+        record = PaperText.objects.get(paper=paper)
+        self.assertIn("eigenvalue decomposition", record.content)
+        self.assertLess(len(record.data), 200)
+        self.assertEqual(list(search_papers(PastPaper.objects.all(), "eigenvalue")), [paper])
+
+    def test_attachment_text_is_added(self):
+        paper = self.upload("Question one")
+        name = default_storage.save('papers/extra.pdf', io.BytesIO(make_pdf("Marking scheme")))
+        self.addCleanup(default_storage.delete, name)
+        with self.captureOnCommitCallbacks(execute=True):
+            PastPaperAttachment.objects.create(past_paper=paper, file=name)
+        self.assertIn("Marking scheme", extraction.paper_texts([paper.pk])[paper.pk])
+
+    def test_extracted_once_per_transaction(self):
+        paper = self.upload("Question one")
+        name = default_storage.save('papers/extra.pdf', io.BytesIO(make_pdf("Marking scheme")))
+        self.addCleanup(default_storage.delete, name)
+        with mock.patch('papers.extraction.schedule_extraction') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                paper.file = name
+                paper.save()
+                PastPaperAttachment.objects.create(past_paper=paper, file=name)
+            self.assertEqual(schedule.call_count, 1)
+
+            # A rolled-back transaction doesn't hold up the next one
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                PastPaperAttachment.objects.create(past_paper=paper, file=name)
+                raise RuntimeError
+            with self.captureOnCommitCallbacks(execute=True):
+                PastPaperAttachment.objects.create(past_paper=paper, file=name)
+            self.assertEqual(schedule.call_count, 2)
+
+    def test_metadata_edit_skips_extraction(self):
+        paper = self.upload("Question one")
+        paper = PastPaper.objects.get(pk=paper.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            paper.title = "Renamed"
+            paper.save()
+        self.assertEqual(callbacks, [])
+
+        self.client.login(username='admin', password='adminpass')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('edit_paper', args=[paper.pk]), {
+                'title': 'Edited', 'course_code': paper.course_code, 'department': paper.department,
+                'year': paper.year, 'semester': paper.semester,
+            })
+        self.assertEqual(PastPaper.objects.get(pk=paper.pk).title, 'Edited')
+        self.assertEqual(callbacks, [])
+
+    def test_outdated_text_is_discarded(self):
+        paper = self.upload("First version")
+        old = extraction.file_signature(extraction.paper_files(paper))
+        paper.file = SimpleUploadedFile("la2.pdf", make_pdf("Second, longer version"), content_type="application/pdf")
+        with mock.patch('papers.extraction.schedule_extraction'):
+            paper.save()
+        new = extraction.file_signature(extraction.paper_files(paper))
+
+        # The extraction of the old file finishes after the new one
+        extraction.store_text(paper.pk, "Second, longer version", new)
+        extraction.store_text(paper.pk, "First version", old)
+        self.assertEqual(PaperText.objects.get(paper=paper).content, "Second, longer version")
+
+    def test_pool_spawns_workers(self):
+        with mock.patch('papers.extraction._pool', None):
+            pool = extraction.get_pool()
+            try:
+                self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+            finally:
+                pool.shutdown()
+
+    def test_download_count_update_skips_extraction(self):
+        paper = self.upload("Question one")
+        with self.captureOnCommitCallbacks() as callbacks:
+            paper.download_count = 5
+            paper.save(update_fields=['download_count'])
+        self.assertEqual(callbacks, [])
+
+    def test_backfill_command(self):
+        with override_settings(PAPERS_TEXT_EXTRACTION='off'):
+            paper = self.upload("Thermodynamics entropy")
+        self.assertFalse(PaperText.objects.filter(paper=paper).exists())
+
+        out = StringIO()
+        call_command('extract_paper_text', workers=1, stdout=out)
+        self.assertIn("processed", out.getvalue())
+        self.assertIn("entropy", PaperText.objects.get(paper=paper).content)
+
+        out = StringIO()
+        call_command('extract_paper_text', workers=1, stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+# ================================
+# Thumbnail Tests
+# ================================
+@override_settings(PAPERS_THUMBNAIL_RENDERER='text')
+class ThumbnailTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.thumb_dir = tempfile.mkdtemp()
+        self.override = override_settings(PAPERS_THUMBNAIL_DIR=self.thumb_dir)
+        self.override.enable()
+        self.client.login(username='testuser', password='testpass')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.thumb_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_thumbnail_rendered_once_and_cached(self):
+        url = thumbnails.thumbnail_url(self.paper1)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+
+        path = thumbnails.thumbnail_path(thumbnails.content_key(self.paper1.file))
+        rendered_at = os.stat(path).st_ino
+        self.client.get(url)
+        self.assertEqual(os.stat(path).st_ino, rendered_at)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_same_content_shares_one_thumbnail(self):
+        # Both sample papers were uploaded with identical bytes
+        self.assertEqual(
+            thumbnails.content_key(self.paper1.file), thumbnails.content_key(self.paper2.file)
+        )
+
+    def test_stale_key_redirects(self):
+        response = self.client.get(reverse('paper_thumbnail', args=[self.paper1.pk, 'old']))
+        self.assertRedirects(response, thumbnails.thumbnail_url(self.paper1), fetch_redirect_response=False)
+
+    def test_listing_uses_thumbnails(self):
+        response = self.client.get(reverse('view_papers'))
+        self.assertContains(response, thumbnails.thumbnail_url(self.paper1))
+
+    def test_lru_eviction_removes_oldest(self):
+        paths = []
+        for i, key in enumerate(['aa' + 'a' * 62, 'bb' + 'b' * 62, 'cc' + 'c' * 62]):
+            path = thumbnails.thumbnail_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+            paths.append(path)
+        thumbnails.touch(paths[0])
+
+        self.assertEqual(thumbnails.evict(max_bytes=250), 1)
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def test_directory_walked_only_when_full(self):
+        size = len(thumbnails.render(self.paper1))
+        papers = [self.paper1]
+        for i in range(3):
+            papers.append(PastPaper.objects.create(
+                title=f"Paper {i}", course_code=f"GEN{i:03d}", department="Business", year="2024",
+                semester="1", file=SimpleUploadedFile(f"p{i}.pdf", f"content {i}".encode()), user=self.admin_user,
+            ))
+        with override_settings(PAPERS_THUMBNAIL_CACHE_BYTES=int(size * 3.5)), \
+                mock.patch('papers.thumbnails._entries', wraps=thumbnails._entries) as walk:
+            # The first render finds no running total and counts once
+            thumbnails.get_thumbnail(papers[0])
+            self.assertEqual(walk.call_count, 1)
+            thumbnails.get_thumbnail(papers[1])
+            thumbnails.get_thumbnail(papers[2])
+            self.assertEqual(walk.call_count, 1)
+            # The fourth goes over the limit
+            thumbnails.get_thumbnail(papers[3])
+            self.assertEqual(walk.call_count, 2)
+        remaining = sum(size for _, size, _ in thumbnails._entries())
+        self.assertLessEqual(remaining, int(size * 3.5) * 0.9)
+
+    def test_regenerate_command(self):
+        out = StringIO()
+        call_command('regenerate_thumbnails', stdout=out)
+        self.assertIn("Rendered 2 thumbnails", out.getvalue())
+        out = StringIO()
+        call_command('regenerate_thumbnails', missing=True, stdout=out)
+        self.assertIn("Rendered 0 thumbnails (2 up to date", out.getvalue())
+
+# ================================
+# Content-Addressed Storage Tests
+# ================================
+class BlobStorageTests(BaseTestCase):
+    def blob_path(self, name):
+        return self.paper1.file.storage.path(name)
+
+    def test_identical_uploads_share_one_blob(self):
+        self.assertTrue(storage.is_blob(self.paper1.file.name))
+        self.assertEqual(self.paper1.file.name, self.paper2.file.name)
+        self.assertEqual(Blob.objects.get(name=self.paper1.file.name).refcount, 2)
+        self.assertTrue(self.paper1.get_filename().startswith("MATH101 Math Paper"))
+
+    def test_attachment_reference_is_counted(self):
+        attachment = PastPaperAttachment.objects.create(past_paper=self.paper1, file=self.paper1.file.name)
+        self.assertEqual(Blob.objects.get(name=self.paper1.file.name).refcount, 3)
+        attachment.delete()
+        self.assertEqual(Blob.objects.get(name=self.paper1.file.name).refcount, 2)
+
+    def test_delete_paper_keeps_shared_blob_until_collected(self):
+        name = self.paper1.file.name
+        self.client.login(username='admin', password='adminpass')
+        self.client.get(reverse('delete_paper', args=[self.paper1.id]))
+        self.assertTrue(os.path.exists(self.blob_path(name)))
+        self.assertEqual(Blob.objects.get(name=name).refcount, 1)
+
+        self.client.get(reverse('delete_paper', args=[self.paper2.id]))
+        blob = Blob.objects.get(name=name)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.released_at)
+
+        self.assertEqual(storage.collect_garbage()[0], 0)  # still in the grace period
+        Blob.objects.filter(name=name).update(released_at=timezone.now() - timedelta(hours=2))
+        os.utime(self.blob_path(name), (0, 0))
+        removed, freed = storage.collect_garbage()
+        self.assertGreaterEqual(removed, 1)
+        self.assertFalse(os.path.exists(self.blob_path(name)))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_edit_paper_moves_reference_to_new_blob(self):
+        old_name = self.paper1.file.name
+        self.client.login(username='admin', password='adminpass')
+        self.client.post(reverse('edit_paper', args=[self.paper1.id]), {
+            'title': 'Math Paper', 'course_code': 'MATH101', 'department': 'Mathematics',
+            'year': '2024', 'semester': '1',
+            'file': SimpleUploadedFile("new.pdf", b"new content", content_type="application/pdf"),
+        })
+        self.paper1.refresh_from_db()
+        self.assertNotEqual(self.paper1.file.name, old_name)
+        self.assertEqual(Blob.objects.get(name=old_name).refcount, 1)
+        self.assertEqual(Blob.objects.get(name=self.paper1.file.name).refcount, 1)
+
+    def test_gc_removes_stray_blobs_after_grace(self):
+        name = self.paper1.file.storage.save('papers/stray.pdf', io.BytesIO(b"never saved on a row"))
+        self.assertEqual(name, storage.blob_name(hashlib.sha256(b"never saved on a row").hexdigest(), '.pdf'))
+        storage.collect_garbage()
+        self.assertTrue(os.path.exists(self.blob_path(name)))
+
+        os.utime(self.blob_path(name), (0, 0))
+        out = StringIO()
+        call_command('gc_blobs', dry_run=True, stdout=out)
+        self.assertIn("Would remove", out.getvalue())
+        self.assertTrue(os.path.exists(self.blob_path(name)))
+        call_command('gc_blobs', stdout=StringIO())
+        self.assertFalse(os.path.exists(self.blob_path(name)))
+
+    def test_adopt_legacy_copies(self):
+        legacy = [default_storage.save('papers/legacy.pdf', io.BytesIO(b"legacy exam")) for _ in range(2)]
+        self.assertNotEqual(legacy[0], legacy[1])
+        PastPaper.objects.filter(pk=self.paper1.pk).update(file=legacy[0])
+        PastPaper.objects.filter(pk=self.paper2.pk).update(file=legacy[1])
+
+        call_command('gc_blobs', adopt=True, recount=True, stdout=StringIO())
+        self.paper1.refresh_from_db()
+        self.paper2.refresh_from_db()
+        self.assertTrue(storage.is_blob(self.paper1.file.name))
+        self.assertEqual(self.paper1.file.name, self.paper2.file.name)
+        self.assertEqual(Blob.objects.get(name=self.paper1.file.name).refcount, 2)
+        self.assertFalse(any(default_storage.exists(name) for name in legacy))
+
+# ================================
+# Chunked Upload Tests
+# ================================
+@override_settings(PAPERS_UPLOAD_CHUNK_SIZE=8)
+class ChunkedUploadTests(BaseTestCase):
+    data = b"%PDF-1.4 chunked exam paper"
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='admin', password='adminpass')
+
+    def start(self, data=None, filename="big.pdf", **extra):
+        data = self.data if data is None else data
+        response = self.client.post(
+            reverse('chunked_upload_init'),
+            data={'filename': filename, 'size': len(data), **extra},
+            content_type='application/json',
+        )
+        return response
+
+    def put(self, upload_id, data, offset, total, checksum=None):
+        chunk = data[offset:offset + 8]
+        return self.client.put(
+            reverse('chunked_upload', args=[upload_id]),
+            data=chunk,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {offset}-{offset + len(chunk) - 1}/{total}',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def upload(self, data=None):
+        data = self.data if data is None else data
+        upload_id = self.start(data).json()['id']
+        for offset in range(0, len(data), 8):
+            self.assertEqual(self.put(upload_id, data, offset, len(data)).status_code, 200)
+        response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+        return upload_id
+
+    def test_upload_is_assembled_into_a_blob(self):
+        upload_id = self.upload()
+        upload = ChunkedUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.status, ChunkedUpload.COMPLETE)
+        self.assertEqual(upload.stored_name, storage.blob_name(hashlib.sha256(self.data).hexdigest(), '.pdf'))
+        with self.paper1.file.storage.open(upload.stored_name) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(chunked.part_path(upload)))
+
+    def test_checksum_mismatch_is_rejected_and_can_be_resent(self):
+        upload_id = self.start().json()['id']
+        response = self.put(upload_id, self.data, 0, len(self.data), checksum='0' * 64)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['received'], 0)
+        response = self.put(upload_id, self.data, 0, len(self.data))
+        self.assertEqual(response.json()['received'], 8)
+
+    def test_wrong_offset_reports_where_to_resume(self):
+        upload_id = self.start().json()['id']
+        self.put(upload_id, self.data, 0, len(self.data))
+        response = self.put(upload_id, self.data, 16, len(self.data))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 8)
+        state = self.client.get(reverse('chunked_upload', args=[upload_id])).json()
+        self.assertEqual(state['received'], 8)
+
+    def test_resent_chunk_is_acknowledged_once(self):
+        upload_id = self.start().json()['id']
+        self.put(upload_id, self.data, 0, len(self.data))
+        response = self.put(upload_id, self.data, 0, len(self.data))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received'], 8)
+
+    def test_finalize_checks_whole_file_hash(self):
+        upload_id = self.start(sha256='f' * 64).json()['id']
+        for offset in range(0, len(self.data), 8):
+            self.put(upload_id, self.data, offset, len(self.data))
+        response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 422)
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        upload_id = self.start().json()['id']
+        response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_non_pdf_is_rejected(self):
+        self.assertEqual(self.start(filename="notes.txt").status_code, 400)
+
+    def test_regular_users_cannot_upload(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertNotEqual(self.start().status_code, 201)
+
+    def test_single_upload_form_takes_an_upload_id(self):
+        upload_id = self.upload()
+        self.client.post(reverse('upload_paper'), {
+            'upload_type': 'single', 'title': 'Chunked', 'course_code': 'BIG101',
+            'department': 'Physics', 'year': '2024', 'semester': '1', 'file_upload_id': upload_id,
+        })
+        paper = PastPaper.objects.get(course_code='BIG101')
+        self.assertEqual(paper.file.name, ChunkedUpload.objects.get(pk=upload_id).stored_name)
+        self.assertEqual(Blob.objects.get(name=paper.file.name).refcount, 1)
+
+    def test_bulk_upload_form_takes_upload_ids(self):
+        ids = [self.upload(b"%PDF first"), self.upload(b"%PDF second")]
+        self.client.post(reverse('upload_paper'), {
+            'upload_type': 'bulk', 'bulk_department': 'Physics', 'bulk_year': '2023',
+            'bulk_semester': 'Fall', 'files_upload_id': ids,
+            'course_codes[]': ['PHY201', 'PHY202'], 'titles[]': ['First', 'Second'],
+        })
+        self.assertEqual(PastPaper.objects.filter(course_code__in=['PHY201', 'PHY202']).count(), 2)
+
+    def test_unknown_upload_id_is_an_error(self):
+        self.client.post(reverse('upload_paper'), {
+            'upload_type': 'single', 'title': 'Chunked', 'course_code': 'BIG101',
+            'department': 'Physics', 'year': '2024', 'semester': '1', 'file_upload_id': 'nope',
+        })
+        self.assertFalse(PastPaper.objects.filter(course_code='BIG101').exists())
+
+    def test_stale_uploads_expire(self):
+        upload_id = self.start().json()['id']
+        upload = ChunkedUpload.objects.get(pk=upload_id)
+        ChunkedUpload.objects.filter(pk=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(chunked.expire_uploads(), 1)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload_id).exists())
+        self.assertFalse(os.path.exists(chunked.part_path(upload)))
+
+# ================================
+# Performance Instrumentation Tests
+# ================================
+class PerformanceTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        request_metrics.clear()
+
+    def add_papers(self, n):
+        for i in range(n):
+            paper = PastPaper.objects.create(
+                title=f"Paper {i}", course_code=f"GEN{i:03d}", department="Physics",
+                year=2020, semester="1", file=self.paper1.file.name, user=self.admin_user,
+            )
+            PastPaperAttachment.objects.create(past_paper=paper, file=self.paper1.file.name)
+            Download.objects.create(user=self.user, paper=paper)
+
+    def test_request_is_recorded_with_view_name(self):
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(reverse('view_papers'))
+        entry = request_metrics.entries()[-1]
+        self.assertEqual(entry['view'], 'view_papers')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertGreater(entry['bytes'], 0)
+        self.assertEqual(entry['budget'], 12)
+
+    @override_settings(PAPERS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('view_papers'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=')
+
+    @override_settings(PAPERS_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        response = self.client.get(reverse('view_papers'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PAPERS_QUERY_BUDGETS={'view_papers': 1})
+    def test_over_budget_fails_when_strict(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('view_papers'))
+
+    @override_settings(PAPERS_QUERY_BUDGETS={'view_papers': 1}, PAPERS_QUERY_BUDGET_STRICT=False)
+    def test_over_budget_is_logged_otherwise(self):
+        with self.assertLogs('papers.perf', level='WARNING'):
+            response = self.client.get(reverse('view_papers'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_views_stay_within_budget_as_data_grows(self):
+        self.add_papers(25)
+        self.client.login(username='testuser', password='testpass')
+        for name in ('home', 'view_papers', 'my_downloads'):
+            self.client.get(reverse(name))
+        self.client.get(reverse('view_papers'), {'q': 'Paper', 'department': 'Physics'})
+        self.assertEqual(len(request_metrics.entries()), 4)
+
+    def test_metrics_endpoint_summarises_per_view(self):
+        self.client.get(reverse('view_papers'))
+        self.client.get(reverse('view_papers'))
+        self.client.login(username='testuser', password='testpass')
+        self.assertNotEqual(self.client.get(reverse('performance_metrics')).status_code, 200)
+
+        self.client.login(username='admin', password='adminpass')
+        data = self.client.get(reverse('performance_metrics')).json()
+        self.assertEqual(data['views']['view_papers']['requests'], 2)
+        self.assertIn('p95_ms', data['views']['view_papers'])
+        self.assertEqual(data['recent'][0]['view'], 'view_papers')
+
+    def test_records_are_appended_to_log_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'perf.jsonl')
+            with self.settings(PAPERS_PERF_LOG_FILE=path):
+                self.client.get(reverse('view_papers'))
+            with open(path) as f:
+                self.assertEqual(json.loads(f.readline())['view'], 'view_papers')
+
+# ================================
+# Benchmark Harness Tests
+# ================================
+class BenchmarkTests(BaseTestCase):
+    def test_generated_catalogue(self):
+        out = StringIO()
+        call_command('generate_catalogue', users=5, papers=60, events=300, stdout=out)
+        self.assertIn("Created 6 users, 60 papers and 300 download events", out.getvalue())
+
+        papers = PastPaper.objects.filter(user__username__startswith='bench_')
+        self.assertEqual(papers.count(), 60)
+        self.assertTrue(set(papers.values_list('department', flat=True)) <= set(benchmarks.DEPARTMENT_WEIGHTS))
+        self.assertEqual(DownloadEvent.objects.count(), 300)
+        self.assertEqual(sum(papers.values_list('download_count', flat=True)), 300)
+        self.assertTrue(User.objects.get(username='bench_admin').is_staff)
+        # Bulk-created papers are searchable by their generated text
+        self.assertTrue(search_papers(PastPaper.objects.all(), 'benchmark paper').exists())
+        self.assertEqual(PaperDownloadRollup.objects.filter(period='day').aggregate(n=Sum('count'))['n'], 300)
+
+    def test_same_seed_same_catalogue(self):
+        benchmarks.generate_catalogue(users=2, papers=10, events=0, seed=7)
+        first = list(PastPaper.objects.filter(user__username__startswith='bench_')
+                     .order_by('pk').values_list('title', 'course_code', 'year', 'semester'))
+        benchmarks.clear_catalogue()
+        benchmarks.generate_catalogue(users=2, papers=10, events=0, seed=7)
+        second = list(PastPaper.objects.filter(user__username__startswith='bench_')
+                      .order_by('pk').values_list('title', 'course_code', 'year', 'semester'))
+        self.assertEqual(first, second)
+
+    def test_every_scenario_runs_and_is_recorded(self):
+        benchmarks.generate_catalogue(users=3, papers=30, events=100)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('run_benchmarks', iterations=2, warmup=0, output=path, stdout=StringIO())
+            with open(path) as f:
+                results = json.load(f)
+        self.assertEqual(set(results['scenarios']), set(benchmarks.SCENARIOS))
+        for name, result in results['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['p95_ms'], 0)
+        self.assertEqual(results['meta']['catalogue']['papers'], 32)
+        self.assertFalse(PastPaper.objects.filter(course_code__startswith=benchmarks.UPLOAD_CODE_PREFIX).exists())
+
+    def test_compare_flags_regressions(self):
+        baseline = {'scenarios': {'home': {'p95_ms': 10, 'throughput_rps': 100, 'avg_queries': 4}}}
+        same = {'scenarios': {'home': {'p95_ms': 11, 'throughput_rps': 95, 'avg_queries': 4}}}
+        slower = {'scenarios': {'home': {'p95_ms': 20, 'throughput_rps': 50, 'avg_queries': 6}}}
+        self.assertEqual(benchmarks.compare(baseline, same), [])
+        self.assertEqual(len(benchmarks.compare(baseline, slower)), 3)
+
+    def test_benchmarks_need_a_catalogue(self):
+        with self.assertRaisesRegex(CommandError, 'generate_catalogue'):
+            call_command('run_benchmarks', 'home', stdout=StringIO())
+
+# ================================
+# Admin Changelist Query Tests
+# ================================
+class AdminChangelistTests(BaseTestCase):
+    def add_papers(self, n):
+        for i in range(n):
+            paper = PastPaper.objects.create(
+                title=f"Extra {i}", course_code=f"EXT{i:03d}", department="Physics", year=2021,
+                semester="Fall", file=self.paper1.file.name, user=self.user if i % 2 else self.admin_user,
+            )
+            PastPaperAttachment.objects.create(past_paper=paper, file=self.paper1.file.name)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:papers_pastpaper_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.client.login(username='admin', password='adminpass')
+        few = self.changelist_queries()
+        self.add_papers(23)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_full_page_stays_within_budget(self):
+        # Strict budgets raise QueryBudgetExceeded if the page goes over
+        self.add_papers(30)
+        self.client.login(username='admin', password='adminpass')
+        response = self.client.get(reverse('admin:papers_pastpaper_changelist'))
+        self.assertContains(response, "2 files")
+
+    def test_file_size_is_stored_on_upload(self):
+        self.assertEqual(self.paper1.file_size, len(b"file_content"))
+        self.client.login(username='admin', password='adminpass')
+        self.client.post(reverse('edit_paper', args=[self.paper1.id]), {
+            'title': 'Math Paper', 'course_code': 'MATH101', 'department': 'Mathematics',
+            'year': '2024', 'semester': '1',
+            'file': SimpleUploadedFile("new.pdf", b"a longer replacement file", content_type="application/pdf"),
+        })
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.file_size, len(b"a longer replacement file"))
+
+    def test_bulk_ingest_stores_file_size(self):
+        report = ingest_papers(
+            [IngestItem(SimpleUploadedFile("bulk.pdf", b"%PDF bulk"), "Bulk", "BLK101")],
+            "Physics", 2022, "Fall", self.admin_user,
+        )
+        self.assertEqual(PastPaper.objects.get(pk=report.created[0].pk).file_size, len(b"%PDF bulk"))
+
+    def test_migration_backfills_missing_sizes(self):
+        from django.apps import apps
+        from importlib import import_module
+
+        PastPaper.objects.update(file_size=None)
+        migration = import_module('papers.migrations.0018_file_size')
+        migration.backfill_file_sizes(apps, connection.schema_editor())
+        self.assertEqual(
+            set(PastPaper.objects.values_list('file_size', flat=True)), {len(b"file_content")}
+        )
+
+# ================================
+# File Metadata Tests
+# ================================
+THREE_PAGE_PDF = (
+    b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+    b"2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R 5 0 R] /Count 3 >> endobj\n"
+    + b"".join(f"{n} 0 obj << /Type /Page /Parent 2 0 R >> endobj\n".encode() for n in (3, 4, 5))
+    + b"trailer << /Root 1 0 R >>\n%%EOF\n"
+)
+
+
+class FileMetadataTests(BaseTestCase):
+    def create(self, content, title="Metadata"):
+        return PastPaper.objects.create(
+            title=title, course_code="META101", department="Physics", year=2024, semester="Fall",
+            user=self.admin_user, file=SimpleUploadedFile("meta.pdf", content, content_type="application/pdf"),
+        )
+
+    def test_metadata_is_recorded_on_upload(self):
+        paper = self.create(THREE_PAGE_PDF)
+        paper.refresh_from_db()
+        self.assertEqual(paper.file_size, len(THREE_PAGE_PDF))
+        self.assertEqual(paper.page_count, 3)
+        self.assertEqual(paper.checksum, hashlib.sha256(THREE_PAGE_PDF).hexdigest())
+        self.assertEqual(paper.mime_type, 'application/pdf')
+
+    def test_scanner_gives_the_same_answer_for_any_chunking(self):
+        whole = FileScanner()
+        whole.update(THREE_PAGE_PDF)
+        for size in (1, 3, 7, 50):
+            scanner = FileScanner()
+            for start in range(0, len(THREE_PAGE_PDF), size):
+                scanner.update(THREE_PAGE_PDF[start:start + size])
+            self.assertEqual(scanner.metadata('x.pdf'), whole.metadata('x.pdf'))
+        # No magic bytes: the type comes from the name, and only PDFs have pages
+        text = FileScanner()
+        text.update(b"plain notes")
+        self.assertEqual(text.metadata('notes.txt')['mime_type'], 'text/plain')
+        self.assertIsNone(self.paper1.page_count)
+
+    def test_attachment_and_reassigned_files_get_metadata(self):
+        paper = self.create(THREE_PAGE_PDF)
+        attachment = PastPaperAttachment.objects.create(past_paper=paper, file=paper.file.name)
+        attachment.refresh_from_db()
+        self.assertEqual((attachment.file_size, attachment.page_count), (len(THREE_PAGE_PDF), 3))
+
+        self.paper1.file = paper.file.name
+        self.paper1.save()
+        self.paper1.refresh_from_db()
+        self.assertEqual(self.paper1.checksum, paper.checksum)
+
+    def test_backfill_command_reads_each_file_once(self):
+        PastPaper.objects.update(file_size=None, page_count=None, checksum='', mime_type='')
+        out = StringIO()
+        call_command('backfill_file_metadata', workers=1, stdout=out)
+        self.assertIn("Recorded metadata for 2 rows from 1 files", out.getvalue())
+        self.assertEqual(
+            set(PastPaper.objects.values_list('file_size', 'checksum')),
+            {(len(b"file_content"), hashlib.sha256(b"file_content").hexdigest())},
+        )
+        out = StringIO()
+        call_command('backfill_file_metadata', workers=1, stdout=out)
+        self.assertIn("All files have metadata", out.getvalue())
+
+    def test_listing_sorts_and_shows_sizes(self):
+        self.create(THREE_PAGE_PDF)
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('view_papers'), {'sort': '-file_size'})
+        titles = [paper.title for paper in response.context['papers']]
+        self.assertEqual(titles[0], "Metadata")
+        self.assertContains(response, "3 pages")
+
+    def test_zip_uses_stored_sizes_and_skips_missing_files(self):
+        path = self.paper1.file.path
+        with self.assertLogs('papers.zipstream', level='WARNING'):
+            chunks = list(stream_zip([('a.pdf', path, self.paper1.file_size), ('gone.pdf', path + '.missing', 10)]))
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), ['a.pdf'])
+            self.assertEqual(archive.read('a.pdf'), b"file_content")
+
+# ================================
+# Login Backend Tests
+# ================================
+class LoginBackendTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        self.user.email = 'Test.User@Example.com'
+        self.user.save()
+
+    def test_username_or_email_in_one_query(self):
+        for identifier in ('testuser', 'test.user@example.com', 'TEST.USER@EXAMPLE.COM'):
+            with CaptureQueriesContext(connection) as queries:
+                user = authenticate(username=identifier, password='testpass')
+            self.assertEqual(user, self.user)
+            self.assertEqual(len(queries), 1)
+        self.assertIsNone(authenticate(username='testuser', password='wrong'))
+
+    def test_unknown_user_is_hashed_and_remembered(self):
+        with mock.patch.object(User, 'set_password') as set_password:
+            self.assertIsNone(authenticate(username='ghost@example.com', password='x'))
+            set_password.assert_called_once_with('x')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(authenticate(username='ghost@example.com', password='x'))
+        self.assertEqual(len(queries), 0)
+
+        # Creating the account forgets the miss
+        User.objects.create_user(username='ghost', email='ghost@example.com', password='boo')
+        self.assertEqual(authenticate(username='ghost@example.com', password='boo').username, 'ghost')
+
+    def test_shared_email_does_not_log_in(self):
+        User.objects.create_user(username='twin', email='test.user@example.com', password='testpass')
+        self.assertIsNone(authenticate(username='test.user@example.com', password='testpass'))
+        self.assertEqual(authenticate(username='twin', password='testpass').username, 'twin')
+
+    def test_login_view_accepts_email(self):
+        response = self.client.post(reverse('login'), {'username': 'test.user@example.com', 'password': 'testpass'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_single_backend(self):
+        from django.contrib.auth import get_backends
+        self.assertEqual([type(backend) for backend in get_backends()], [EmailOrUsernameModelBackend])
+
+    def test_signup_rejects_taken_email(self):
+        from .forms import SignUpForm
+        form = SignUpForm(data={
+            'username': 'newbie', 'email': 'TEST.user@example.com',
+            'password1': 'a-long-passphrase-1', 'password2': 'a-long-passphrase-1',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+    @skipUnless(connection.vendor == 'sqlite', "SQLite query plan")
+    def test_email_lookup_uses_lower_index(self):
+        backend = EmailOrUsernameModelBackend()
+        queryset = User.objects.alias(email_lower=Lower('email')).filter(email_lower='x@example.com')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('papers_user_email_lower_idx', plan)
+        self.assertIsNotNone(backend.get_user_by_identifier('test.user@example.com'))
+
+
+# ================================
+# Profile Query Tests
+# ================================
+class ProfileQueryTests(BaseTestCase):
+    def profile_queries(self, queries):
+        return [q['sql'] for q in queries.captured_queries if 'papers_profile' in q['sql']]
+
+    def test_login_does_not_touch_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'testpass'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.profile_queries(queries), [])
+        # User lookup, session writes and last_login; savepoints from the test transaction
+        self.assertEqual(len(queries), 9)
+
+    def test_user_save_writes_profile_only_when_changed(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.first_name = 'Test'
+            user.save()
+        self.assertEqual(self.profile_queries(queries), [])
+
+        user.profile.university = 'Makerere'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(len(self.profile_queries(queries)), 1)
+        self.assertIn('"university"', self.profile_queries(queries)[0])
+        self.assertNotIn('"bio"', self.profile_queries(queries)[0])
+        self.assertEqual(Profile.objects.get(user=self.user).university, 'Makerere')
+
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(self.profile_queries(queries), [])
+
+    def test_account_manager_queries(self):
+        self.client.login(username='testuser', password='testpass')
+        url = reverse('account_manager')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {
+                'first_name': 'Test', 'last_name': 'User',
+                'university': 'Makerere', 'bio': 'Hello',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(queries), 4)
+        # Profile loaded with the user and written once
+        profile_sql = self.profile_queries(queries)
+        self.assertTrue(profile_sql[0].startswith('SELECT "auth_user"'))
+        self.assertEqual([sql for sql in profile_sql if sql.startswith('UPDATE')], profile_sql[1:])
+        self.assertEqual(len(profile_sql), 2)
+        self.assertEqual(Profile.objects.get(user=self.user).bio, 'Hello')
+
+    def test_missing_profiles_created_lazily_in_bulk(self):
+        User.objects.bulk_create([User(username=f'bulk{i}') for i in range(3)])
+        self.assertEqual(Profile.objects.filter(user__username__startswith='bulk').count(), 0)
+
+        bulk0 = User.objects.get(username='bulk0')
+        self.client.force_login(bulk0)
+        self.assertEqual(self.client.get(reverse('account_manager')).status_code, 200)
+        self.assertTrue(Profile.objects.filter(user=bulk0).exists())
+
+        out = StringIO()
+        with self.assertNumQueries(2):
+            call_command('create_missing_profiles', stdout=out)
+        self.assertIn('Created 2 profiles', out.getvalue())
+        self.assertEqual(Profile.objects.filter(user__username__startswith='bulk').count(), 3)
+
+
+# ================================
+# Async View Tests
+# ================================
+class AsyncViewTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(benchmarks.serving_async_views())
+        request_metrics.clear()
+        download_counter.flush()
+
+    async def login(self):
+        await self.async_client.aforce_login(self.user)
+
+    def test_urls_switch_to_async_views(self):
+        for name in ('home', 'view_papers', 'set_theme'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func), name)
+        self.assertTrue(iscoroutinefunction(resolve(reverse('download_paper', args=[1])).func))
+        self.assertFalse(iscoroutinefunction(resolve(reverse('my_downloads')).func))
+
+    async def test_view_papers(self):
+        await self.login()
+        response = await self.async_client.get(reverse('view_papers'), {'department': 'Computer Science'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([paper.title for paper in response.context['papers']], ['CS Paper'])
+        self.assertEqual(response.context['papers'].paginator.count, 1)
+        self.assertTrue(response.context['papers'][0].thumbnail_url)
+        self.assertEqual([f.value for f in response.context['departments']], ['Computer Science', 'Mathematics'])
+
+        # Queries made through the async ORM still count against the budget
+        entry = request_metrics.entries()[-1]
+        self.assertEqual(entry['view'], 'view_papers')
+        self.assertGreater(entry['queries'], 0)
+        self.assertLessEqual(entry['queries'], entry['budget'])
+
+    @override_settings(PAPERS_CURSOR_PAGINATION=True)
+    async def test_view_papers_cursor_pages(self):
+        response = await self.async_client.get(reverse('view_papers'), {'sort': 'title'})
+        self.assertEqual([paper.title for paper in response.context['papers']], ['CS Paper', 'Math Paper'])
+        self.assertEqual(response.context['papers'].paginator.count, 2)
+
+    async def test_home(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 302)
+        await self.login()
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({paper.title for paper in response.context['recent_papers']}, {'Math Paper', 'CS Paper'})
+
+    async def test_download_streams_asynchronously(self):
+        await self.login()
+        url = reverse('download_paper', args=[self.paper1.pk])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b"file_content")
+        self.assertEqual(response['Content-Length'], '12')
+        self.assertEqual(download_counter.pending(self.paper1.pk), 1)
+
+        response = await self.async_client.get(url, headers={'Range': 'bytes=5-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b"content")
+        # A resumed transfer isn't another download
+        self.assertEqual(download_counter.pending(self.paper1.pk), 1)
+
+        response = await self.async_client.get(reverse('download_paper', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_set_theme(self):
+        await self.login()
+        response = await self.async_client.post(
+            reverse('set_theme'), data='{"theme":"dark"}', content_type='application/json'
+        )
+        self.assertJSONEqual(response.content, {'status': 'success', 'theme': 'dark'})
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('theme'), 'dark')
+        response = await self.async_client.get(reverse('set_theme'))
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ServerBenchmarkTests(TransactionTestCase):
+    """Runs the servers from worker threads, which need committed data"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    @override_settings(PAPERS_DOWNLOAD_FLUSH_INTERVAL=None, PAPERS_EVENT_FLUSH_INTERVAL=None)
+    def test_compare_servers(self):
+        benchmarks.generate_catalogue(users=2, papers=10, events=20)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'servers.json')
+            call_command('compare_servers', 'view_papers', 'download_paper', concurrency=3, requests=6,
+                         slow_client_ms=1, output=path, stdout=StringIO())
+            with open(path) as f:
+                results = json.load(f)
+        self.assertEqual(set(results['servers']), {'view_papers', 'download_paper'})
+        for name, servers in results['servers'].items():
+            self.assertEqual(set(servers), {'wsgi', 'asgi'})
+            for server, result in servers.items():
+                self.assertEqual(result['errors'], 0, f"{name} {server}")
+                self.assertEqual(result['requests'], 6)
+        self.assertEqual(results['meta']['concurrency'], 3)
+        # The URLs are back on the sync views afterwards
+        self.assertFalse(iscoroutinefunction(resolve(reverse('view_papers')).func))
+
+
+# ================================
+# Page Cache Tests
+# ================================
+@override_settings(PAPERS_PAGE_CACHE=True, PAPERS_PAGE_CACHE_TIMEOUT=300, PAPERS_PAGE_CACHE_STALE=60)
+class PageCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        caching.bump_catalogue_version()
+
+    def get(self, url=None, **params):
+        return self.client.get(url or reverse('view_papers'), params)
+
+    def test_anonymous_listing_is_cached(self):
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'MATH PAPER')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
+        # Parameter order doesn't matter; values do
+        self.get(year='2024', department='Mathematics')
+        self.assertEqual(self.get(department='Mathematics', year='2024')['X-Page-Cache'], 'hit')
+        self.assertEqual(self.get(department='Computer Science', year='2024')['X-Page-Cache'], 'miss')
+
+    def test_key_includes_language_and_theme(self):
+        self.get()
+        # The request activates French; don't let it leak into later reverse() calls
+        with translation.override('en'):
+            response = self.client.get('/fr' + reverse('view_papers'))
+        self.assertEqual(response['Content-Language'], 'fr')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get()['X-Page-Cache'], 'hit')
+
+        self.client.post(reverse('set_theme'), data='{"theme":"dark"}', content_type='application/json')
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get()['X-Page-Cache'], 'hit')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.get()
+        self.client.login(username='testuser', password='testpass')
+        response = self.get()
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertTrue(response.context['user'].is_authenticated)
+
+    def test_paper_changes_invalidate(self):
+        self.get()
+        PastPaper.objects.create(
+            title="Physics Paper", course_code="PHY101", department="Physics", year="2024",
+            semester="1", file=self.paper1.file.name, user=self.admin_user,
+        )
+        response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'PHYSICS PAPER')
+
+    def test_stale_while_revalidate(self):
+        cache = caching.get_cache()
+        key = pagecache.page_key('view_papers', self.get().wsgi_request)
+        lock = f'{key}:refresh'
+
+        def age(seconds):
+            entry = cache.get(key)
+            cache.set(key, {**entry, 'created': entry['created'] - seconds})
+
+        # Expired: while another request re-renders it, the stale copy is served
+        age(320)
+        cache.set(lock, 1)
+        self.assertEqual(self.get()['X-Page-Cache'], 'stale')
+        cache.delete(lock)
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+        self.assertIsNone(cache.get(lock))
+        self.assertEqual(self.get()['X-Page-Cache'], 'hit')
+
+        # Same after a catalogue change
+        caching.bump_catalogue_version()
+        cache.set(lock, 1)
+        self.assertEqual(self.get()['X-Page-Cache'], 'stale')
+        cache.delete(lock)
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+
+        # Past the stale window a page is never served
+        age(1000)
+        cache.set(lock, 1)
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+
+        stats = pagecache.page_cache_stats()['view_papers']
+        self.assertEqual((stats['hits'], stats['stale'], stats['misses']), (1, 2, 4))
+
+    async def test_async_listing_is_cached(self):
+        with benchmarks.serving_async_views():
+            first = await self.async_client.get(reverse('view_papers'))
+            second = await self.async_client.get(reverse('view_papers'))
+        self.assertEqual((first['X-Page-Cache'], second['X-Page-Cache']), ('miss', 'hit'))
+        self.assertEqual(first.content, second.content)
+
+    def test_landing_page_and_admin_stats(self):
+        self.client.get(reverse('landing'))
+        self.assertEqual(self.client.get(reverse('landing'))['X-Page-Cache'], 'hit')
+        self.client.login(username='admin', password='adminpass')
+        # Logged in, the landing page redirects instead
+        self.assertEqual(self.client.get(reverse('landing')).status_code, 302)
+        response = self.client.get(reverse('admin:papers_pastpaper_changelist'))
+        rows = {row['name']: row for row in response.context['cache_stats']}
+        self.assertEqual(rows['landing_or_home']['hits'], 1)
+        self.assertIn('dashboard:recent', rows)
+        self.assertContains(response, 'Stale hits')
+
+
+# ================================
+# Conditional GET Tests
+# ================================
+class ConditionalGetTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_cache().clear()
+        caching.bump_catalogue_version()
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, headers={'If-None-Match': response['ETag']})
+
+    def test_unchanged_listing_is_not_modified(self):
+        self.client.login(username='testuser', password='testpass')
+        url = reverse('view_papers')
+        first = self.client.get(url, {'department': 'Mathematics'})
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        # Session, user and one aggregate; the template isn't rendered
+        with self.assertNumQueries(3):
+            second = self.revalidate(url, first, department='Mathematics')
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.templates, [])
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        # Other filters, an edit, a new paper and a delete all change it
+        self.assertEqual(self.revalidate(url, first, department='Computer Science').status_code, 200)
+        self.paper1.title = 'Algebra Paper'
+        self.paper1.save()
+        changed = self.revalidate(url, first, department='Mathematics')
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, 'ALGEBRA PAPER')
+        self.paper2.delete()
+        self.assertEqual(self.revalidate(url, changed).status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse('view_papers')
+        first = self.client.get(url)
+        second = self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']})
+        self.assertEqual(second.status_code, 304)
+
+        # Edits don't touch uploaded_at but still move Last-Modified (a
+        # minute on, as HTTP dates are in whole seconds)
+        self.paper1.save()
+        cache = caching.get_cache()
+        cache.set(caching.CATALOGUE_CHANGED_KEY, cache.get(caching.CATALOGUE_CHANGED_KEY) + 60)
+        third = self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']})
+        self.assertEqual(third.status_code, 200)
+
+    @override_settings(PAPERS_PAGE_CACHE=True)
+    def test_cached_pages_revalidate_without_queries(self):
+        url = reverse('view_papers')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.revalidate(url, first)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+
+    def test_home_and_my_files(self):
+        self.client.login(username='admin', password='adminpass')
+        home = self.client.get(reverse('home'))
+        self.assertEqual(self.revalidate(reverse('home'), home).status_code, 304)
+        # A new name in the navbar is a new page
+        self.admin_user.first_name = 'Ada'
+        self.admin_user.save()
+        self.assertEqual(self.revalidate(reverse('home'), home).status_code, 200)
+
+        url = reverse('my_files')
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        # The page shows when each paper was last downloaded
+        record_download(self.user, self.paper1)
+        second = self.revalidate(url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.revalidate(url, second).status_code, 304)
+
+        # The user's own downloads move it too
+        other = PastPaper.objects.create(
+            title="Physics Paper", course_code="PHY101", department="Physics", year="2024",
+            semester="1", file=self.paper1.file.name, user=self.user,
+        )
+        third = self.client.get(url)
+        record_download(self.admin_user, other)
+        self.assertEqual(self.revalidate(url, third).status_code, 200)
+
+    def test_my_files_last_modified_follows_edits(self):
+        self.client.login(username='admin', password='adminpass')
+        url = reverse('my_files')
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']}).status_code, 304)
+        self.paper1.title = 'Algebra Paper'
+        self.paper1.save()
+        cache = caching.get_cache()
+        cache.set(caching.CATALOGUE_CHANGED_KEY, cache.get(caching.CATALOGUE_CHANGED_KEY) + 60)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']}).status_code, 200)
+
+    @override_settings(PAPERS_CONDITIONAL_GET=False)
+    def test_can_be_turned_off(self):
+        response = self.client.get(reverse('view_papers'))
+        self.assertFalse(response.has_header('ETag'))
+
+    async def test_async_views(self):
+        with benchmarks.serving_async_views():
+            await self.async_client.aforce_login(self.user)
+            for name in ('home', 'view_papers'):
+                first = await self.async_client.get(reverse(name))
+                second = await self.async_client.get(reverse(name), headers={'If-None-Match': first['ETag']})
+                self.assertEqual((first.status_code, second.status_code), (200, 304), name)
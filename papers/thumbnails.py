@@ -0,0 +1,273 @@
+# thumbnails.py - First-page previews rendered once and kept in a bounded cache
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import textwrap
+import threading
+
+from django.conf import settings
+from django.urls import reverse
+
+from .caching import get_cache, KEY_PREFIX
+from .storage import sha256_from_name
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # pragma: no cover - optional dependency
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+_evict_lock = threading.Lock()
+
+
+def thumbnail_root():
+    return os.path.join(settings.MEDIA_ROOT, getattr(settings, 'PAPERS_THUMBNAIL_DIR', 'thumbnails'))
+
+
+def thumbnail_size():
+    return getattr(settings, 'PAPERS_THUMBNAIL_SIZE', (180, 240))
+
+
+def content_key(field_file):
+    """SHA-256 of the file's bytes, remembered per name, size and mtime"""
+    # Recorded on the row at upload (unless the column wasn't loaded)
+    digest = getattr(field_file, 'instance', None) and field_file.instance.__dict__.get('checksum')
+    if digest:
+        return digest
+    digest = sha256_from_name(field_file.name)
+    if digest is not None:
+        # Content-addressed files carry their hash in the name
+        return digest
+    try:
+        path = field_file.path
+        stat = os.stat(path)
+    except (NotImplementedError, OSError, ValueError):
+        return None
+    cache = get_cache()
+    key = f'{KEY_PREFIX}:sha256:{field_file.name}:{stat.st_size}:{stat.st_mtime_ns}'
+    digest = cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        cache.set(key, digest, timeout=None)
+    return digest
+
+
+def thumbnail_path(key):
+    return os.path.join(thumbnail_root(), key[:2], f'{key}.png')
+
+
+def thumbnail_url(paper):
+    """URL of the paper's thumbnail; the key in it changes with the file"""
+    key = content_key(paper.file) if paper.file else None
+    if key is None:
+        return None
+    return reverse('paper_thumbnail', args=[paper.pk, key])
+
+
+def attach_urls(papers):
+    """Set `thumbnail_url` on each paper of a listing page"""
+    for paper in papers:
+        paper.thumbnail_url = thumbnail_url(paper)
+    return papers
+
+
+# ---- Renderers: PyMuPDF, poppler's pdftoppm, or a text card with Pillow ----
+
+def _fit(image):
+    from PIL import Image
+
+    image = image.convert('RGB')
+    image.thumbnail(thumbnail_size(), Image.LANCZOS)
+    return image
+
+
+def _render_pymupdf(path, paper):
+    document = fitz.open(path)
+    try:
+        page = document[0]
+        scale = thumbnail_size()[0] / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        from PIL import Image
+        return _fit(Image.open(io.BytesIO(pixmap.tobytes('png'))))
+    finally:
+        document.close()
+
+
+def _render_pdftoppm(path, paper):
+    from PIL import Image
+
+    output = subprocess.run(
+        ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile',
+         '-scale-to', str(max(thumbnail_size())), path],
+        capture_output=True, check=True, timeout=30,
+    ).stdout
+    return _fit(Image.open(io.BytesIO(output)))
+
+
+def _render_text_card(path, paper):
+    """A page-shaped card with the title and the opening text of the paper"""
+    from PIL import Image, ImageDraw, ImageFont
+    from .extraction import extract_text, paper_texts
+
+    width, height = thumbnail_size()
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    draw.rectangle([0, 0, width - 1, height - 1], outline='#d1d5db')
+    draw.rectangle([0, 0, width - 1, 28], fill='#dc2626')
+    draw.text((6, 8), f'{paper.course_code} {paper.year}'[:30], fill='white', font=font)
+
+    text = paper_texts([paper.pk]).get(paper.pk) or extract_text(path, max_chars=1000)
+    lines = textwrap.wrap(f'{paper.title}. {text}', width=max(width // 7, 10))
+    y = 36
+    for line in lines:
+        if y > height - 14:
+            break
+        draw.text((6, y), line, fill='#374151', font=font)
+        y += 12
+    return image
+
+
+def renderers():
+    """Renderers to try in order, per PAPERS_THUMBNAIL_RENDERER"""
+    available = {
+        'pymupdf': _render_pymupdf if fitz is not None else None,
+        'pdftoppm': _render_pdftoppm if shutil.which('pdftoppm') else None,
+        'text': _render_text_card,
+    }
+    name = getattr(settings, 'PAPERS_THUMBNAIL_RENDERER', 'auto')
+    if name != 'auto':
+        return [available[name]] if available.get(name) else [_render_text_card]
+    return [renderer for renderer in available.values() if renderer is not None]
+
+
+def render(paper):
+    """PNG bytes of the paper's first-page thumbnail"""
+    path = paper.file.path
+    for renderer in renderers():
+        try:
+            image = renderer(path, paper)
+        except Exception as e:
+            logger.warning(f"{renderer.__name__} failed for paper {paper.pk}: {str(e)}")
+            continue
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', optimize=True)
+        return buffer.getvalue()
+    raise RuntimeError(f"No thumbnail renderer succeeded for paper {paper.pk}")
+
+
+def get_thumbnail(paper, key=None):
+    """Path of the cached thumbnail, rendering it on first use"""
+    key = key or content_key(paper.file)
+    if key is None:
+        return None
+    path = thumbnail_path(key)
+    if os.path.exists(path):
+        touch(path)
+        return path
+
+    data = render(paper)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    # The directory is only walked when the running total says it's full
+    total = _add_size(len(data))
+    if total is None or total > max_cache_bytes():
+        evict()
+    return path
+
+
+def touch(path):
+    """Mark a thumbnail as recently used (its mtime is the LRU clock)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def max_cache_bytes():
+    return getattr(settings, 'PAPERS_THUMBNAIL_CACHE_BYTES', 64 * 1024 * 1024)
+
+
+def _size_key():
+    digest = hashlib.sha1(thumbnail_root().encode('utf-8')).hexdigest()[:16]
+    return f'{KEY_PREFIX}:thumbnails:bytes:{digest}'
+
+
+def _add_size(nbytes):
+    """Add to the cache's running size total, shared by every worker.
+
+    Returns the new total, or None when it isn't known (never counted,
+    or evicted from the cache) and the directory has to be walked.
+    """
+    try:
+        return get_cache().incr(_size_key(), nbytes)
+    except ValueError:
+        return None
+
+
+def _entries():
+    root = thumbnail_root()
+    entries = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None):
+    """Delete least recently used thumbnails until under the size limit.
+
+    Walks and stats the whole directory, so get_thumbnail() only calls it
+    once the running size total passes PAPERS_THUMBNAIL_CACHE_BYTES (or
+    isn't known). Trims to 90% of the limit so that doesn't happen on
+    every new thumbnail, and resets the total to what is left.
+    Returns the number of files removed.
+    """
+    if max_bytes is None:
+        max_bytes = max_cache_bytes()
+    with _evict_lock:
+        entries = _entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= max_bytes:
+            get_cache().set(_size_key(), total, timeout=None)
+            return 0
+        target = max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        get_cache().set(_size_key(), total, timeout=None)
+        logger.info(f"Evicted {removed} thumbnails")
+        return removed
+
+
+def clear():
+    """Remove every cached thumbnail"""
+    shutil.rmtree(thumbnail_root(), ignore_errors=True)
+    get_cache().set(_size_key(), 0, timeout=None)
@@ -1,27 +1,39 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from . import async_views
 from django.contrib.auth import views as auth_views
 
+# Under ASGI the async versions of the busiest views run on the event loop
+listing = async_views if getattr(settings, 'PAPERS_ASYNC_VIEWS', False) else views
+
 urlpatterns = [
      # smart redirect
      path('', views.landing_or_home, name='landing'),
      path('landing/', views.landing_or_home, name='landing'),
-    path('home/', views.home, name='home'),
+    path('home/', listing.home, name='home'),
     path('upload/', views.upload_paper, name='upload_paper'),
-    path('view/', views.view_papers, name='view_papers'),
+    path('upload/jobs/<int:job_id>/', views.upload_job_status, name='upload_job_status'),
+    path('upload/chunked/', views.chunked_upload_init, name='chunked_upload_init'),
+    path('upload/chunked/<uuid:upload_id>/', views.chunked_upload, name='chunked_upload'),
+    path('upload/chunked/<uuid:upload_id>/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
+    path('view/', listing.view_papers, name='view_papers'),
     path('delete/<int:paper_id>/', views.delete_paper, name='delete_paper'),
     path('edit/<int:paper_id>/', views.edit_paper, name='edit_paper'),
-    path('download/<int:paper_id>/', views.download_paper, name='download_paper'),
+    path('download/<int:paper_id>/', listing.download_paper, name='download_paper'),
+    path('thumbnail/<int:paper_id>/<str:key>.png', views.paper_thumbnail, name='paper_thumbnail'),
+    path('metrics/performance/', views.performance_metrics, name='performance_metrics'),
 
     path('settings/', views.settings_view, name='settings'),
     path('my_files/', views.my_files, name='my_files'),
+    path('my_downloads/', views.my_downloads, name='my_downloads'),
     path('account/', views.account_manager, name='account_manager'),
     path('about/', views.about, name='about'),
 
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='login'), name='logout'),
     path('register/', views.register, name='register'),
-    path('set-theme/', views.set_theme, name='set_theme'),
+    path('set-theme/', listing.set_theme, name='set_theme'),
     
 
 ]
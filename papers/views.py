@@ -1,7 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponseRedirect, FileResponse, JsonResponse
+from django.http import HttpResponseRedirect, FileResponse, JsonResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.urls import reverse
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
@@ -16,12 +17,28 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Q
+from django.db.models import Count, F, Max, Q
 from django.contrib import messages
-from django.db import transaction
 import logging
-from .models import Profile, Download
-from django.core.paginator import Paginator
+from .models import Download, UploadJob, ChunkedUpload
+from .search import search_papers
+from .counters import download_counter
+from .delivery import serve_file, counts_as_download
+from .ingest import IngestItem, ingest_papers, ERROR as INGEST_ERROR
+from .jobs import background_uploads_enabled, enqueue_upload, job_status
+from . import caching
+from .facets import facet_counts
+from .pagination import paginate
+from . import thumbnails
+from . import chunked
+from .chunked import ChunkError, request_files, field_value
+from .events import download_events
+from .history import user_history, full_history_enabled
+from .perf import query_budget, request_metrics
+from .profiles import get_profile
+from .pagecache import cached_page, page_cache_stats
+from .conditional import conditional_page, latest, loaded_values, user_fingerprint
+from functools import lru_cache
 
 
 
@@ -30,6 +47,7 @@ from django.core.paginator import Paginator
 # ==========================
 # Landing or Home Logic
 # ==========================
+@cached_page()
 def landing_or_home(request):
     if request.user.is_authenticated:
         return redirect('home')
@@ -48,13 +66,34 @@ def is_admin(user):
 # ==========================
 
 
+def dashboard_lists(request):
+    """The recent and popular papers, fetched once per request so the
+    ETag and the page come from the same lists
+    """
+    if not hasattr(request, 'dashboard_lists'):
+        request.dashboard_lists = (caching.recent_papers.get(), caching.popular_papers.get())
+    return request.dashboard_lists
+
+
+def home_validator(request):
+    # Both lists usually come from the cache, so this needs no query
+    recent, popular = dashboard_lists(request)
+    parts = (
+        [loaded_values(paper) for paper in recent],
+        [loaded_values(paper) for paper in popular],
+        user_fingerprint(request.user),
+    )
+    return parts, None
+
+
 @login_required
+@conditional_page(home_validator)
+@query_budget(8)
 def home(request):
-    recent_papers = PastPaper.objects.order_by('-uploaded_at')[:5]
-    popular_papers = PastPaper.objects.order_by('-download_count')[:5]
+    recent, popular = dashboard_lists(request)
     return render(request, 'home.html', {
-        'recent_papers': recent_papers,
-        'popular_papers': popular_papers
+        'recent_papers': recent,
+        'popular_papers': popular
     })
 
 
@@ -77,7 +116,10 @@ def upload_paper(request):
             else:
                 success = handle_bulk_upload(request)
             
-            if success:
+            if isinstance(success, UploadJob):
+                # Queued for the background worker; the page polls its status
+                return render(request, 'upload.html', {'job': success})
+            elif success:
                 return render(request, 'upload.html', {'success': True})
             else:
                 messages.error(request, 'Upload failed. Please try again.')
@@ -99,7 +141,11 @@ def handle_single_upload(request):
     department = request.POST.get('department', '').strip()
     year = request.POST.get('year')
     semester = request.POST.get('semester', '').strip()
-    uploaded_file = request.FILES.get('file')
+    try:
+        uploaded_file = next(iter(request_files(request, 'file')), None)
+    except ChunkError as e:
+        messages.error(request, str(e))
+        return False
     
     # Validation
     if not all([title, course_code, department, year, semester, uploaded_file]):
@@ -111,6 +157,11 @@ def handle_single_upload(request):
         messages.error(request, 'Only PDF files are allowed.')
         return False
     
+    if background_uploads_enabled():
+        return enqueue_upload(
+            request.user, [IngestItem(uploaded_file, title, course_code)], department, year, semester
+        )
+
     try:
         # Create PastPaper object
         paper = PastPaper.objects.create(
@@ -119,7 +170,7 @@ def handle_single_upload(request):
             department=department,
             year=int(year),
             semester=semester,
-            file=uploaded_file,
+            file=field_value(uploaded_file),
             user=request.user
         )
         
@@ -140,8 +191,12 @@ def handle_bulk_upload(request):
     year = request.POST.get('bulk_year')
     semester = request.POST.get('bulk_semester', '').strip()
     
-    # Get files and their metadata
-    files = request.FILES.getlist('files')
+    # Get files (posted, or uploaded in chunks beforehand) and their metadata
+    try:
+        files = request_files(request, 'files')
+    except ChunkError as e:
+        messages.error(request, str(e))
+        return False
     course_codes = request.POST.getlist('course_codes[]')
     titles = request.POST.getlist('titles[]')
     
@@ -164,62 +219,49 @@ def handle_bulk_upload(request):
             messages.error(request, f'File "{file.name}" is not a PDF. All files must be PDFs.')
             return False
     
-    # Use database transaction for bulk upload
-    try:
-        with transaction.atomic():
-            uploaded_papers = []
-            
-            for i, file in enumerate(files):
-                course_code = course_codes[i].strip()
-                title = titles[i].strip()
-                
-                # Skip if essential data is missing
-                if not course_code or not title:
-                    messages.warning(request, f'Skipped file "{file.name}" - missing course code or title.')
-                    continue
-                
-                # Create PastPaper object
-                paper = PastPaper.objects.create(
-                    title=title,
-                    course_code=course_code,
-                    department=department,
-                    year=int(year),
-                    semester=semester,
-                    file=file,
-                    user=request.user
-                )
-                
-                uploaded_papers.append(paper)
-                logger.info(f"Bulk uploaded: {paper.title}")
-            
-            if uploaded_papers:
-                messages.success(request, f'Successfully uploaded {len(uploaded_papers)} papers!')
-                return True
-            else:
-                messages.warning(request, 'No papers were uploaded. Please check your data.')
-                return False
-                
-    except Exception as e:
-        logger.error(f"Bulk upload error: {str(e)}")
-        messages.error(request, f'Error during bulk upload: {str(e)}')
+    items = [IngestItem(file, titles[i], course_codes[i]) for i, file in enumerate(files)]
+    if background_uploads_enabled():
+        return enqueue_upload(request.user, items, department, year, semester)
+
+    report = ingest_papers(items, department, year, semester, request.user)
+
+    for result in report.failed:
+        if result.status == INGEST_ERROR:
+            messages.error(request, result.message)
+        else:
+            messages.warning(request, result.message)
+
+    if report.created:
+        messages.success(request, f'Successfully uploaded {len(report.created)} papers!')
+        return True
+    else:
+        messages.warning(request, 'No papers were uploaded. Please check your data.')
         return False
     
 
+@user_passes_test(is_admin)
+def upload_job_status(request, job_id):
+    """Polled by upload.html while a background upload is processed"""
+    job = get_object_or_404(UploadJob, pk=job_id)
+    if job.user_id != request.user.id and not request.user.is_superuser:
+        return JsonResponse({'status': 'error', 'message': 'Not your upload'}, status=403)
+    return JsonResponse(job_status(job))
+
+
 # 📄 View Papers
 # ==========================
-def view_papers(request):
+def paper_listing(request):
+    """The filtered, sorted papers for view_papers and the template context
+    describing the filters. Returns (papers, ordering, context); nothing
+    is queried yet, so the async view can share it.
+    """
     # Get all papers initially
     papers = PastPaper.objects.all()
     
     # Handle search query
     query = request.GET.get('q', '')
     if query:
-        papers = papers.filter(
-            Q(title__icontains=query) |
-            Q(course_code__icontains=query) |
-            Q(department__icontains=query) |
-            Q(year__icontains=query)
-        )
+        papers = search_papers(papers, query)
     
     # Handle department filter
     selected_department = request.GET.get('department', '')
@@ -240,37 +282,77 @@ def view_papers(request):
         # Show only papers that have files attached
         papers = papers.exclude(file='')
     
-    # Handle sorting (new functionality)
+    # Handle sorting (new functionality); `ordering` doubles as the cursor
+    # pagination key, None where only page numbers work
     sort_by = request.GET.get('sort', 'relevance')
+    ordering = None
     if sort_by == 'title':
-        papers = papers.order_by('title')
+        ordering = ['title']
     elif sort_by == '-uploaded_at':
-        papers = papers.order_by('-uploaded_at')
+        ordering = ['-uploaded_at']
     elif sort_by == '-year':
-        papers = papers.order_by('-year')
+        ordering = ['-year']
+    elif sort_by == '-file_size':
+        # Sizes are missing until backfilled, which rules out a cursor
+        papers = papers.order_by(F('file_size').desc(nulls_last=True), '-uploaded_at')
     elif sort_by == 'relevance' or not sort_by:
-        # Default ordering
-        papers = papers.order_by('-uploaded_at')
-    
-    # Get filter options for dropdowns
-    departments = PastPaper.objects.values_list('department', flat=True).distinct().order_by('department')
-    years = PastPaper.objects.values_list('year', flat=True).distinct().order_by('-year')
-    
-    # Pagination
-    paginator = Paginator(papers, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        # Best search matches first, newest first when there is no query
+        if query:
+            papers = papers.order_by('search_rank', '-uploaded_at')
+        else:
+            ordering = ['-uploaded_at']
+    if ordering:
+        papers = papers.order_by(*ordering)
     
     context = {
-        'papers': page_obj,
         'query': query,
         'selected_department': selected_department,
         'selected_year': selected_year,
         'filter_type': filter_type,
         'sort_by': sort_by,
-        'departments': departments,
-        'years': years,
     }
+    return papers, ordering, context
+
+
+def view_papers_validator(request):
+    """Newest upload and row count of the filtered papers (one aggregate
+    query), plus the catalogue version, which edits and deletes bump
+    """
+    papers, ordering, context = paper_listing(request)
+    summary = papers.order_by().aggregate(latest=Max('uploaded_at'), count=Count('id'))
+    parts = (
+        summary['latest'], summary['count'], caching.catalogue_version(),
+        user_fingerprint(request.user),
+    )
+    return parts, latest(summary['latest'], caching.catalogue_changed_at())
+
+
+@cached_page()
+@conditional_page(view_papers_validator)
+@query_budget(12)
+def view_papers(request):
+    papers, ordering, context = paper_listing(request)
+    query = context['query']
+    
+    # Get filter options for dropdowns
+    # Facet counts come from the denormalized table, or from the search
+    # results when there is a query (both cached)
+    if query:
+        search_results = search_papers(PastPaper.objects.all(), query)
+        counts = facet_counts(search_results, search_key=query)
+    else:
+        counts = facet_counts()
+    
+    # Pagination
+    page_obj = paginate(request, papers, 10, ordering)
+    if request.user.is_authenticated:
+        thumbnails.attach_urls(page_obj)
+    
+    context.update({
+        'papers': page_obj,
+        'departments': counts['department'],
+        'years': counts['year'],
+    })
     
     return render(request, 'view.html', context)
 # ==========================
@@ -278,34 +360,159 @@ def view_papers(request):
 # ==========================
 from django.contrib.auth.decorators import login_required
 
+def track_download(user_id, paper_id):
+    # Track the download (buffered, written in batches with the history)
+    download_events.record(user_id, paper_id)
+    
+    # Increment download count (buffered, flushed in batches)
+    download_counter.increment(paper_id)
+
+
 @login_required
 def download_paper(request, paper_id):
     paper = get_object_or_404(PastPaper, pk=paper_id)
-    
-    # Track the download
-    Download.objects.get_or_create(user=request.user, paper=paper)
-    
-    # Increment download count
-    paper.increment_download_count()
-    
-    return redirect(paper.file.url)
+    response = serve_file(request, paper.file, filename=paper.get_filename())
+
+    # Cache revalidations and resumed transfers aren't new downloads
+    if not counts_as_download(request, response):
+        return response
+
+    track_download(request.user.id, paper.pk)
+    return response
+
+# ==========================
+# 🧩 Chunked Uploads (JSON API)
+# ==========================
+def _chunk_error(e):
+    data = {'status': 'error', 'message': str(e)}
+    if e.received is not None:
+        data['received'] = e.received
+    return JsonResponse(data, status=e.status)
+
+
+def _upload_state(upload):
+    return {
+        'id': str(upload.pk),
+        'status': upload.status,
+        'received': upload.received,
+        'size': upload.size,
+        'chunk_size': chunked.chunk_size(),
+    }
+
+
+@user_passes_test(is_admin)
+@require_http_methods(["POST"])
+def chunked_upload_init(request):
+    """Start an upload: {filename, size, sha256?} -> {id, chunk_size, ...}"""
+    try:
+        data = json.loads(request.body or b'{}')
+        size = int(data.get('size', 0))
+    except (ValueError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    try:
+        upload = chunked.create_upload(request.user, data.get('filename'), size, data.get('sha256') or '')
+    except ChunkError as e:
+        return _chunk_error(e)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@user_passes_test(is_admin)
+@require_http_methods(["GET", "PUT"])
+def chunked_upload(request, upload_id):
+    """GET: where to resume from. PUT: append the raw body at Content-Range"""
+    if request.method == 'GET':
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        return JsonResponse(_upload_state(upload))
+
+    match = chunked.CONTENT_RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if not match:
+        return JsonResponse({'status': 'error', 'message': 'Content-Range header is required'}, status=400)
+    start, end = int(match.group(1)), int(match.group(2))
+    try:
+        # The body is streamed to disk, never read into memory as a whole
+        received = chunked.append_chunk(
+            upload_id, request.user, start, request, end - start + 1,
+            request.META.get('HTTP_X_CHUNK_SHA256', ''),
+        )
+    except ChunkError as e:
+        return _chunk_error(e)
+    return JsonResponse({'status': 'ok', 'received': received})
+
+
+@user_passes_test(is_admin)
+@require_http_methods(["POST"])
+def chunked_upload_finalize(request, upload_id):
+    try:
+        upload = chunked.finalize(upload_id, request.user)
+    except ChunkError as e:
+        return _chunk_error(e)
+    return JsonResponse(_upload_state(upload))
+
+# ==========================
+# 🖼️ Thumbnails
+# ==========================
+@login_required
+def paper_thumbnail(request, paper_id, key):
+    paper = get_object_or_404(PastPaper, pk=paper_id)
+    current = thumbnails.content_key(paper.file) if paper.file else None
+    if current is None:
+        raise Http404("No thumbnail for this paper")
+    # The key is part of the URL so the image can be cached for good
+    if key != current:
+        return redirect('paper_thumbnail', paper_id=paper.pk, key=current)
+
+    etag = quote_etag(current)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        path = thumbnails.get_thumbnail(paper, current)
+    except Exception as e:
+        logger.error(f"Thumbnail for paper {paper.pk} failed: {str(e)}")
+        raise Http404("Thumbnail unavailable")
+
+    response = FileResponse(open(path, 'rb'), content_type='image/png')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
+
+# ==========================
+# 📈 Performance Metrics (Admin only)
+# ==========================
+@user_passes_test(is_admin)
+def performance_metrics(request):
+    """Per-view timings and query counts from the PerformanceMiddleware"""
+    try:
+        recent = max(int(request.GET.get('recent', 50)), 0)
+    except ValueError:
+        recent = 50
+    entries = request_metrics.entries()
+    return JsonResponse({
+        'views': request_metrics.summary(),
+        'recent': entries[-recent:] if recent else [],
+        'caches': {**caching.cache_stats(), **page_cache_stats()},
+    })
 
 # ==========================
 # 📥 My Downloads (User only)
 
 @login_required
+@query_budget(8)
 def my_downloads(request):
-    # Get papers downloaded by the current user
-    downloaded_papers = PastPaper.objects.filter(
-        user_downloads__user=request.user
-    ).select_related('user').prefetch_related('user_downloads').distinct().order_by('-user_downloads__downloaded_at')
+    # Start from the user's own Download rows; ?all=1 shows every repeat
+    # download when full history is kept
+    full = request.GET.get('all') == '1' and full_history_enabled()
+    downloads = user_history(request.user, full=full)
     
     # Pagination
-    paginator = Paginator(downloaded_papers, 10)
-    page_number = request.GET.get('page')
-    papers = paginator.get_page(page_number)
+    page_obj = paginate(request, downloads, 10, ['-downloaded_at'], per_user=True)
     
-    return render(request, 'my_files.html', {'papers': papers})
+    return render(request, 'my_downloads.html', {
+        'downloads': page_obj,
+        'show_all': full,
+        'full_history': full_history_enabled(),
+    })
 
 # ==========================
 # ❌ Delete Paper (Admin only)
@@ -343,13 +550,36 @@ def edit_paper(request, paper_id):
 # ==========================
 # 📂 My Files (User only)
 # ==========================
+def my_files_validator(request):
+    """The user's papers (count, newest upload, latest download shown on
+    the page) and the user's own download watermark, in one aggregate
+    query over their papers and the papers they downloaded
+    """
+    user = request.user
+    mine = Q(user=user)
+    summary = PastPaper.objects.filter(mine | Q(user_downloads__user=user)).aggregate(
+        count=Count('id', distinct=True, filter=mine),
+        latest=Max('uploaded_at', filter=mine),
+        downloaded=Max('user_downloads__downloaded_at', filter=mine),
+        watermark=Max('user_downloads__downloaded_at', filter=Q(user_downloads__user=user)),
+    )
+    parts = (
+        summary['count'], summary['latest'], summary['downloaded'], summary['watermark'],
+        caching.catalogue_version(), user_fingerprint(user),
+    )
+    # Edits don't change these dates, so the catalogue's last change counts too
+    last_modified = latest(
+        summary['latest'], summary['downloaded'], summary['watermark'], caching.catalogue_changed_at(),
+    )
+    return parts, last_modified
+
+
 @login_required
+@conditional_page(my_files_validator)
 def my_files(request):
     user_papers = PastPaper.objects.filter(user=request.user).order_by('-uploaded_at')
 
-    paginator = Paginator(user_papers, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, user_papers, 10, ['-uploaded_at'], per_user=True)
 
     return render(request, 'my_files.html', {
         'papers': page_obj
@@ -370,8 +600,8 @@ def settings_view(request):
 
 @login_required
 def account_manager(request):
-    # Get or create profile if it doesn't exist
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    # Loaded with the user by the auth backend; created here on first visit
+    profile = get_profile(request.user)
 
     # Check if user is in edit mode
     edit_mode = request.GET.get("edit") == "true"
@@ -380,8 +610,9 @@ def account_manager(request):
         user_form = UserForm(request.POST, instance=request.user)
         profile_form = ProfileForm(request.POST, request.FILES, instance=profile)
         if user_form.is_valid() and profile_form.is_valid():
-            user_form.save()
+            # Profile first: the User save then finds it unchanged
             profile_form.save()
+            user_form.save()
             return redirect("account_manager")  # Back to view mode
 
     else:
@@ -431,26 +662,32 @@ def set_theme(request):
 # ==========================
 # ℹ️ About Page
 # ==========================
-@login_required
-def about(request):
+@lru_cache(maxsize=1)
+def about_avatar():
+    """(profile_image_url, avatar_data_uri) for the about page; the image
+    is a static file, so this is worked out once per process
+    """
     profile_path = os.path.join(settings.BASE_DIR, 'papers', 'static', 'papers', 'images', 'profile.jpg')
 
     if os.path.exists(profile_path):
         # Use actual profile picture if exists
-        profile_image_url = f"papers/images/profile.jpg"
-        avatar_data_uri = None
-    else:
-        # Generate default SVG avatar with initials "DT"
-        initials = "DT"
-        svg = f'''
-        <svg xmlns="http://www.w3.org/2000/svg" width="150" height="150">
-            <rect width="100%" height="100%" fill="#3B82F6"/>
-            <text x="50%" y="55%" font-size="60" fill="white" font-family="Arial" text-anchor="middle" dominant-baseline="middle">{initials}</text>
-        </svg>
-        '''
-        svg_base64 = base64.b64encode(svg.encode("utf-8")).decode("utf-8")
-        avatar_data_uri = f"data:image/svg+xml;base64,{svg_base64}"
-        profile_image_url = None
+        return "papers/images/profile.jpg", None
+
+    # Generate default SVG avatar with initials "DT"
+    initials = "DT"
+    svg = f'''
+    <svg xmlns="http://www.w3.org/2000/svg" width="150" height="150">
+        <rect width="100%" height="100%" fill="#3B82F6"/>
+        <text x="50%" y="55%" font-size="60" fill="white" font-family="Arial" text-anchor="middle" dominant-baseline="middle">{initials}</text>
+    </svg>
+    '''
+    svg_base64 = base64.b64encode(svg.encode("utf-8")).decode("utf-8")
+    return None, f"data:image/svg+xml;base64,{svg_base64}"
+
+
+@login_required
+def about(request):
+    profile_image_url, avatar_data_uri = about_avatar()
 
     return render(request, 'about.html', {
         'profile_image_url': profile_image_url,
@@ -58,7 +58,7 @@ ROOT_URLCONF = 'pastpapers_project.urls'
 # settings.py
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'papers.perf.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -138,9 +138,10 @@ LOGIN_URL = '/login/'  # Redirect to login
 LOGIN_REDIRECT_URL = '/home/'  # Redirect after login
 
 
+# Username or email, in one query; it extends ModelBackend, so listing
+# that as well would only run a failed login twice.
 AUTHENTICATION_BACKENDS = [
     'papers.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
 
@@ -168,6 +169,7 @@ LOCALE_PATHS = [
 
 # Middleware - Add LocaleMiddleware (ORDER MATTERS!)
 MIDDLEWARE = [
+    'papers.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # ADD THIS LINE
@@ -178,3 +180,148 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+
+# Full-text search backend for past papers: 'auto' picks SQLite FTS5 or
+# PostgreSQL tsvector from the database vendor, 'basic' uses icontains.
+PAPERS_SEARCH_BACKEND = 'auto'
+
+# Download counters are buffered in memory and flushed in batches.
+# Seconds between flushes (0 writes through on every download).
+PAPERS_DOWNLOAD_FLUSH_INTERVAL = 5.0
+# Flush early once this many downloads are pending
+PAPERS_DOWNLOAD_MAX_PENDING = 1000
+
+# How download_paper sends files: 'django' (FileResponse with Range/ETag
+# support), 'nginx' (X-Accel-Redirect) or 'sendfile' (X-Sendfile).
+PAPERS_FILE_DELIVERY = 'django'
+# Internal nginx location mapped onto MEDIA_ROOT, e.g.
+#   location /protected-media/ { internal; alias /path/to/media/; }
+PAPERS_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Threads used to write uploaded files to storage during bulk ingestion
+PAPERS_INGEST_WORKERS = 4
+
+# Queue uploads for `manage.py run_upload_worker` instead of processing
+# them inside the request. Only enable this with a worker running.
+PAPERS_BACKGROUND_UPLOADS = False
+# Seconds before a running job is considered abandoned and requeued
+PAPERS_JOB_TIMEOUT = 600
+PAPERS_JOB_MAX_ATTEMPTS = 3
+
+# Cache used for the dashboard lists. Swap the backend for a shared one
+# when running several workers, e.g.
+#   'django.core.cache.backends.filebased.FileBasedCache' with LOCATION '/var/tmp/pastpapers_cache'
+#   'django.core.cache.backends.db.DatabaseCache' with LOCATION 'papers_cache' (run createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pastpapers',
+    }
+}
+PAPERS_CACHE_ALIAS = 'default'
+# Seconds the cached "Recently Uploaded" and "Most Downloaded" lists live.
+# Both are also invalidated when papers change; the popular list is
+# refreshed after every download counter flush.
+PAPERS_RECENT_CACHE_TIMEOUT = 3600
+PAPERS_POPULAR_CACHE_TIMEOUT = 300
+
+# Seconds facet counts for a given search stay cached (they are also
+# dropped whenever a paper is added, edited or removed)
+PAPERS_FACET_CACHE_TIMEOUT = 60
+
+# Page listings with opaque cursors (WHERE on the sort keys) instead of
+# page numbers (COUNT + OFFSET). Totals are cached for the given seconds.
+PAPERS_CURSOR_PAGINATION = False
+PAPERS_COUNT_CACHE_TIMEOUT = 300
+
+# Every download is logged to DownloadEvent. 'latest' shows users only
+# their most recent download of each paper and lets rollup_downloads
+# prune old events; 'full' keeps them all for the complete history.
+PAPERS_DOWNLOAD_HISTORY = 'latest'
+
+# Download events are buffered in memory and written in batches, like
+# the counters above (seconds; 0 writes through, None means manual).
+PAPERS_EVENT_FLUSH_INTERVAL = 5.0
+PAPERS_EVENT_MAX_PENDING = 1000
+
+# Days of raw events kept once rolled up (with 'latest' history), and
+# the window for the dashboard's popular list (None = all-time counts).
+PAPERS_DOWNLOAD_EVENT_RETENTION_DAYS = 30
+PAPERS_POPULAR_WINDOW_DAYS = None
+
+# rollup_downloads only counts events downloaded at least this many
+# seconds ago, so a flush still committing (with lower ids) isn't
+# skipped. Keep it well above PAPERS_EVENT_FLUSH_INTERVAL.
+PAPERS_ROLLUP_LAG_SECONDS = 300
+
+# Text extracted from uploaded PDFs is searchable. 'async' extracts in a
+# pool of PAPERS_EXTRACT_WORKERS spawned processes after each upload,
+# 'sync' in the request itself, 'off' not at all. Install pypdf for the
+# best results; without it only simple text-based PDFs are read.
+PAPERS_TEXT_EXTRACTION = 'async'
+PAPERS_EXTRACT_WORKERS = 2
+PAPERS_TEXT_MAX_CHARS = 200000
+
+# First-page thumbnails, rendered once per file content under
+# MEDIA_ROOT/PAPERS_THUMBNAIL_DIR and evicted least-recently-used first
+# past PAPERS_THUMBNAIL_CACHE_BYTES. The renderer is PyMuPDF or poppler's
+# pdftoppm when available ('auto'), else a text card drawn with Pillow.
+PAPERS_THUMBNAIL_DIR = 'thumbnails'
+PAPERS_THUMBNAIL_SIZE = (180, 240)
+PAPERS_THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+PAPERS_THUMBNAIL_RENDERER = 'auto'
+
+# Paper files are stored once per unique content under media/blobs/,
+# named by SHA-256 and shared between rows. Unreferenced blobs are
+# removed by `manage.py gc_blobs` after this many seconds unused.
+PAPERS_CONTENT_ADDRESSED_STORAGE = True
+PAPERS_BLOB_GC_GRACE_SECONDS = 3600
+
+# Chunked, resumable uploads (upload/chunked/ API): largest chunk and
+# file accepted, and hours before an unfinished upload is dropped by
+# `manage.py gc_blobs`.
+PAPERS_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+PAPERS_MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+PAPERS_UPLOAD_EXPIRY_HOURS = 24
+
+# Request instrumentation (papers.perf.PerformanceMiddleware): wall, SQL
+# and template time per request, kept for the last PAPERS_PERF_HISTORY
+# requests at /metrics/performance/ and appended as JSON lines to
+# PAPERS_PERF_LOG_FILE if set. Server-Timing headers show the same
+# numbers in the browser's network panel.
+PAPERS_PERF_INSTRUMENTATION = True
+PAPERS_PERF_HISTORY = 1000
+PAPERS_PERF_LOG_FILE = None
+PAPERS_SERVER_TIMING = DEBUG
+
+# Most queries a view may run, by URL name (views can also declare one
+# with @query_budget). Going over is logged, or raises when strict.
+PAPERS_QUERY_BUDGETS = {
+    'admin:papers_pastpaper_changelist': 10,
+}
+PAPERS_QUERY_BUDGET_STRICT = False
+
+# Seconds a login for an unknown username/email is remembered as such,
+# so repeated attempts skip the lookup (the password is still hashed).
+PAPERS_LOGIN_MISS_CACHE_SECONDS = 60
+
+# Serve home, view_papers, download_paper and set_theme with the async
+# views in papers/async_views.py. Turn on when running under ASGI
+# (e.g. `uvicorn pastpapers_project.asgi:application`); under WSGI each
+# async view would need an event loop of its own.
+PAPERS_ASYNC_VIEWS = False
+
+# Rendered-page cache for anonymous visitors (papers.pagecache.cached_page
+# on the landing page and view_papers), keyed on path, query string,
+# language and theme. Any catalogue change invalidates every page; a page
+# older than the timeout is re-rendered by one request while the others
+# get the stale copy for up to PAPERS_PAGE_CACHE_STALE more seconds.
+PAPERS_PAGE_CACHE = True
+PAPERS_PAGE_CACHE_TIMEOUT = 300
+PAPERS_PAGE_CACHE_STALE = 60
+
+# Conditional GET (papers.conditional.conditional_page) on view_papers,
+# home and my_files: pages carry a weak ETag and Last-Modified computed
+# from one aggregate query, and an unchanged page is answered with
+# 304 Not Modified without rendering it.
+PAPERS_CONDITIONAL_GET = True
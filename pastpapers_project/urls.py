@@ -9,12 +9,13 @@ from django.conf.urls.i18n import i18n_patterns
 from django.views.i18n import set_language
 from papers import views as papers_views  # Import your papers app views
 from papers import views
+from papers.urls import listing
 # Non-internationalized URLs (no language prefix needed)
 urlpatterns = [
     # Language switching endpoint
     path('set-language/', set_language, name='set_language'),
     # Theme switching endpoint
-    path('set-theme/', papers_views.set_theme, name='set_theme'),
+    path('set-theme/', listing.set_theme, name='set_theme'),
 ]
 
 # Internationalized URLs (will have language prefixes like /en/, /sw/, /fr/)